@@ -0,0 +1,111 @@
+""" Benchmark of the TCP stream framing.
+
+Compare the previous reassembly loop (bytes concatenation) with the
+SMFramer, on a stream of small packets received in 8192 bytes chunks.
+
+Use::
+
+    python benchmarks/bench_framer.py
+"""
+
+import random
+import timeit
+
+from smserver.smutils import smframer
+
+NUMBER = 20
+CHUNK_SIZE = 8192
+
+
+def build_stream(nb_packets=20000, seed=42):
+    """ Stream of packets with a payload between 1 and 40 bytes """
+
+    rand = random.Random(seed)
+    packets = []
+    for _ in range(nb_packets):
+        payload = bytes(rand.randrange(256) for _ in range(rand.randrange(1, 40)))
+        packets.append(len(payload).to_bytes(4, byteorder="big") + payload)
+
+    return b"".join(packets), nb_packets
+
+
+def chunks(stream):
+    """ Split the stream like a socket would """
+
+    return [stream[i:i + CHUNK_SIZE] for i in range(0, len(stream), CHUNK_SIZE)]
+
+
+def legacy_framing(datas):
+    """ Previous reassembly loop (without the drop of the short chunks) """
+
+    frames = []
+    full_data = b""
+    size = None
+    data_left = b""
+    datas = iter(datas)
+
+    while True:
+        if data_left:
+            data = data_left
+            data_left = b""
+        else:
+            data = next(datas, b"")
+
+        if data == b"":
+            break
+
+        if not size:
+            if len(data) < 5:
+                data_left = data + next(datas, b"")
+                continue
+
+            full_data = data[:4]
+            data = data[4:]
+            size = int.from_bytes(full_data[:4], byteorder='big')
+
+        if len(data) < size - len(full_data) + 4:
+            full_data += data
+            continue
+
+        payload_size = size - len(full_data) + 4
+        full_data += data[:payload_size]
+
+        frames.append(full_data)
+
+        data_left = data[payload_size:]
+        full_data = b""
+        size = None
+
+    return frames
+
+
+def framer_framing(datas):
+    """ Framing with the SMFramer """
+
+    framer = smframer.SMFramer()
+    frames = []
+    for data in datas:
+        frames.extend(framer.feed(data))
+
+    return frames
+
+
+def main():
+    """ Run the benchmark """
+
+    stream, nb_packets = build_stream()
+    datas = chunks(stream)
+
+    assert [bytes(frame) for frame in framer_framing(datas)] == legacy_framing(datas)
+
+    for name, func in (("legacy", legacy_framing), ("SMFramer", framer_framing)):
+        duration = timeit.timeit(lambda: func(datas), number=NUMBER)
+        print("%-10s %8.0f packets/s   %6.1f MB/s" % (
+            name,
+            nb_packets * NUMBER / duration,
+            len(stream) * NUMBER / duration / 1e6,
+        ))
+
+
+if __name__ == "__main__":
+    main()
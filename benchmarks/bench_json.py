@@ -0,0 +1,117 @@
+""" Benchmark of the JSON packets encoding/decoding.
+
+Compare the previous path (the JSON is parsed twice, once to find the command
+and once to decode the packet, and the dict is rebuilt from the payload
+option) with the current one, for each JSON library installed.
+
+Use::
+
+    python benchmarks/bench_json.py
+"""
+
+import json
+import timeit
+
+from smserver.smutils.smpacket import smcommand
+from smserver.smutils.smpacket import smencoder
+from smserver.smutils.smpacket import smpacket
+
+NUMBER = 20000
+
+PACKETS = [
+    smpacket.SMPacket.new(
+        smcommand.SMServerCommand.NSCCM,
+        message="Hello world!",
+    ),
+    smpacket.SMPacket.new(
+        smcommand.SMClientCommand.NSCGSU,
+        player_id=0,
+        step_id=1,
+        grade=3,
+        score=1400,
+        combo=1400,
+        health=3,
+        offset=40000,
+    ),
+    smpacket.SMPacket.new(
+        smcommand.SMServerCommand.NSCGSU,
+        section=0,
+        nb_players=3,
+        options=[1, 2, 3],
+    ),
+]
+
+
+def legacy_encode(packet):
+    """ Encode the packet like before: walk the payload option on each call """
+
+    data = {"_command": packet.command.value}
+    for size, name, _opt in packet._payload: #pylint: disable=protected-access
+        default = 0 if isinstance(size.value, int) else size.value.DEFAULT
+        data[name] = packet.opts.get(name, default)
+
+    return json.dumps(data)
+
+
+def legacy_decode(data):
+    """ Decode the packet like before: the data is parsed twice """
+
+    opts = json.loads(data)
+    command = smcommand.SMCommand.get(opts.get("_command", -1))
+    cls = smpacket.SMPacket.get_class(command)
+
+    opts = json.loads(data)
+    values = {}
+    for size, name, _opt in cls._payload: #pylint: disable=protected-access
+        default = 0 if isinstance(size.value, int) else size.value.DEFAULT
+        values[name] = opts.get(name, default)
+
+    return cls(**values)
+
+
+def bench(name, encode, decode):
+    """ Time the encoding and the decoding of all the packets """
+
+    datas = [packet.json for packet in PACKETS]
+
+    encode_time = timeit.timeit(
+        lambda: [encode(packet) for packet in PACKETS],
+        number=NUMBER
+    )
+    decode_time = timeit.timeit(
+        lambda: [decode(data) for data in datas],
+        number=NUMBER
+    )
+
+    nb_packets = NUMBER * len(PACKETS)
+    print("%-16s encode: %6.2f us/packet   decode: %6.2f us/packet" % (
+        name,
+        encode_time / nb_packets * 1e6,
+        decode_time / nb_packets * 1e6,
+    ))
+
+
+def main():
+    """ Run the benchmark for each JSON library installed """
+
+    smencoder.JSONBackend.use("json")
+    bench("legacy", legacy_encode, legacy_decode)
+
+    for backend in smencoder.JSONBackend.BACKENDS:
+        try:
+            smencoder.JSONBackend.use(backend)
+        except ImportError:
+            print("%-16s not installed" % backend)
+            continue
+
+        bench(
+            backend,
+            lambda packet: packet.json,
+            lambda data: smpacket.SMPacket.from_("json", data),
+        )
+
+    smencoder.JSONBackend.use("json")
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,7 @@ class ChatOP(ChatPlugin):
             return ["Not authorize to op %s" % user.fullname_colored(connection.room_id)]
 
         user.set_level(connection.room_id, 5)
+        resource.serv.connection_cache.invalidate(user.connection_token)
         resource.send("%s give operator right to %s" % (
             models.User.colored_users_repr(connection.active_users),
             user.fullname_colored(connection.room_id)
@@ -49,6 +50,7 @@ class ChatOwner(ChatPlugin):
             return ["Not authorize to owner %s" % user.fullname_colored(connection.room_id)]
 
         user.set_level(connection.room_id, 10)
+        resource.serv.connection_cache.invalidate(user.connection_token)
         resource.send("%s give owner right to %s" % (
             models.User.colored_users_repr(connection.active_users),
             user.fullname_colored(connection.room_id)
@@ -74,6 +76,7 @@ class ChatVoice(ChatPlugin):
             return ["Not authorize to voice %s" % user.fullname_colored(connection.room_id)]
 
         user.set_level(connection.room_id, 1)
+        resource.serv.connection_cache.invalidate(user.connection_token)
         resource.send("%s give voice right to %s" % (
             models.User.colored_users_repr(connection.active_users),
             user.fullname_colored(connection.room_id)
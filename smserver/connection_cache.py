@@ -0,0 +1,149 @@
+""" Connection cache module.
+
+Per-process cache of the state of the connections stored in the database:
+the room, the online users and their levels. It's read on each packet to
+check the login and the permissions without querying the database.
+
+The cache is write-through: the code which change a connection in the
+database (login, enter or leave a room, disconnection) update the cached
+entry in the same time.
+"""
+
+from sqlalchemy.orm import object_session
+
+from smserver import models
+
+
+class CachedConnection(object):
+    """ State of a connection, as stored in the database
+
+    :Example:
+
+    >>> cached = CachedConnection(1, room_id=3, users=((4, 0),))
+    >>> cached.logged_in, cached.user_ids
+    (True, (4,))
+    >>> CachedConnection(2).logged_in
+    False
+    """
+
+    __slots__ = ("id", "room_id", "users", "levels")
+
+    def __init__(self, id_, room_id=None, users=()):
+        self.id = id_
+        self.room_id = room_id
+
+        # (user id, position) of the online users
+        self.users = users
+
+        # room id -> max level of the online users, filled on demand
+        self.levels = {}
+
+    @classmethod
+    def from_model(cls, connection):
+        """ Build the cached state of a Connection model """
+
+        return cls(
+            connection.id,
+            room_id=connection.room_id,
+            users=tuple((user.id, user.pos) for user in connection.active_users),
+        )
+
+    @property
+    def logged_in(self):
+        """ True if at least one user is online on this connection """
+
+        return bool(self.users)
+
+    @property
+    def user_ids(self):
+        """ IDs of the online users """
+
+        return tuple(user_id for user_id, _ in self.users)
+
+
+class ConnectionCache(object):
+    """ Cache of the connections, by token.
+
+    Only the connections handled by this process should be stored: the
+    other processes are not notified of the changes. The connections without
+    online user are not stored, they are loaded until a user log in.
+    """
+
+    def __init__(self):
+        self._connections = {}
+
+    def __contains__(self, token):
+        return token in self._connections
+
+    def get(self, token, session, store=True):
+        """
+            Return the cached state of the connection (None if the connection
+            doesn't exist). On a cache miss the connection is loaded in the
+            given session.
+
+            :param bool store: Store the state loaded on a cache miss (if a
+                user is logged in).
+        """
+
+        cached = self._connections.get(token)
+        if cached is not None:
+            return cached
+
+        connection = models.Connection.by_token(token, session)
+        if not connection:
+            return None
+
+        cached = CachedConnection.from_model(connection)
+        if store and cached.logged_in:
+            self._connections[token] = cached
+
+        return cached
+
+    def connection(self, token, session, store=True):
+        """
+            Return the Connection model of the token.
+
+            The connection is fetched by primary key, which doesn't query
+            the database if the session has already loaded it.
+        """
+
+        cached = self.get(token, session, store)
+        if cached is None:
+            return None
+
+        return session.query(models.Connection).get(cached.id)
+
+    def level(self, token, session, room_id=None):
+        """ The maximum level of the online users of the connection """
+
+        cached = self.get(token, session)
+        if cached is None:
+            return 0
+
+        level = cached.levels.get(room_id)
+        if level is None:
+            level = self.connection(token, session).level(room_id)
+            cached.levels[room_id] = level
+
+        return level
+
+    def update(self, connection):
+        """
+            Write the new state of a connection model, if the connection is
+            cached.
+        """
+
+        if connection.token not in self._connections:
+            return
+
+        # Write the pending changes (new room, new users) to get their IDs
+        session = object_session(connection)
+        if session:
+            session.flush()
+
+        self._connections[connection.token] = CachedConnection.from_model(connection)
+
+    def invalidate(self, token):
+        """ Remove the connection from the cache """
+
+        self._connections.pop(token, None)
@@ -1,17 +1,14 @@
 """ Discovery controller """
 
 from smserver.smutils.smpacket import smcommand
-from smserver.smutils.smpacket import smpacket
 from smserver.stepmania_controller import StepmaniaController
-from smserver import models
 
 class DiscoveryController(StepmaniaController):
     command = smcommand.SMClientCommand.NSCFormatted
     require_login = False
+    need_session = False
 
     def handle(self):
-        self.send(smpacket.SMPacketServerNSCFormatted(
-            server_port=self.server.config.server["port"],
-            server_name=self.server.config.server["name"],
-            nb_players=models.User.nb_onlines(self.session)
-        ))
+        # The cached packet is sent without session, one is only opened to
+        # rebuild it
+        self.send(self.server.discovery_packet())
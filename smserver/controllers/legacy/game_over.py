@@ -2,6 +2,7 @@
 
 import datetime
 
+from smserver.smutils import smgamestate
 from smserver.smutils.smpacket import smcommand
 from smserver.stepmania_controller import StepmaniaController
 from smserver import models
@@ -16,14 +17,15 @@ class GameOverController(StepmaniaController):
         if not self.room:
             return
 
-        if "start_at" not in self.conn.songstats:
+        songstats = self.conn.songstats
+        if songstats.start_at is None:
             return
 
-        song_duration = datetime.datetime.now() - self.conn.songstats["start_at"]
+        song_duration = datetime.datetime.now() - songstats.start_at
 
         for user in self.active_users:
             with self.conn.mutex:
-                songstat = self.create_stats(user, self.conn.songstats[user.pos], song_duration)
+                songstat = self.create_stats(user, songstats[user.pos], song_duration)
 
             xp = songstat.calc_xp(self.server.config.score.get("xpWeight"))
             user.xp += xp
@@ -39,42 +41,32 @@ class GameOverController(StepmaniaController):
 
         with self.conn.mutex:
             self.conn.ingame = False
-            self.conn.songstats = {0: {"data": []}, 1: {"data": []}}
+            self.conn.songstats = smgamestate.GameState()
             self.conn.song = None
 
-    def create_stats(self, user, raw_stats, duration):
+    def create_stats(self, user, player, duration):
         songstat = models.SongStat(
             song_id=self.room.active_song.id,
             user_id=user.id,
             game_id=self.room.last_game.id,
             duration=duration.seconds,
             max_combo=0,
-            feet=raw_stats["feet"],
-            difficulty=raw_stats["difficulty"],
-            options=raw_stats["options"],
+            feet=player.feet,
+            difficulty=player.difficulty,
+            options=player.options,
         )
 
-        if raw_stats["data"]:
-            songstat.grade = raw_stats["data"][-1]["grade"]
-            songstat.score = raw_stats["data"][-1]["score"]
+        steps = player.data
+        if steps:
+            songstat.grade = steps.last_grade
+            songstat.score = steps.last_score
 
-        for stepid in models.SongStat.stepid.values():
-            setattr(songstat, stepid, 0)
-
-        for value in raw_stats["data"]:
-            if value["combo"] > songstat.max_combo:
-                songstat.max_combo = value["combo"]
-
-            if value["stepid"] not in models.SongStat.stepid:
-                continue
-
-            setattr(songstat,
-                    models.SongStat.stepid[value["stepid"]],
-                    getattr(songstat, models.SongStat.stepid[value["stepid"]]) + 1
-                   )
+        songstat.max_combo = steps.max_combo
+        for stepid, name in models.SongStat.stepid.items():
+            setattr(songstat, name, steps.count(stepid))
 
         songstat.percentage = songstat.calc_percentage(self.server.config.score.get("percentWeight"))
-        songstat.raw_stats = models.SongStat.encode_stats(raw_stats["data"])
+        songstat.raw_stats = models.SongStat.encode_stats_rows(steps.rows())
 
         self.session.add(songstat)
         self.session.commit()
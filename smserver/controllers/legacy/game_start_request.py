@@ -2,6 +2,7 @@
 
 import datetime
 
+from smserver.smutils import smgamestate
 from smserver.smutils.smpacket import smpacket
 from smserver.smutils.smpacket import smcommand
 from smserver.stepmania_controller import StepmaniaController
@@ -30,36 +31,44 @@ class StartGameRequestController(StepmaniaController):
             self.session)
 
         with self.conn.mutex:
-            self.conn.song_id = song.id
             self.conn.songs[song.id] = True
 
-            self.conn.songstats = {
-                0: {"data": [],
-                    "feet": self.packet["first_player_feet"],
-                    "difficulty": self.packet["first_player_difficulty"],
-                    "options": self.packet["first_player_options"],
-                    "best_score": song.best_score_value(self.packet["first_player_feet"])
-                   },
-                1: {"data": [],
-                    "feet": self.packet["second_player_feet"],
-                    "difficulty": self.packet["second_player_difficulty"],
-                    "options": self.packet["second_player_options"],
-                    "best_score": song.best_score_value(self.packet["second_player_feet"])
-                   },
-                "start_at": datetime.datetime.now(),
-                "options": self.packet["song_options"],
-                "course_title": self.packet["course_title"]
-                }
-
+            self.conn.songstats = smgamestate.GameState(
+                start_at=datetime.datetime.now(),
+                song_id=song.id,
+                options=self.packet["song_options"],
+                course_title=self.packet["course_title"],
+                players=(
+                    smgamestate.PlayerGameState(
+                        feet=self.packet["first_player_feet"],
+                        difficulty=self.packet["first_player_difficulty"],
+                        options=self.packet["first_player_options"],
+                        best_score=song.best_score_value(self.packet["first_player_feet"]),
+                    ),
+                    smgamestate.PlayerGameState(
+                        feet=self.packet["second_player_feet"],
+                        difficulty=self.packet["second_player_difficulty"],
+                        options=self.packet["second_player_options"],
+                        best_score=song.best_score_value(self.packet["second_player_feet"]),
+                    ),
+                ),
+            )
 
             self.conn.wait_start = True
 
+        self.server.publish_room_state(self.room.id, self.session)
+
         for player in self.server.player_connections(self.room.id):
             with player.mutex:
                 if player.wait_start is False:
                     self.log.debug("Room %s waiting for other player to start the game" % self.room.name)
                     return
 
+        # The players connected to the other worker processes
+        if not self.server.room_states.everybody_waiting(self.room.id):
+            self.log.debug("Room %s waiting for other player to start the game" % self.room.name)
+            return
+
         self.launch_song(self.room, song, self.server)
 
     @staticmethod
@@ -71,7 +80,25 @@ class StartGameRequestController(StepmaniaController):
 
         for player in server.ingame_connections(room.id):
             with player.mutex:
-                player.songstats["start_at"] = datetime.datetime.now()
+                player.songstats.start_at = datetime.datetime.now()
+                player.wait_start = False
+                player.ingame = True
+
+            player.send(smpacket.SMPacketServerNSCGSR())
+
+        server.publish_room_start(room.id)
+
+    @staticmethod
+    def start_players(room_id, server):
+        """ Start the song for the players waiting in the room, when another
+        worker process has launched it """
+
+        for player in server.ingame_connections(room_id):
+            with player.mutex:
+                if not player.wait_start:
+                    continue
+
+                player.songstats.start_at = datetime.datetime.now()
                 player.wait_start = False
                 player.ingame = True
 
@@ -11,42 +11,56 @@ from smserver.stepmania_controller import StepmaniaController
 class GameStatusUpdateController(StepmaniaController):
     command = smcommand.SMClientCommand.NSCGSU
     require_login = False
+    need_session = False
 
     def handle(self):
         if not self.conn.room:
             return
 
-        if "start_at" not in self.conn.songstats:
+        songstats = self.conn.songstats
+        if songstats.start_at is None:
             return
 
-        stats = {"time": datetime.datetime.now() - self.conn.songstats.get("start_at"),
-                 "stepid": self.packet["step_id"],
-                 "grade": self.packet["grade"],
-                 "score": self.packet["score"],
-                 "combo": self.packet["combo"],
-                 "health": self.packet["health"],
-                 "offset": self.packet["offset"]
-                }
+        player = songstats[self.packet["player_id"]]
+
+        elapsed = datetime.datetime.now() - songstats.start_at
+        score = self.packet["score"]
 
         with self.conn.mutex:
-            best_score = self.conn.songstats[self.packet["player_id"]]["best_score"]
+            best_score = player.best_score
+            beat_best_score = best_score and score and score > best_score
+            if beat_best_score:
+                player.best_score = None
 
-        if best_score and stats["score"] > best_score:
-            with self.conn.mutex:
-                self.conn.songstats[self.packet["player_id"]]["best_score"] = None
-            self.beat_best_score()
+            player.data.append(
+                stepid=self.packet["step_id"],
+                grade=self.packet["grade"],
+                score=score,
+                combo=self.packet["combo"],
+                health=self.packet["health"],
+                offset=self.packet["offset"],
+                time=int(elapsed.total_seconds() * 1000),
+            )
 
-        with self.conn.mutex:
-            self.conn.songstats[self.packet["player_id"]]["data"].append(stats)
+        if beat_best_score:
+            self.beat_best_score(player)
 
-    def beat_best_score(self):
-        user = [user for user in self.users if user.pos == self.packet["player_id"]][0]
+    def beat_best_score(self, player):
+        # The controller run without session, open one only for this rare case
+        with self.server.db.session_scope() as session:
+            connection = self.server.connection_cache.connection(self.conn.token, session)
+            # The client has been disconnected in the meantime
+            if not connection:
+                return
+
+            users = [user for user in connection.users if user.pos == self.packet["player_id"]]
+            if not users:
+                return
 
-        with self.conn.mutex:
             message = "%s just beat the best score on %s(%s)" % (
-                user.name,
-                models.SongStat.DIFFICULTIES.get(self.conn.songstats[self.packet["player_id"]]["difficulty"]),
-                self.conn.songstats[self.packet["player_id"]]["feet"]
+                users[0].name,
+                models.SongStat.DIFFICULTIES.get(player.difficulty),
+                player.feet
             )
 
         self.sendroom(self.conn.room, smpacket.SMPacketServerNSCSU(message=message))
@@ -7,6 +7,7 @@ from smserver.stepmania_controller import StepmaniaController
 class PINGRController(StepmaniaController):
     command = smcommand.SMClientCommand.NSCPingR
     require_login = False
+    need_session = False
 
     def handle(self):
         """ Handle a new PINGR packet. Do nothing for the moment """
@@ -19,6 +19,7 @@ class UserProfilController(StepmaniaController):
 
             self.reconnect_user(user)
 
+        self.server.connection_cache.update(self.connection)
         self.server.send_sd_running_status()
 
         if self.conn.room:
@@ -29,7 +30,7 @@ class UserProfilController(StepmaniaController):
             return
 
         user.online = True
-        user.room_id = self.room
+        user.room_id = self.room_id
         self.log.info("User %s connected" % user.name)
 
     def disconnect_user(self, user):
@@ -3,15 +3,95 @@
 To get the current database use `get_current_db`
 """
 
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack
 from sqlalchemy import create_engine
+from sqlalchemy import event
 from sqlalchemy.engine.url import URL
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
 
 from smserver.models import schema
 
 
+class UnitOfWorkSession(Session):
+    """
+        Session which can defer the commits: inside a unit of work, commit()
+        only flush the changes. They are committed once, at the end of the
+        unit of work.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._unit_of_work = 0
+
+    @property
+    def in_unit_of_work(self):
+        """ True if the commits are deferred """
+
+        return self._unit_of_work > 0
+
+    @contextmanager
+    def unit_of_work(self):
+        """ Turn the commits into flushes until the end of the block """
+
+        self._unit_of_work += 1
+        try:
+            yield self
+        finally:
+            self._unit_of_work -= 1
+
+    def commit(self):
+        if self._unit_of_work:
+            self.flush()
+            return
+
+        super().commit()
+
+    @contextmanager
+    def savepoint(self):
+        """
+            Isolate the block in a SAVEPOINT, inside a unit of work: if the
+            block fails, only its changes are rolled back. Outside of a unit of
+            work the block is run as is.
+        """
+
+        if not self._unit_of_work:
+            yield self
+            return
+
+        transaction = self.begin_nested()
+        try:
+            yield self
+        except:
+            if transaction.is_active:
+                transaction.rollback()
+            raise
+
+        # The block may have already rolled back its savepoint
+        if transaction.is_active:
+            transaction.commit()
+
+
+def _enable_sqlite_savepoints(engine):
+    """
+        pysqlite starts the transactions itself, only before the DML
+        statements, and commits before the other ones (SAVEPOINT included
+        with python < 3.6). Let SQLAlchemy emit the BEGIN instead, as
+        documented by its SQLite dialect, so UnitOfWorkSession.savepoint
+        works.
+    """
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, _connection_record):
+        # Disable the transaction handling of pysqlite
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(connection):
+        connection.execute("BEGIN")
+
+
 class DataBase(object):
     """
         The DataBase class hold information about a given database.
@@ -26,10 +106,12 @@ class DataBase(object):
         :param str host: Location of the database (localhost for local)
         :param int port: Port of the database
         :param str driver: Driver for communication with the database.
+        :param bool unit_of_work: The sessions are used in unit of work
+            (see UnitOfWorkSession), with SAVEPOINTs.
     """
 
     def __init__(self, type_="sqlite", database=None, user=None,
-                 password=None, host=None, port=None, driver=None):
+                 password=None, host=None, port=None, driver=None, unit_of_work=False):
         self._type = type_
         if not type_:
             self._type = "sqlite"
@@ -39,6 +121,7 @@ class DataBase(object):
         self._host = host
         self._port = port
         self._driver = driver
+        self._unit_of_work = unit_of_work
 
         self._engine = None
         self._session = None
@@ -52,6 +135,13 @@ class DataBase(object):
             return self._engine
 
         self._engine = create_engine(self._database_url)
+
+        # Only needed for the SAVEPOINTs: it keeps a transaction (and its
+        # SHARED lock) open from the first SELECT
+        if (self._unit_of_work and self._engine.dialect.name == "sqlite" and
+                self._engine.dialect.driver == "pysqlite"):
+            _enable_sqlite_savepoints(self._engine)
+
         return self._engine
 
     @property
@@ -61,22 +151,32 @@ class DataBase(object):
         if self._session:
             return self._session
 
-        self._session = scoped_session(sessionmaker(bind=self.engine))
+        self._session = scoped_session(sessionmaker(bind=self.engine, class_=UnitOfWorkSession))
         return self._session
 
     @contextmanager
-    def session_scope(self, session=None):
+    def session_scope(self, session=None, unit_of_work=False):
         """
             Provide a transactional scope around a series of operations.
+
+            With unit_of_work, the commits made inside the scope only flush
+            the session, and the changes are committed once at the end. A
+            scope opened inside a unit of work (the session of the thread is
+            shared) is part of it.
         """
 
         close_connection = False
         if not session:
-            close_connection = True
             session = self.session() #pylint: disable=not-callable
+            close_connection = not session.in_unit_of_work
 
         try:
-            yield session
+            with ExitStack() as stack:
+                if unit_of_work:
+                    stack.enter_context(session.unit_of_work())
+
+                yield session
+
             session.commit()
         except:
             session.rollback()
@@ -146,7 +246,7 @@ class _Database:
 
 
 def setup_db(type_="sqlite", database=None, user=None, password=None,
-             host=None, port=None, driver=None):
+             host=None, port=None, driver=None, unit_of_work=False):
     """ Initalize the database"""
 
     _Database.db = DataBase(
@@ -157,6 +257,7 @@ def setup_db(type_="sqlite", database=None, user=None, password=None,
         host=host,
         port=port,
         driver=driver,
+        unit_of_work=unit_of_work,
     )
 
     return _Database.db
@@ -8,6 +8,8 @@ class EventKind(enum.Enum):
     """ Type of message that can be send """
 
     chat_message = 1
+    packet = 2
+    room_state = 3
 
 
 class Event(object):
@@ -7,7 +7,7 @@ from threading import Thread
 
 from smserver import event
 from smserver import messaging
-from smserver.listener.workers import chat
+from smserver.listener.workers import chat, packet, room
 
 
 class Listener(Thread):
@@ -20,6 +20,8 @@ class Listener(Thread):
 
         self.dispatch = {
             event.EventKind.chat_message: chat.ChatWorker(server),
+            event.EventKind.packet: packet.PacketWorker(server),
+            event.EventKind.room_state: room.RoomStateWorker(server),
         }
 
     def run(self):
@@ -21,7 +21,14 @@ class ChatWorker(base.BaseWorker):
             self.server.log("Unknown message target for event" % data)
             return
 
-        connection = models.Connection.by_token(source, session) if source else None
+        connection = None
+        if source:
+            # Only the connections of this process are kept in the cache
+            connection = self.server.connection_cache.connection(
+                source, session,
+                store=self.server.find_connection(source) is not None
+            )
+
         if connection:
             message = "%s %s" % (
                 models.User.colored_users_repr(
@@ -51,7 +58,7 @@ class ChatWorker(base.BaseWorker):
             message=message
         )
 
-        self.server.sendconnection(token, packet)
+        self.server.sendconnection(token, packet, local=True)
 
     def send_message_room(self, message, room):
         """ Send a message to a room
@@ -69,4 +76,4 @@ class ChatWorker(base.BaseWorker):
         )
         packet["message"] = "#%s %s" % (with_color(room.name), message)
 
-        self.server.sendroom(room.id, packet)
+        self.server.sendroom(room.id, packet, local=True)
@@ -0,0 +1,38 @@
+""" Packet event worker module """
+
+from smserver.smutils.smpacket import smpacket
+from smserver.listener.workers import base
+
+class PacketWorker(base.BaseWorker):
+    """ Packet worker.
+
+        Send the packets published by the other worker processes to the
+        connections of this process.
+    """
+
+    def handle(self, data, token=None, *, session=None):
+        """ Handle a packet sent by another worker process """
+
+        if data.get("origin") == self.server.worker_id:
+            return
+
+        packet = smpacket.SMPacket.from_("json", data.get("packet", ""))
+        if not packet:
+            self.log.error("Invalid packet in event %s", data)
+            return
+
+        target = data.get("target")
+        value = data.get("value")
+
+        if target == "all":
+            self.server.sendall(packet, local=True)
+        elif target == "room":
+            self.server.sendroom(value, packet, local=True)
+        elif target == "ingame":
+            self.server.sendingame(value, packet, local=True)
+        elif target == "players":
+            self.server.sendplayers(value, packet, local=True)
+        elif target == "token":
+            self.server.sendconnection(value, packet, local=True)
+        else:
+            self.log.error("Unknown packet target %s", target)
@@ -0,0 +1,31 @@
+""" Room state event worker module """
+
+from smserver import room_state
+from smserver.listener.workers import base
+from smserver.controllers.legacy.game_start_request import StartGameRequestController
+
+class RoomStateWorker(base.BaseWorker):
+    """ Room state worker.
+
+        Keep the state of the rooms published by the other worker
+        processes, and start the song of the players of this process when
+        another worker launch it.
+    """
+
+    def handle(self, data, token=None, *, session=None):
+        """ Handle a room event published by another worker process """
+
+        origin = data.get("origin")
+        if origin == self.server.worker_id:
+            return
+
+        room_id = data.get("room_id")
+        action = data.get("action")
+
+        if action == "state":
+            state = room_state.WorkerRoomState.from_dict(data.get("state", {}))
+            self.server.room_states.update(origin, room_id, state)
+        elif action == "start":
+            StartGameRequestController.start_players(room_id, self.server)
+        else:
+            self.log.error("Unknown room action %s", action)
@@ -4,8 +4,14 @@ Us to send messages between process and thread
 """
 
 import abc
+import os
 import queue
+import select
+import selectors
+import socket
+import threading
 
+from smserver import logger
 from smserver import redis_database
 from smserver import event
 
@@ -154,6 +160,204 @@ class RedisHandler(MessageHandler):
 
         self._continue = False
 
+class UnixSocketHandler(MessageHandler):
+    """ Unix socket handler.
+
+    Used by the worker processes when redis is not available: the messages
+    are relayed to all the processes by a UnixSocketBroker. Each message is
+    an encoded event followed by a new line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._lock = threading.Lock()
+
+        self._continue = False
+
+    def send(self, message):
+        """ Send a message to the broker """
+
+        super().send(message)
+
+        data = message.encode().encode("utf-8") + b"\n"
+        with self._lock:
+            self._socket.sendall(data)
+
+    def listen(self):
+        """ Listen for message relayed by the broker """
+
+        self._continue = True
+        buffer = b""
+
+        while self._continue:
+            readable, _, _ = select.select([self._socket], [], [], 0.01)
+            if not readable:
+                continue
+
+            data = self._socket.recv(65536)
+            if not data:
+                break
+
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield event.Event.decode(line.decode("utf-8"))
+
+        self._socket.close()
+
+    def stop(self):
+        """ Stop the listener """
+
+        self._continue = False
+
+
+class UnixSocketBroker(threading.Thread):
+    """ Relay each message received on a unix socket to all the connected
+    processes (the sender included, like a redis channel).
+
+    The socket listen as soon as the broker is created, so the worker
+    processes can connect before the thread is started.
+
+    The sockets of the workers are non-blocking: the messages a worker
+    can't receive yet wait in its write buffer, so a slow worker never
+    blocks the relay to the others. A worker with more than ``max_buffer``
+    bytes waiting is disconnected.
+    """
+
+    log = logger.get_logger()
+
+    def __init__(self, path, max_buffer=64 * 1024 * 1024):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.path = path
+        self.max_buffer = max_buffer
+
+        if os.path.exists(path):
+            os.unlink(path)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(path)
+        self._socket.listen(128)
+        self._socket.setblocking(False)
+
+        self._selector = selectors.DefaultSelector()
+
+        # Incomplete message received, and data waiting to be sent, by worker
+        self._buffers = {}
+        self._outgoing = {}
+        self._continue = True
+
+    def run(self):
+        self._selector.register(self._socket, selectors.EVENT_READ)
+
+        while self._continue:
+            for key, mask in self._selector.select(timeout=0.1):
+                if key.fileobj is self._socket:
+                    self._accept()
+                    continue
+
+                if mask & selectors.EVENT_WRITE:
+                    self._write(key.fileobj)
+
+                if mask & selectors.EVENT_READ and key.fileobj in self._buffers:
+                    self._read(key.fileobj)
+
+        for client in list(self._buffers):
+            self._remove(client)
+
+        self._selector.close()
+        self._socket.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _accept(self):
+        try:
+            client, _ = self._socket.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+
+        client.setblocking(False)
+        self._buffers[client] = b""
+        self._outgoing[client] = bytearray()
+        self._selector.register(client, selectors.EVENT_READ)
+
+    def _read(self, client):
+        try:
+            data = client.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            self._remove(client)
+            return
+
+        # Only relay the complete messages
+        buffer = self._buffers[client] + data
+        end = buffer.rfind(b"\n") + 1
+        self._buffers[client] = buffer[end:]
+        if not end:
+            return
+
+        for other in list(self._outgoing):
+            self._relay(other, buffer[:end])
+
+    def _relay(self, client, data):
+        outgoing = self._outgoing[client]
+        was_empty = not outgoing
+
+        outgoing += data
+        if len(outgoing) > self.max_buffer:
+            self.log.error("A worker doesn't read its messages (%s bytes waiting), disconnect it",
+                           len(outgoing))
+            self._remove(client)
+            return
+
+        if was_empty:
+            self._write(client)
+
+    def _write(self, client):
+        outgoing = self._outgoing.get(client)
+        if outgoing is None:
+            return
+
+        try:
+            sent = client.send(outgoing)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self.log.error("Unable to relay the messages to a worker")
+            self._remove(client)
+            return
+
+        del outgoing[:sent]
+
+        events = selectors.EVENT_READ
+        if outgoing:
+            events |= selectors.EVENT_WRITE
+
+        if self._selector.get_key(client).events != events:
+            self._selector.modify(client, events)
+
+    def _remove(self, client):
+        self._buffers.pop(client, None)
+        self._outgoing.pop(client, None)
+        try:
+            self._selector.unregister(client)
+        except (KeyError, ValueError):
+            pass
+
+        client.close()
+
+    def stop(self):
+        """ Stop relaying the messages """
+
+        self._continue = False
+
 _MESSAGING = Messaging()
 
 def set_handler(handler):
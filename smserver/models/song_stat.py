@@ -1,6 +1,13 @@
 """ SongStat model module """
 
+import array
 import datetime
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from sqlalchemy import Column, Integer, DateTime, ForeignKey, Text, Float, LargeBinary
 
@@ -174,33 +181,180 @@ class SongStat(schema.Base):
 
     @staticmethod
     def encode_stats(raw_data):
-        binary = BinaryStats(nb_notes=len(raw_data), stats=[])
+        return BinaryStatsCodec.encode_rows(
+            (stats["grade"], stats["stepid"], stats["score"],
+             stats["combo"], stats["health"], stats["time"].seconds)
+            for stats in raw_data
+        )
 
-        for stats in raw_data:
-            binary["stats"].append({
-                "grade": stats["grade"],
-                "stepid": stats["stepid"],
-                "score": stats["score"],
-                "combo": stats["combo"],
-                "health": stats["health"],
-                "time": stats["time"].seconds
-            })
+    @staticmethod
+    def encode_stats_rows(rows):
+        """ Encode rows of (grade, stepid, score, combo, health, time in seconds) """
 
-        return binary.payload
+        return BinaryStatsCodec.encode_rows(rows)
 
     @staticmethod
     def decode_stats(binary):
-        return BinaryStats.from_payload(binary)["stats"]
+        return BinaryStatsCodec.decode(binary)
 
     @property
     def stats(self):
         return self.decode_stats(self.raw_stats)
 
+    @property
+    def stats_columns(self):
+        """ Stats of each note by column (see BinaryStatsCodec.decode_columns) """
+
+        return BinaryStatsCodec.decode_columns(self.raw_stats)
+
     @property
     def nb_notes(self):
         return sum(getattr(self, note, 0) for note in self.stepid.values())
 
 
+class BinaryStatsCodec(object):
+    """
+        Columnar codec for the raw stats of a song.
+
+        The payload is the number of notes (8 bytes) followed by a 13 bytes
+        record per note: grade (MSN) and stepid (LSN), score (4 bytes),
+        combo (2 bytes), health (2 bytes) and time in seconds (4 bytes).
+
+        It's the same format than the BinaryStats packet, without building a
+        dict per note through the generic packet machinery.
+    """
+
+    FIELDS = ("grade", "stepid", "score", "combo", "health", "time")
+
+    HEADER = struct.Struct(">Q")
+    RECORD = struct.Struct(">BIHHI")
+
+    DTYPE = [
+        ("grade_stepid", ">u1"),
+        ("score", ">u4"),
+        ("combo", ">u2"),
+        ("health", ">u2"),
+        ("time", ">u4"),
+    ]
+
+    _LIMITS = (2**32 - 1, 2**16 - 1, 2**16 - 1, 2**32 - 1)
+
+    @classmethod
+    def encode_rows(cls, rows):
+        """
+            Encode the given rows (grade, stepid, score, combo, health, time)
+
+            :Example:
+
+            >>> BinaryStatsCodec.encode_rows([(1, 8, 1500, 3, 40, 2)])
+            b'\\x00\\x00\\x00\\x00\\x00\\x00\\x00\\x01\\x18\\x00\\x00\\x05\\xdc\\x00\\x03\\x00(\\x00\\x00\\x00\\x02'
+        """
+
+        pack_nibbles = smencoder.NibbleCodec.pack
+        score_max, combo_max, health_max, time_max = cls._LIMITS
+
+        values = []
+        nb_notes = 0
+        for grade, stepid, score, combo, health, time in rows:
+            values.append(pack_nibbles(grade, stepid))
+            values.append(min(score or 0, score_max))
+            values.append(min(combo or 0, combo_max))
+            values.append(min(health or 0, health_max))
+            values.append(min(time or 0, time_max))
+            nb_notes += 1
+
+        return struct.pack(">Q" + "BIHHI" * nb_notes, nb_notes, *values)
+
+    @classmethod
+    def encode(cls, stats):
+        """ Encode a list of stats dict """
+
+        return cls.encode_rows(
+            tuple(stat.get(field) for field in cls.FIELDS)
+            for stat in stats
+        )
+
+    @classmethod
+    def nb_notes(cls, binary):
+        """ Number of complete notes stored in the binary """
+
+        if not binary or len(binary) < cls.HEADER.size:
+            return 0
+
+        nb_notes = cls.HEADER.unpack_from(binary)[0]
+        return min(nb_notes, (len(binary) - cls.HEADER.size) // cls.RECORD.size)
+
+    @classmethod
+    def iter_rows(cls, binary):
+        """ Iterate over the rows (grade, stepid, score, combo, health, time) """
+
+        nb_notes = cls.nb_notes(binary)
+        if not nb_notes:
+            return
+
+        start = cls.HEADER.size
+        view = memoryview(binary)[start:start + nb_notes * cls.RECORD.size]
+        for grade_stepid, score, combo, health, time in cls.RECORD.iter_unpack(view):
+            yield grade_stepid >> 4, grade_stepid & 0x0f, score, combo, health, time
+
+    @classmethod
+    def decode(cls, binary):
+        """
+            Decode the stats in a list of dict
+
+            :Example:
+
+            >>> BinaryStatsCodec.decode(BinaryStatsCodec.encode_rows([(1, 8, 1500, 3, 40, 2)]))
+            [{'grade': 1, 'stepid': 8, 'score': 1500, 'combo': 3, 'health': 40, 'time': 2}]
+        """
+
+        fields = cls.FIELDS
+        return [dict(zip(fields, row)) for row in cls.iter_rows(binary)]
+
+    @classmethod
+    def decode_columns(cls, binary, use_numpy=True):
+        """
+            Decode the stats by column.
+
+            Return a dict with a column for each field. The columns are NumPy
+            arrays (read directly from the binary) if NumPy is available,
+            ``array.array`` otherwise.
+
+            :Example:
+
+            >>> binary = BinaryStatsCodec.encode_rows([(1, 8, 1500, 3, 40, 2), (0, 7, 1600, 4, 41, 3)])
+            >>> columns = BinaryStatsCodec.decode_columns(binary, use_numpy=False)
+            >>> list(columns["score"])
+            [1500, 1600]
+            >>> list(columns["stepid"])
+            [8, 7]
+        """
+
+        nb_notes = cls.nb_notes(binary)
+
+        if numpy is not None and use_numpy:
+            records = numpy.frombuffer(
+                binary or b"", dtype=cls.DTYPE, count=nb_notes, offset=cls.HEADER.size if nb_notes else 0
+            )
+            grade_stepid = records["grade_stepid"]
+
+            return {
+                "grade": grade_stepid >> 4,
+                "stepid": grade_stepid & 0x0f,
+                "score": records["score"],
+                "combo": records["combo"],
+                "health": records["health"],
+                "time": records["time"],
+            }
+
+        rows = list(cls.iter_rows(binary))
+        columns = zip(*rows) if rows else [()] * len(cls.FIELDS)
+
+        return dict(
+            (field, array.array(typecode, column))
+            for field, typecode, column in zip(cls.FIELDS, ("B", "B", "L", "H", "H", "L"), columns)
+        )
+
 class BinaryStats(SMPacket):
     _payload = [
         (smencoder.SMPayloadType.INT, "nb_notes", 8),
@@ -12,46 +12,77 @@ try:
 except ImportError:
     pass
 
+def without_session(func):
+    """ Declare that a plugin hook does not use the database session.
+
+    When no controller nor other hook of a packet need a session, the hook
+    is called with ``session=None`` and no session is opened for the packet.
+
+    Use::
+
+        class MyPlugin(StepmaniaPlugin):
+            @without_session
+            def on_nscpingr(self, session, serv, packet):
+                pass
+    """
+
+    func.need_session = False
+    return func
+
+
 class StepmaniaPlugin(object):
     def __init__(self, server):
         self.server = server
 
+    @without_session
     def on_packet(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nscping(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nscpingr(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nschello(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nscgsr(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nscgon(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nscgsu(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nscsu(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nsccm(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nscrsg(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nsccuul(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nsscsms(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nscuopts(self, session, serv, packet):
         pass
 
@@ -62,24 +93,31 @@ class StepmaniaPlugin(object):
 
         return func(session, serv, packet["packet"])
 
+    @without_session
     def on_nscformatted(self, session, serv, packet):
         pass
 
+    @without_session
     def on_nscattack(self, session, serv, packet):
         pass
 
+    @without_session
     def on_xmlpacket(self, session, serv, packet):
         pass
 
+    @without_session
     def on_login(self, session, serv, packet):
         pass
 
+    @without_session
     def on_enterroom(self, session, serv, packet):
         pass
 
+    @without_session
     def on_createroom(self, session, serv, packet):
         pass
 
+    @without_session
     def on_roominfo(self, session, serv, packet):
         pass
 
@@ -125,6 +163,44 @@ class PluginManager(list):
         for idx, app in enumerate(self):
             self[idx] = app(*opt)
 
+    def dispatch_table(self, commands, base=None, forwards=None):
+        """
+            Resolve the ``on_<command>`` hooks of the initialized plugins.
+
+            The hooks inherited from the base class (the no-op stubs) are
+            skipped. Return a dict command -> tuple of (plugin, hook), which
+            only contains the commands with at least one hook.
+
+            :param dict forwards: command -> commands, for the hooks of the
+                base class which forward the packet to other hooks (like
+                ``on_nssmonl``): they are kept if one of these hooks is
+                overridden.
+        """
+
+        forwards = forwards or {}
+
+        table = {}
+        for command in commands:
+            name = "on_%s" % command.name.lower()
+            names = [name] + ["on_%s" % other.name.lower() for other in forwards.get(command, ())]
+
+            hooks = tuple(
+                (app, getattr(app, name))
+                for app in self
+                if any(self._overrides(app, hook, base) for hook in names)
+            )
+            if hooks:
+                table[command] = hooks
+
+        return table
+
+    @staticmethod
+    def _overrides(app, name, base):
+        """ True if the plugin defines the hook, not only the base class """
+
+        stub = getattr(base, name, None)
+        return getattr(type(app), name, stub) is not stub
+
     @staticmethod
     def import_plugin(path, plugin_classes, force_reload=False):
         if not isinstance(plugin_classes, list):
@@ -72,6 +72,7 @@ class HardcorePlugin(pluginmanager.StepmaniaPlugin):
                 "flawless": 3
             }
 
+    @pluginmanager.without_session
     def on_nscgsu(self, session, serv, packet):
         """
             This method is called on each nscgsu packet.
@@ -120,11 +121,12 @@ class HardcorePlugin(pluginmanager.StepmaniaPlugin):
             attack=attack
         )
 
-        user = models.User.get_from_pos(serv.users, player_id, session)
+        with self.server.db.session_scope(session) as session:
+            user = models.User.get_from_pos(serv.users, player_id, session)
 
-        message = smpacket.SMPacketServerNSCSU(
-            message="%s send an attack: %s" % (user.fullname(serv.room), attack.value)
-        )
+            message = smpacket.SMPacketServerNSCSU(
+                message="%s send an attack: %s" % (user.fullname(serv.room), attack.value)
+            )
 
         for conn in self.server.ingame_connections(serv.room):
             for player in (0, 1):
@@ -2,7 +2,7 @@
 
 from sqlalchemy.orm import object_session
 
-from smserver import models
+from smserver import ability
 
 class BaseResource(object):
     """ Inherit from this class to create a new resource """
@@ -30,5 +30,15 @@ class BaseResource(object):
         if self._connection:
             return self._connection
 
-        self._connection = models.Connection.by_token(self.token, self.session)
+        self._connection = self.serv.connection_cache.connection(self.token, self.session)
         return self._connection
+
+    def level(self, room_id=None):
+        """ The maximum level of the users of the connection (cached) """
+
+        return self.serv.connection_cache.level(self.token, self.session, room_id)
+
+    def can(self, action, room_id=None):
+        """ Return True if the connection can do the specified action """
+
+        return ability.Ability.can(action, self.level(room_id))
@@ -14,7 +14,7 @@ class ChatResource(base.BaseResource):
             :param str message: Message send by the connection
         """
 
-        if not self.connection.can(ability.Permissions.chat, self.connection.room_id):
+        if not self.can(ability.Permissions.chat, self.connection.room_id):
             raise exceptions.Unauthorized(self.token, "Unauthorized to post message")
 
         command, param = self.parse_command(message)
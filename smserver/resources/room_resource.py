@@ -15,7 +15,7 @@ class RoomResource(base.BaseResource):
     def create(self, name, password=None, description=None, motd=None, type_=1):
         """ Create a new room """
 
-        if not self.connection.can(ability.Permissions.create_room):
+        if not self.can(ability.Permissions.create_room):
             raise exceptions.Forbidden(self.token, "Create room %s" % name)
 
         if password:
@@ -41,12 +41,14 @@ class RoomResource(base.BaseResource):
         for user in self.connection.active_users:
             user.set_level(room.id, 10)
 
+        self.serv.connection_cache.update(self.connection)
+
         return room
 
     def delete(self, room_id):
         """ Delete the room """
 
-        if not self.connection.can(ability.Permissions.delete_room, room_id):
+        if not self.can(ability.Permissions.delete_room, room_id):
             raise exceptions.Forbidden(self.token, "Delete room %s" % room_id)
 
         room = self.session.query(models.Room).get(room_id)
@@ -90,7 +92,7 @@ class RoomResource(base.BaseResource):
     def enter(self, room):
         """ Enter in a room """
 
-        if not self.connection.can(ability.Permissions.enter_room, room.id):
+        if not self.can(ability.Permissions.enter_room, room.id):
             raise exceptions.Forbidden(self.token, "Enter room %s" % room.id)
 
         if room.is_full():
@@ -115,6 +117,7 @@ class RoomResource(base.BaseResource):
 
         self.log.info("%s enter in room %s", self.token, room.id)
 
+        self.serv.connection_cache.update(self.connection)
         self.serv.add_to_room(self.token, room.id)
 
         return room
@@ -136,6 +139,8 @@ class RoomResource(base.BaseResource):
         for user in connection.active_users:
             user.room = None
 
+        self.serv.connection_cache.update(connection)
+
         self.log.info("%s leave the room %s", self.token, room.id)
 
         return room
@@ -112,6 +112,7 @@ class UserResource(base.BaseResource):
         user.client_name = self.connection.client_name
         user.client_version = self.connection.client_version
 
+        self.serv.connection_cache.update(self.connection)
         self.serv.send_sd_running_status(session=self.session)
 
         return user
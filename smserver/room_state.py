@@ -0,0 +1,179 @@
+""" Room state module.
+
+With several worker processes, the players of a room can be connected to
+different workers. Each worker publishes, through the messaging, the state
+of his players in the room (waiting for the start, playing, live scores)
+and keeps the last state published by the others: the game start, the
+end of the game and the scoreboards take all the players into account.
+"""
+
+import datetime
+from threading import Lock
+
+
+def live_scores(server, room_id, session):
+    """ Scores of the users of this process playing in the room """
+
+    scores = []
+    for conn in server.ingame_connections(room_id):
+        cached = server.connection_cache.get(conn.token, session)
+        if not cached:
+            continue
+
+        for user_id, pos in cached.users:
+            with conn.mutex:
+                if pos not in conn.songstats:
+                    continue
+
+                steps = conn.songstats[pos].data
+
+                if not steps:
+                    continue
+
+                scores.append({
+                    "user_id": user_id,
+                    "combo": steps.last_combo,
+                    "grade": steps.last_grade,
+                    "score": steps.last_score
+                })
+
+    return scores
+
+
+class WorkerRoomState(object):
+    """ State of the players of a room connected to one worker
+
+    :Example:
+
+    >>> state = WorkerRoomState(players=2, waiting=1)
+    >>> state.everybody_waiting
+    False
+    >>> WorkerRoomState.from_dict(state.to_dict()).players
+    2
+    """
+
+    __slots__ = ("players", "waiting", "playing", "wait_since", "scores", "updated_at")
+
+    def __init__(self, players=0, waiting=0, playing=0, wait_since=None, scores=()):
+        self.players = players
+        self.waiting = waiting
+        self.playing = playing
+
+        # Start request of the last player waiting
+        self.wait_since = wait_since
+        self.scores = scores
+
+        self.updated_at = datetime.datetime.now()
+
+    @classmethod
+    def from_server(cls, server, room_id, session):
+        """ State of the players of the room connected to this process """
+
+        wait_since = None
+        for conn in server.indexed_connections("waiting", room_id):
+            with conn.mutex:
+                wait_since = conn.songstats.start_at or wait_since
+
+        return cls(
+            players=len(server.player_connections(room_id)),
+            waiting=len(server.indexed_connections("waiting", room_id)),
+            playing=len(server.indexed_connections("playing", room_id)),
+            wait_since=wait_since,
+            scores=live_scores(server, room_id, session),
+        )
+
+    @property
+    def everybody_waiting(self):
+        """ True if all the players are waiting for the start """
+
+        return self.waiting >= self.players
+
+    def to_dict(self):
+        """ Encode the state to publish it """
+
+        return {
+            "players": self.players,
+            "waiting": self.waiting,
+            "playing": self.playing,
+            "wait_since": self.wait_since.timestamp() if self.wait_since else None,
+            "scores": list(self.scores),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Decode a state published by another worker """
+
+        wait_since = data.get("wait_since")
+
+        return cls(
+            players=data.get("players", 0),
+            waiting=data.get("waiting", 0),
+            playing=data.get("playing", 0),
+            wait_since=datetime.datetime.fromtimestamp(wait_since) if wait_since else None,
+            scores=data.get("scores", ()),
+        )
+
+
+class RemoteRoomStates(object):
+    """ Last state of the rooms published by the other workers.
+
+    A state not refreshed for ``ttl`` (the worker stopped) is ignored.
+    """
+
+    def __init__(self, ttl=datetime.timedelta(seconds=5)):
+        self.ttl = ttl
+
+        self._lock = Lock()
+        # room_id -> worker_id -> WorkerRoomState
+        self._rooms = {}
+
+    def update(self, worker_id, room_id, state):
+        """ Store the state of the room published by a worker """
+
+        with self._lock:
+            workers = self._rooms.setdefault(room_id, {})
+
+            if state.players:
+                workers[worker_id] = state
+            else:
+                workers.pop(worker_id, None)
+
+            if not workers:
+                del self._rooms[room_id]
+
+    def states(self, room_id):
+        """ Fresh states of the room published by the other workers """
+
+        expire_at = datetime.datetime.now() - self.ttl
+
+        with self._lock:
+            workers = self._rooms.get(room_id, {})
+            return tuple(
+                state for state in workers.values()
+                if state.updated_at > expire_at
+            )
+
+    def everybody_waiting(self, room_id):
+        """ True if all the remote players of the room wait for the start """
+
+        return all(state.everybody_waiting for state in self.states(room_id))
+
+    def playing(self, room_id):
+        """ True if a remote player of the room is playing """
+
+        return any(state.playing for state in self.states(room_id))
+
+    def wait_since(self, room_id):
+        """ Start request of the last remote player waiting """
+
+        wait_since = None
+        for state in self.states(room_id):
+            if state.wait_since and (not wait_since or state.wait_since > wait_since):
+                wait_since = state.wait_since
+
+        return wait_since
+
+    def scores(self, room_id):
+        """ Live scores of the remote players of the room """
+
+        return [score for state in self.states(room_id) for score in state.scores]
@@ -35,6 +35,14 @@ class Router(object):
         for command, controller in route_dict.items():
             self.add_route(command, controller)
 
+    def need_session(self, command):
+        """ Return if one of the controllers of the command use the session """
+
+        return any(
+            controller.need_session or controller.require_login
+            for controller in self.routes.get(command, ())
+        )
+
     def route(self, server, connection, packet, *, session=None):
         """ Route a packet to the correct controller
 
@@ -50,22 +58,46 @@ class Router(object):
             self.log.error("Cannot route packet %s from %s", packet, connection)
             return
 
+        controllers = self.routes[packet.command]
+
+        if session is None and not self.need_session(packet.command):
+            for controller in controllers:
+                self._handle(controller(server, connection, packet, None))
+            return
+
         with server.db.session_scope(session) as session:
-            for i, controller in enumerate(self.routes[packet.command]):
+            for i, controller in enumerate(controllers):
                 if i > 0:
                     session.commit()
 
                 app = controller(server, connection, packet, session)
 
-                if app.require_login and not app.active_users:
+                if app.require_login and not app.logged_in:
                     self.log.info("Action forbidden %s for user %s", packet.command, connection.token)
                     continue
 
-                try:
-                    app.handle()
-                except Exception as err: #pylint: disable=broad-except
-                    self.log.exception("Message %s %s %s",
-                                       type(controller).__name__, controller.__module__, err)
+                self._handle(app, session)
+
+    def _handle(self, app, session=None):
+        """
+            Run the controller, and log its errors. In a unit of work, the
+            changes of a failing controller are rolled back.
+        """
+
+        try:
+            if session is None:
+                app.handle()
+                return
+
+            with session.savepoint():
+                app.handle()
+        except Exception as err: #pylint: disable=broad-except
+            self.log.exception("Message %s %s %s",
+                               type(app).__name__, type(app).__module__, err)
+
+            # The cached state may have been written before the rollback
+            if session is not None and session.in_unit_of_work:
+                app.server.connection_cache.invalidate(app.conn.token)
 
 _ROUTER = Router()
 _ROUTER.load_routes_dict(routes.ROUTES)
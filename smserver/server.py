@@ -1,22 +1,30 @@
 """ Server module """
 
 import datetime
+import uuid
 from functools import wraps
 
 from smserver import __version__
 from smserver import database
 from smserver import conf
+from smserver import connection_cache
+from smserver import event
 from smserver import logger
+from smserver import messaging
 from smserver import models
 from smserver import router
 from smserver import sdnotify
 from smserver import profiling
+from smserver import room_state
 
-from smserver.pluginmanager import PluginManager
+from smserver.pluginmanager import PluginManager, StepmaniaPlugin
 from smserver.watcher import StepmaniaWatcher
 from smserver.listener.app import Listener
 from smserver.chathelper import with_color
+from smserver.smutils import smconn
 from smserver.smutils import smthread
+from smserver.smutils.smpacket import smcommand
+from smserver.smutils.smpacket import smencoder
 from smserver.smutils.smpacket import smpacket
 
 def with_session(func):
@@ -36,6 +44,22 @@ def with_session(func):
             func(self, session, *arg, **kwargs)
     return wrapper
 
+def init_database(db, config):
+    """
+        Reset the state of the database on startup: disconnect all the
+        users, create the rooms of the configuration and the fixed bans.
+    """
+
+    with db.session_scope() as session:
+        models.User.disconnect_all(session)
+        models.Room.init_from_hashes(config.get("rooms", []), session)
+        models.Room.reset_room_status(session)
+        models.Ban.reset_ban(session, fixed=True)
+
+        if config.get("ban_ips"):
+            for ip in config.get("ban_ips", []):
+                models.Ban.ban(session, ip, fixed=True)
+
 class StepmaniaServer(smthread.StepmaniaServer):
     """
         It's the main class of the server. It will start a new thread for each
@@ -50,6 +74,9 @@ class StepmaniaServer(smthread.StepmaniaServer):
             server.StepmaniaServer(config).start()
     """
 
+    # Max age of the discovery packet, if the watcher doesn't refresh it
+    DISCOVERY_TTL = datetime.timedelta(seconds=10)
+
     def __init__(self):
         """
             Take a configuration and initialize the server:
@@ -68,7 +95,15 @@ class StepmaniaServer(smthread.StepmaniaServer):
         self.log = logger.get_logger()
         self.log.debug("Configuration loaded")
 
+        self._init_json_backend()
+        self._init_outbound_queue()
+        self._init_workers()
+
         self.db = database.get_current_db()
+        self.connection_cache = connection_cache.ConnectionCache()
+
+        # Commit once per packet, see database.UnitOfWorkSession
+        self.unit_of_work = self.config.database.get("unit_of_work", False)
 
         self._init_database()
 
@@ -95,7 +130,12 @@ class StepmaniaServer(smthread.StepmaniaServer):
         for server in self.config.additional_servers:
             servers.append((server["ip"], server["port"], server.get("type")))
 
-        smthread.StepmaniaServer.__init__(self, servers)
+        smthread.StepmaniaServer.__init__(
+            self,
+            servers,
+            handler_workers=self.config.server.get("handler_workers", 0),
+            backlog=self.config.server.get("backlog"),
+        )
         for ip, port, server_type in servers:
             self.log.info("Server %s listening on %s:%s", server_type, ip, port)
 
@@ -104,6 +144,95 @@ class StepmaniaServer(smthread.StepmaniaServer):
 
         self.started_at = datetime.datetime.now()
 
+        # (packet, built_at) used to answer to the discovery requests
+        self._discovery = (None, None)
+
+    def _init_json_backend(self):
+        """ Select the library used to encode and decode the JSON packets """
+
+        backend = self.config.server.get("json_backend", "auto")
+        try:
+            name = smencoder.JSONBackend.use(backend)
+        except (ImportError, ValueError) as err:
+            self.log.warning("JSON backend %s unavailable (%s), fallback to json", backend, err)
+            name = smencoder.JSONBackend.use("json")
+
+        self.log.debug("JSON backend: %s", name)
+
+    def _init_outbound_queue(self):
+        """ Configure the outbound and handler queues of the connections """
+
+        try:
+            smconn.StepmaniaConn.configure_outbound(
+                high_water=self.config.server.get("outbound_queue_size", 256 * 1024),
+                policy=self.config.server.get("slow_consumer_policy", "drop_updates"),
+            )
+        except ValueError as err:
+            self.log.error("Invalid outbound queue configuration: %s", err)
+
+        try:
+            smconn.StepmaniaConn.configure_handler(
+                high_water=self.config.server.get("handler_queue_size", 256),
+                policy=self.config.server.get("handler_queue_policy", "drop"),
+            )
+        except ValueError as err:
+            self.log.error("Invalid handler queue configuration: %s", err)
+
+    def _init_workers(self):
+        """ Configure the server to run in several worker processes """
+
+        # Number of worker processes listening on the same ports
+        self.workers = self.config.server.get("workers", 1)
+        self.worker_id = uuid.uuid4().hex
+
+        # State of the rooms published by the other workers
+        self.room_states = room_state.RemoteRoomStates()
+
+        smconn.SMThread.reuse_port = self.workers > 1
+
+    def publish(self, target, value, packet):
+        """ Send the packet to the other worker processes, through the messaging """
+
+        if self.workers <= 1:
+            return
+
+        messaging.send_event(
+            event.EventKind.packet,
+            data={
+                "origin": self.worker_id,
+                "target": target,
+                "value": value,
+                "packet": packet.to_("json"),
+            },
+            room_id=value if target in ("room", "ingame", "players") else None,
+        )
+
+    def publish_room_state(self, room_id, session):
+        """ Send the state of the players of the room to the other workers """
+
+        if self.workers <= 1:
+            return
+
+        state = room_state.WorkerRoomState.from_server(self, room_id, session)
+        self._publish_room_event(room_id, "state", state=state.to_dict())
+
+    def publish_room_start(self, room_id):
+        """ Tell the other workers to start the song of their waiting players """
+
+        if self.workers <= 1:
+            return
+
+        self._publish_room_event(room_id, "start")
+
+    def _publish_room_event(self, room_id, action, **data):
+        data.update({
+            "origin": self.worker_id,
+            "action": action,
+            "room_id": room_id,
+        })
+
+        messaging.send_event(event.EventKind.room_state, data=data, room_id=room_id)
+
     def start(self):
         """ Start all the threads """
 
@@ -136,6 +265,10 @@ class StepmaniaServer(smthread.StepmaniaServer):
         for server in self._servers:
             server.join()
 
+        if self.handler_executor:
+            self.log.info("Waiting for the packets handling...")
+            self.handler_executor.shutdown()
+
     def reload(self):
         """ Reload configuration files """
 
@@ -155,6 +288,31 @@ class StepmaniaServer(smthread.StepmaniaServer):
         self.send_sd_running_status()
         self.sd_notify.ready()
 
+    def discovery_packet(self, session=None, refresh=False):
+        """
+            NSCFormatted packet used to answer the discovery requests.
+
+            The packet (and his encoding) is cached: it's refreshed by the
+            watcher, or when it's older than DISCOVERY_TTL. Without session,
+            one is only opened to rebuild the packet.
+        """
+
+        packet, built_at = self._discovery
+        now = datetime.datetime.now()
+
+        if refresh or not packet or now - built_at > self.DISCOVERY_TTL:
+            with self.db.session_scope(session) as session:
+                nb_players = models.User.nb_onlines(session)
+
+            packet = smpacket.SMPacketServerNSCFormatted(
+                server_port=self.config.server["port"],
+                server_name=self.config.server["name"],
+                nb_players=nb_players
+            )
+            self._discovery = (packet, now)
+
+        return packet
+
     def send_sd_running_status(self, session=None):
         """ Send running status to systemd """
 
@@ -193,10 +351,34 @@ class StepmaniaServer(smthread.StepmaniaServer):
         super().add_connection(conn)
         self.send_sd_running_status()
 
-    @with_session
     @profiling.profile("packet")
-    def on_packet(self, session, serv, packet): #pylint: disable=arguments-differ
-        self.handle_packet(session, serv, packet)
+    def on_packet(self, serv, packet):
+        if not self.packet_need_session(packet.command):
+            with smconn.send_batch():
+                self.handle_packet(None, serv, packet)
+            return
+
+        with self.db.session_scope(unit_of_work=self.unit_of_work) as session, smconn.send_batch():
+            self.handle_packet(session, serv, packet)
+
+    def packet_need_session(self, command):
+        """
+            Return if a controller or a plugin of the command use the
+            database session. The result is cached until the plugins are
+            reloaded.
+        """
+
+        need_session = self._need_session.get(command)
+        if need_session is not None:
+            return need_session
+
+        need_session = self.router.need_session(command) or any(
+            getattr(func, "need_session", True)
+            for _, func in self.plugin_hooks.get(command, ())
+        )
+
+        self._need_session[command] = need_session
+        return need_session
 
     def handle_packet(self, session, serv, packet):
         """
@@ -213,16 +395,23 @@ class StepmaniaServer(smthread.StepmaniaServer):
             session=session
         )
 
-        for app in self.plugins:
-            func = getattr(app, "on_%s" % packet.command.name.lower(), None)
-            if not func:
-                continue
+        hooks = self.plugin_hooks.get(packet.command)
+        if not hooks:
+            return
 
+        for app, func in hooks:
             try:
-                func(session, serv, packet)
+                if session is None:
+                    func(session, serv, packet)
+                    continue
+
+                with session.savepoint():
+                    func(session, serv, packet)
             except Exception as err: #pylint: disable=broad-except
                 self.log.exception("Message %s %s %s",
                                    type(app).__name__, app.__module__, err)
+
+        if session:
             session.commit()
 
 
@@ -263,6 +452,7 @@ class StepmaniaServer(smthread.StepmaniaServer):
             self.send_user_list(room)
 
         models.Connection.remove(conn.token, session)
+        self.connection_cache.invalidate(conn.token)
 
 
     def send_user_list(self, room):
@@ -312,16 +502,12 @@ class StepmaniaServer(smthread.StepmaniaServer):
         return True
 
     def _init_database(self):
-        with self.db.session_scope() as session:
-            models.User.disconnect_all(session)
-            models.Room.init_from_hashes(self.config.get("rooms", []), session)
-            models.Room.reset_room_status(session)
-            models.Ban.reset_ban(session, fixed=True)
-
-            if self.config.get("ban_ips"):
-                for ip in self.config.get("ban_ips", []):
-                    models.Ban.ban(session, ip, fixed=True)
+        # With several workers, the supervisor initialize the database before
+        # starting them: a worker would disconnect the users of the others.
+        if self.workers > 1:
+            return
 
+        init_database(self.db, self.config)
 
     def _init_chat_commands(self, force_reload=False):
         chat_commands = {}
@@ -352,8 +538,24 @@ class StepmaniaServer(smthread.StepmaniaServer):
 
         plugins.init(self)
 
+        # StepmaniaPlugin.on_nssmonl forwards the SMO packet to on_<smo command>
+        self.plugin_hooks = plugins.dispatch_table(
+            self._plugin_commands(),
+            StepmaniaPlugin,
+            forwards={smcommand.SMClientCommand.NSSMONL: smcommand.SMOClientCommand},
+        )
+        self._need_session = {}
+
         return plugins
 
+    @staticmethod
+    def _plugin_commands():
+        """ All the commands which can be handled by a plugin """
+
+        for family in (smcommand.SMCommand, smcommand.SMOCommand):
+            for klass in family.__subclasses__():
+                yield from klass
+
     def _get_plugins(self, plugin_class, force_reload=False):
         return PluginManager(
             plugin_class=plugin_class,
@@ -3,25 +3,126 @@
 Base module for handling all type of connection
 """
 
+import contextlib
 import datetime
+import socket
 import uuid
 
-from threading import Lock, Thread
+from threading import Lock, Thread, local
 
 from smserver import logger
+from smserver.smutils import smgamestate
+from smserver.smutils import smqueue
 from smserver.smutils.smpacket import smpacket
 from smserver.smutils.smpacket import smcommand
 
+# Connections with data queued during the current batch, by thread
+_BATCH = local()
+
+
+@contextlib.contextmanager
+def send_batch():
+    """ Coalesce the packets sent by this thread until the end of the block.
+
+    Each connection is flushed only once, at the end of the block, so all
+    the packets queued for a connection are sent in one write. A nested
+    block is part of the outer one.
+
+    Use::
+
+        with smconn.send_batch():
+            server.sendroom(room_id, packet1)
+            server.sendroom(room_id, packet2)
+    """
+
+    if getattr(_BATCH, "connections", None) is not None:
+        yield
+        return
+
+    connections = _BATCH.connections = {}
+    try:
+        yield
+    finally:
+        _BATCH.connections = None
+        for conn in connections.values():
+            conn.flush()
+
+
+class _RoomIndexed(object):
+    """ State of a connection used by the indexes of the rooms.
+
+    The indexes of the room of the connection are updated each time the
+    state is set (but not when the value is modified in place).
+    """
+
+    def __init__(self, name):
+        self.attr = "_" + name
+
+    def __get__(self, conn, owner):
+        if conn is None:
+            return self
+
+        return getattr(conn, self.attr)
+
+    def __set__(self, conn, value):
+        setattr(conn, self.attr, value)
+        conn._serv.update_room_indexes(conn) #pylint: disable=protected-access
+
 
 class StepmaniaConn(object):
-    """ A stepmania connection is represented by a token in the database """
+    """ A stepmania connection is represented by a token in the database.
+
+    The state of a connection is stored in slots, to keep the idle
+    connections small. The locks are used as follow:
+
+    * ``mutex`` guards the game state: ``songs``, ``song``, ``songstats``
+      (and the state of his players), ``wait_start`` and ``ingame``. Take it
+      to read or modify several of these values together. It also guards
+      the shard of the connection in the handler executor, the number of
+      packets waiting in it and ``dropped_packets``.
+    * ``room`` is only modified by the server, with the lock of the room.
+      The mutex of a connection can be held while taking the lock of a
+      room (setting an indexed state), never the opposite.
+    * ``outbound`` has its own lock, sending a packet does not need the mutex.
+    """
+
+    __slots__ = (
+        "mutex", "executor", "outbound", "_serv", "ip", "port", "token", "room",
+        "songs", "song", "_songstats", "_wait_start", "_ingame", "_spectate",
+        "chat_timestamp", "last_ping", "_shard", "_in_flight", "dropped_packets",
+        "_scoreboards",
+    )
 
     log = logger.get_logger()
     ENCODING = "binary"
     ALLOWED_PACKET = []
 
-    def __init__(self, serv, ip, port):
+    # Outbound queue options, see smqueue.OutboundQueue
+    OUTBOUND_HIGH_WATER = 256 * 1024
+    SLOW_CONSUMER_POLICY = "drop_updates"
+
+    # Packets which can be dropped for a slow consumer. The sections of a
+    # scoreboard (NSCGSU) are dropped together, see droppable_group.
+    DROPPABLE_COMMANDS = frozenset([smcommand.SMServerCommand.NSCGSU])
+
+    # Max packets of a connection waiting in the handler executor (0 for no
+    # limit), and what to do with the next ones: "drop" or "disconnect"
+    HANDLER_HIGH_WATER = 256
+    HANDLER_POLICY = "drop"
+    HANDLER_POLICIES = ("drop", "disconnect")
+
+    # Send the binary packets queued in a single write
+    COALESCE_WRITES = True
+
+    songstats = _RoomIndexed("songstats")
+    wait_start = _RoomIndexed("wait_start")
+    ingame = _RoomIndexed("ingame")
+    spectate = _RoomIndexed("spectate")
+
+    def __init__(self, serv, ip, port, executor=None):
         self.mutex = Lock()
+        self.executor = executor
+        self.outbound = smqueue.OutboundQueue(self.OUTBOUND_HIGH_WATER, self.SLOW_CONSUMER_POLICY)
 
         self._serv = serv
         self.ip = ip
@@ -33,16 +134,25 @@ class StepmaniaConn(object):
 
         self.songs = {}
         self.song = None
-        self.songstats = {0: {"data": []}, 1: {"data": []}}
+        # Not in a room yet, the indexes don't need to be updated
+        self._songstats = smgamestate.GameState()
 
-        self.wait_start = False
-        self.ingame = False
-        self.spectate = False
+        self._wait_start = False
+        self._ingame = False
+        self._spectate = False
 
         self.chat_timestamp = False
 
         self.last_ping = datetime.datetime.now()
 
+        # Key of the executor queue, and number of calls waiting or running in it
+        self._shard = self.token
+        self._in_flight = 0
+        self.dropped_packets = 0
+
+        # Number of scoreboards sent, to group their sections
+        self._scoreboards = 0
+
     def run(self):
         """ Start to listen for incomming data """
         for data in self.received_data():
@@ -56,6 +166,72 @@ class StepmaniaConn(object):
     def received_data(self):
         pass
 
+    @property
+    def shard_key(self):
+        """ Key of the executor queue: the room, or the token in the lobby """
+
+        if self.room is None:
+            return self.token
+
+        return ("room", self.room)
+
+    def _dispatch(self, func, *args):
+        """ Call func in the handler executor of the connection.
+
+        The calls are sharded by room: the calls of the connections of a room
+        are run in order, and the rooms in parallel. A connection only move to
+        the queue of its new room once its previous calls are done, so its
+        calls are always run in order. Without executor (or once it's
+        stopped) the function is called directly.
+        """
+
+        if self.executor is None:
+            func(*args)
+            return
+
+        with self.mutex:
+            if not self._in_flight:
+                self._shard = self.shard_key
+
+            shard = self._shard
+            self._in_flight += 1
+
+        try:
+            self.executor.submit(shard, self._run_dispatched, func, *args)
+        except RuntimeError:
+            self._run_dispatched(func, *args)
+
+    def _run_dispatched(self, func, *args):
+        try:
+            func(*args)
+        finally:
+            with self.mutex:
+                self._in_flight -= 1
+
+    def _dispatch_data(self, data):
+        """ Handle the data received in the handler executor.
+
+        When the connection has too many packets waiting, the data is
+        dropped or the connection is closed, depending of HANDLER_POLICY.
+        """
+
+        if self.executor is not None and self.HANDLER_HIGH_WATER > 0:
+            with self.mutex:
+                full = self._in_flight >= self.HANDLER_HIGH_WATER
+                if full and self.HANDLER_POLICY == "drop":
+                    self.dropped_packets += 1
+
+            if full and self.HANDLER_POLICY == "disconnect":
+                self.log.warning("Connection %s disconnected: too many packets waiting", self.ip)
+                self.shutdown()
+                return
+
+            if full:
+                self.log.debug("Packet from %s dropped: too many packets waiting", self.ip)
+                return
+
+        self._dispatch(self._on_data, data)
+
     def _on_data(self, data):
         """ Action to perform on new data """
 
@@ -79,17 +255,114 @@ class StepmaniaConn(object):
         """ How to send a new packet """
 
         if packet.command == smcommand.SMServerCommand.NSCCM and self.chat_timestamp:
-            packet["message"] = "[%s] %s" % (
-                datetime.datetime.now().strftime("%X"),
-                packet["message"]
-            )
+            packet = self._with_timestamp(packet)
 
         self.log.debug("packet send to %s: %s", self.ip, packet)
-        self.send_data(packet.to_(self.ENCODING))
+        self.queue_data(
+            packet.to_(self.ENCODING),
+            droppable=self.droppable_group(packet)
+        )
+
+    def droppable_group(self, packet):
+        """ How the packet can be dropped for a slow consumer (see smqueue)
+
+        A scoreboard is sent in 3 sections (the names, the combos and the
+        grades), starting with the section 0: they share a group, so a slow
+        client never shows the sections of different scoreboards.
+        """
+
+        if packet.command not in self.DROPPABLE_COMMANDS:
+            return False
+
+        if packet.command != smcommand.SMServerCommand.NSCGSU:
+            return True
+
+        if packet["section"] == 0:
+            self._scoreboards += 1
+
+        return ("scoreboard", self._scoreboards)
+
+    @classmethod
+    def configure_handler(cls, high_water, policy):
+        """ Set the max number of packets waiting to be handled of a connection """
+
+        if policy not in cls.HANDLER_POLICIES:
+            raise ValueError("Unknown handler queue policy %s" % policy)
+
+        cls.HANDLER_HIGH_WATER = high_water
+        cls.HANDLER_POLICY = policy
+
+    @classmethod
+    def configure_outbound(cls, high_water, policy):
+        """ Set the outbound queue options of the new connections """
+
+        if policy not in smqueue.OutboundQueue.POLICIES:
+            raise ValueError("Unknown slow consumer policy %s" % policy)
+
+        cls.OUTBOUND_HIGH_WATER = high_water
+        cls.SLOW_CONSUMER_POLICY = policy
+
+    def queue_data(self, data, droppable=False):
+        """ Add the data to the outbound queue, and let the transport send it.
+
+        A connection which have too much data waiting is shutdown.
+        Inside a send_batch block, the data is only sent at the end of the block.
+        """
+
+        try:
+            self.outbound.put(data, droppable)
+        except smqueue.SlowConsumer as err:
+            self.log.warning("Slow consumer %s disconnected: %s", self.ip, err)
+            self.outbound.clear()
+            self.shutdown()
+            return
+
+        batch = getattr(_BATCH, "connections", None)
+        if batch is not None:
+            batch[id(self)] = self
+            return
+
+        self.flush()
+
+    def flush(self):
+        """ Send the data queued.
+
+        The transports which can't send the data directly override it to
+        drain the queue when the client is ready.
+        """
+
+        datas = self.outbound.pop_all()
+        if self.COALESCE_WRITES and self.ENCODING == "binary" and len(datas) > 1:
+            datas = [b"".join(datas)]
+
+        for data in datas:
+            self.send_data(data)
+
+    @staticmethod
+    def _with_timestamp(packet):
+        """ Chat packet with the current time prepend to the message.
+
+        The packet is cached on the original one, so it's only built and
+        encoded once for all the connections which use the chat timestamp.
+        """
+
+        timestamp = datetime.datetime.now().strftime("%X")
+
+        return packet.variant(
+            ("timestamp", timestamp),
+            lambda packet: packet.copy(message="[%s] %s" % (timestamp, packet["message"]))
+        )
 
     def send_data(self, data):
         """ Send biary data to the client """
 
+    def shutdown(self):
+        """ Stop the transport without waiting for the client.
+
+        The connection is then closed by the thread reading it. (close can't
+        be called directly while iterating over the connections)
+        """
+
     def close(self):
         """ Close the connection """
         self._serv.on_disconnect(self)
@@ -98,6 +371,9 @@ class StepmaniaConn(object):
 class SMThread(Thread):
     log = logger.get_logger()
 
+    # Let several worker processes bind the same port (SO_REUSEPORT)
+    reuse_port = False
+
     def __init__(self, server, ip, port):
         Thread.__init__(self)
         self.daemon = True
@@ -105,6 +381,23 @@ class SMThread(Thread):
         self.ip = ip
         self.port = port
 
+        # Executor where the connections handle their packets (None: in this thread)
+        self.executor = None
+
+        # Size of the queue of the connections waiting to be accepted
+        self.backlog = 128
+
+    def bind_socket(self, type_=socket.SOCK_STREAM):
+        """ Create the socket of the server, bound to his address """
+
+        sock = socket.socket(socket.AF_INET, type_)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        sock.bind((self.ip, self.port))
+        return sock
+
     def run(self):
         self.log.info("Successfully close thread: %s", self)
 
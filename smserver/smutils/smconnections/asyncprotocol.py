@@ -0,0 +1,178 @@
+""" Asyncio protocol client module """
+
+import socket
+import threading
+
+import asyncio
+
+from smserver.smutils import smconn
+from smserver.smutils import smframer
+
+class AsyncProtocolClient(smconn.StepmaniaConn, asyncio.Protocol):
+    """ Connection handled by an asyncio Protocol.
+
+    The data received is given to the framer directly from the event loop
+    callback, and the data sent is written to the transport without creating
+    any task. When the transport write buffer goes over the high water mark,
+    the data stay in the outbound queue and we stop reading the client, until
+    the buffer goes back under the low water mark.
+    """
+
+    ENCODING = "binary"
+
+    WRITE_HIGH_WATER = 64 * 1024
+    WRITE_LOW_WATER = 16 * 1024
+
+    def __init__(self, serv, server_thread):
+        smconn.StepmaniaConn.__init__(self, serv, None, None, server_thread.executor)
+        self.server_thread = server_thread
+        self.loop = server_thread.loop
+        self.transport = None
+
+        self._framer = smframer.SMFramer()
+        self._reading_paused = False
+        self._writing_paused = False
+        self._closed = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.ip, self.port = transport.get_extra_info("peername")[:2]
+
+        transport.set_write_buffer_limits(
+            high=self.WRITE_HIGH_WATER,
+            low=self.WRITE_LOW_WATER,
+        )
+
+        self.server_thread.clients.add(self)
+        self._dispatch(self._serv.add_connection, self)
+
+    def data_received(self, data):
+        try:
+            for frame in self._framer.feed(data):
+                self._dispatch_data(frame)
+        except smframer.FrameTooLarge as err:
+            self.log.info("connection %s closed: %s", self.ip, err)
+            self.close()
+
+    def connection_lost(self, exc):
+        self.server_thread.clients.discard(self)
+        self.close()
+
+    def pause_writing(self):
+        """ The client does not read fast enough, stop reading his packets """
+
+        self._writing_paused = True
+        if self.transport.is_closing():
+            return
+
+        self._reading_paused = True
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self._writing_paused = False
+        if self.transport.is_closing():
+            return
+
+        if self._reading_paused:
+            self._reading_paused = False
+            self.transport.resume_reading()
+
+        self._flush()
+
+    def _call_in_loop(self, func, *args):
+        """ The transport can only be used from the event loop thread """
+
+        if threading.get_ident() == self.server_thread.loop_thread_id:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def send_data(self, data):
+        self._call_in_loop(self._write, data)
+
+    def _write(self, data):
+        if self.transport is None or self.transport.is_closing():
+            return
+
+        self.transport.write(data)
+
+    def flush(self):
+        self._call_in_loop(self._flush)
+
+    def _flush(self):
+        if self._writing_paused or self.transport is None or self.transport.is_closing():
+            return
+
+        datas = self.outbound.pop_all()
+        if datas:
+            self.transport.write(b"".join(datas))
+
+    def shutdown(self):
+        if self.transport is not None:
+            self._call_in_loop(self.transport.close)
+
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        self._dispatch(self._serv.on_disconnect, self)
+        if self.transport is not None:
+            self._call_in_loop(self.transport.close)
+
+
+class AsyncProtocolServer(smconn.SMThread):
+    def __init__(self, server, ip, port, loop=None):
+        smconn.SMThread.__init__(self, server, ip, port)
+
+        self.loop = loop or asyncio.new_event_loop()
+        self.loop_thread_id = None
+        self._serv = None
+        self.clients = set()
+
+    def run(self):
+        self.start_server()
+        self.loop.run_forever()
+        self.loop.close()
+        smconn.SMThread.run(self)
+
+    def start_server(self):
+        """ Start the server in the given loop """
+
+        self.loop_thread_id = threading.get_ident()
+        self._serv = self.loop.run_until_complete(self.loop.create_server(
+            lambda: AsyncProtocolClient(self.server, self),
+            host=self.ip,
+            port=self.port,
+            reuse_port=self.reuse_port,
+        ))
+        return self._serv
+
+    def stop_server(self):
+        """ Stop the server in the given loop """
+
+        if self._serv is None:
+            return
+
+        if self._serv.sockets:
+            for sock in self._serv.sockets:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+        self._serv.close()
+        self.loop.run_until_complete(
+            asyncio.wait_for(self._serv.wait_closed(), timeout=1)
+        )
+
+        for client in list(self.clients):
+            client.close()
+
+        # Let the transports call connection_lost
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+    def stop(self):
+        smconn.SMThread.stop(self)
+        self.stop_server()
+        self.loop.stop()
@@ -6,67 +6,88 @@ import asyncio
 import asyncio.streams
 
 from smserver.smutils import smconn
+from smserver.smutils import smframer
 
 class AsyncSocketClient(smconn.StepmaniaConn):
+    __slots__ = ("reader", "writer", "task", "loop", "_draining")
+
     ENCODING = "binary"
 
-    def __init__(self, serv, ip, port, reader, writer, loop):
-        smconn.StepmaniaConn.__init__(self, serv, ip, port)
+    def __init__(self, serv, ip, port, reader, writer, loop, executor=None):
+        smconn.StepmaniaConn.__init__(self, serv, ip, port, executor)
         self.reader = reader
         self.writer = writer
         self.task = None
         self.loop = loop
 
+        # Waiting for the client to read his data before sending the queue
+        self._draining = False
+
     @asyncio.coroutine
     def run(self):
-        full_data = b''
-        size = None
-        data_left = b''
+        framer = smframer.SMFramer()
 
         while True:
-            if data_left:
-                data = data_left
-                data_left = b""
-            else:
-                try:
-                    data = yield from self.reader.read(8192)
-                except asyncio.CancelledError:
-                    break
+            try:
+                data = yield from self.reader.read(8192)
+            except asyncio.CancelledError:
+                break
 
             if data == b'':
                 break
 
-            if not size:
-                if len(data) < 5:
-                    self.log.info("packet %s drop: to short", data)
-                    continue
+            try:
+                for frame in framer.feed(data):
+                    self._dispatch_data(frame)
+            except smframer.FrameTooLarge as err:
+                self.log.info("connection %s closed: %s", self.ip, err)
+                break
 
-                full_data = data[:4]
-                data = data[4:]
-                size = int.from_bytes(full_data[:4], byteorder='big')
+        self.close()
 
-            if len(data) < size - len(full_data):
-                full_data += data
-                continue
+    def send_data(self, data):
+        # The packets can be sent from the handler executor or the watcher threads
+        self.loop.call_soon_threadsafe(self._write, data)
 
-            payload_size = len(full_data) - 4 + size
-            full_data += data[:payload_size]
+    def _write(self, data):
+        self.writer.write(data)
+        self.loop.create_task(self.writer.drain())
 
-            self._on_data(full_data)
+    def flush(self):
+        self.loop.call_soon_threadsafe(self._flush)
 
-            data_left = data[payload_size:]
-            full_data = b""
-            size = None
+    def _flush(self):
+        if self._draining:
+            return
 
-        self.close()
+        datas = self.outbound.pop_all()
+        if not datas:
+            return
 
-    def send_data(self, data):
-        self.writer.write(data)
-        self.loop.create_task(self.writer.drain())
+        self.writer.write(b"".join(datas))
+
+        # The data can't be sent right now, keep the next data in the queue
+        if self.writer.transport.get_write_buffer_size():
+            self._draining = True
+            self.loop.create_task(self._drain())
+
+    @asyncio.coroutine
+    def _drain(self):
+        try:
+            yield from self.writer.drain()
+        except ConnectionError:
+            return
+        finally:
+            self._draining = False
+
+        self._flush()
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.writer.close)
 
     def close(self):
-        self._serv.on_disconnect(self)
-        self.writer.close()
+        self._dispatch(self._serv.on_disconnect, self)
+        self.loop.call_soon_threadsafe(self.writer.close)
 
 
 class AsyncSocketServer(smconn.SMThread):
@@ -79,13 +100,15 @@ class AsyncSocketServer(smconn.SMThread):
 
     def _accept_client(self, client_reader, client_writer):
         ip, port = client_writer.get_extra_info("peername")
-        client = AsyncSocketClient(self.server, ip, port, client_reader, client_writer, self.loop)
+        client = AsyncSocketClient(
+            self.server, ip, port, client_reader, client_writer, self.loop, self.executor
+        )
 
         task = asyncio.Task(client.run(), loop=self.loop)
         client.task = task
         self.clients[client.task] = client
 
-        self.server.add_connection(client)
+        client._dispatch(self.server.add_connection, client) #pylint: disable=protected-access
 
         def client_done(task):
             self.clients[task].close()
@@ -106,6 +129,7 @@ class AsyncSocketServer(smconn.SMThread):
             self._accept_client,
             host=self.ip,
             port=self.port,
+            reuse_port=self.reuse_port,
             loop=self.loop,
         ))
         return self._serv
@@ -0,0 +1,253 @@
+""" Selector socket module.
+
+All the connections of the server are handled by a single thread, which
+multiplex the sockets with the selectors module.
+"""
+
+import functools
+import selectors
+import socket
+import threading
+
+from smserver.smutils import smconn
+from smserver.smutils import smframer
+
+class SelectorConn(smconn.StepmaniaConn):
+    """ Connection handled by the selector thread of his server.
+
+    The socket is only used by the selector thread: the other threads queue
+    their data and ask the selector thread to flush the connection.
+    """
+
+    __slots__ = ("_conn", "server_thread", "closed", "_framer", "_write_buffer")
+
+    ENCODING = "binary"
+
+    def __init__(self, serv, ip, port, conn, server_thread):
+        smconn.StepmaniaConn.__init__(self, serv, ip, port, server_thread.executor)
+        self._conn = conn
+        self.server_thread = server_thread
+        self.closed = False
+
+        self._framer = smframer.SMFramer()
+        self._write_buffer = bytearray()
+
+    def fileno(self):
+        return self._conn.fileno()
+
+    def on_readable(self):
+        """ Read the data available, and handle the complete packets """
+
+        try:
+            data = self._conn.recv(self.server_thread.RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            self.close()
+            return
+
+        try:
+            for frame in self._framer.feed(data):
+                self._dispatch_data(frame)
+        except smframer.FrameTooLarge as err:
+            self.log.info("connection %s closed: %s", self.ip, err)
+            self.close()
+
+    def on_writable(self):
+        """ Send the queued data, return False if the socket can't take more data """
+
+        while True:
+            if not self._write_buffer:
+                datas = self.outbound.pop_all()
+                if not datas:
+                    return True
+
+                self._write_buffer = bytearray(b"".join(datas))
+
+            try:
+                sent = self._conn.send(self._write_buffer)
+            except (BlockingIOError, InterruptedError):
+                return False
+            except OSError:
+                self.close()
+                return True
+
+            del self._write_buffer[:sent]
+
+    def send_data(self, data):
+        self.queue_data(data)
+
+    def flush(self):
+        self.server_thread.request_flush(self)
+
+    def shutdown(self):
+        try:
+            self._conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        self.server_thread.request_close(self)
+        self._dispatch(self._serv.on_disconnect, self)
+
+
+class SelectorServer(smconn.SMThread):
+    """ Server handling all his connections in one thread """
+
+    RECV_SIZE = 65536
+
+    def __init__(self, server, ip, port):
+        smconn.SMThread.__init__(self, server, ip, port)
+
+        self._socket = self.bind_socket()
+        self._socket.setblocking(False)
+
+        self._selector = selectors.DefaultSelector()
+        self._continue = True
+        self.loop_thread_id = None
+        self.clients = set()
+
+        # Used by the other threads to wake up the selector
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._lock = threading.Lock()
+        self._pending_flush = set()
+        self._pending_close = set()
+
+    def run(self):
+        self._socket.listen(self.backlog)
+        self._selector.register(self._socket, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ, self._wakeup)
+        self.loop_thread_id = threading.get_ident()
+
+        while self._continue:
+            for key, mask in self._selector.select(timeout=0.5):
+                key.data(mask)
+
+        for conn in list(self.clients):
+            conn.close()
+
+        self._selector.close()
+        self._socket.close()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+        smconn.SMThread.run(self)
+
+    def _accept(self, _mask):
+        for _ in range(self.backlog):
+            try:
+                sock, addr = self._socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as err:
+                self.log.error("Unable to accept a connection: %s", err)
+                return
+
+            sock.setblocking(False)
+            ip, port = addr[:2]
+            conn = SelectorConn(self.server, ip, port, sock, self)
+
+            self.clients.add(conn)
+            self._selector.register(
+                conn,
+                selectors.EVENT_READ,
+                functools.partial(self._on_client_event, conn)
+            )
+            conn._dispatch(self.server.add_connection, conn) #pylint: disable=protected-access
+
+    def _on_client_event(self, conn, mask):
+        if mask & selectors.EVENT_READ:
+            conn.on_readable()
+
+        if mask & selectors.EVENT_WRITE and not conn.closed:
+            if conn.on_writable() and not conn.closed:
+                self._set_events(conn, selectors.EVENT_READ)
+
+    def _set_events(self, conn, events):
+        key = self._selector.get_key(conn)
+        if key.events != events:
+            self._selector.modify(conn, events, key.data)
+
+    def _in_loop(self):
+        return threading.get_ident() == self.loop_thread_id
+
+    def _wake(self):
+        try:
+            self._wakeup_writer.send(b"\0")
+        except OSError:
+            pass
+
+    def _wakeup(self, _mask):
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+        with self._lock:
+            to_close, self._pending_close = self._pending_close, set()
+            to_flush, self._pending_flush = self._pending_flush, set()
+
+        for conn in to_close:
+            self._close(conn)
+
+        for conn in to_flush:
+            self._flush(conn)
+
+    def request_flush(self, conn):
+        """ Send the data queued for the connection, from the selector thread """
+
+        if self._in_loop():
+            self._flush(conn)
+            return
+
+        with self._lock:
+            wake = not self._pending_flush and not self._pending_close
+            self._pending_flush.add(conn)
+
+        if wake:
+            self._wake()
+
+    def _flush(self, conn):
+        if conn.closed:
+            return
+
+        if not conn.on_writable() and not conn.closed:
+            self._set_events(conn, selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+    def request_close(self, conn):
+        """ Close the socket of the connection, from the selector thread """
+
+        if self._in_loop() or not self.is_alive():
+            self._close(conn)
+            return
+
+        with self._lock:
+            wake = not self._pending_flush and not self._pending_close
+            self._pending_close.add(conn)
+
+        if wake:
+            self._wake()
+
+    def _close(self, conn):
+        self.clients.discard(conn)
+
+        try:
+            self._selector.unregister(conn)
+        except (KeyError, ValueError):
+            pass
+
+        conn._conn.close() #pylint: disable=protected-access
+
+    def stop(self):
+        smconn.SMThread.stop(self)
+        self._continue = False
+        self._wake()
@@ -1,11 +1,168 @@
 """ Classic socket client module """
 
+import selectors
 import socket
-from threading import Thread
+from threading import Lock, Thread
 
 from smserver.smutils import smconn
+from smserver.smutils import smframer
+
+# Max number of buffers given to sendmsg
+IOV_MAX = 1024
+
+# Send without blocking, even if the socket is in blocking mode (the
+# reading thread of the connection block on recv)
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0)
+
+def sendmsg_nonblocking(sock, buffers):
+    """ Send as much of the buffers as the socket can take without blocking.
+
+    Return the list of the buffers (or end of buffer) not sent.
+    """
+
+    buffers = [buf for buf in buffers if buf]
+    start = 0
+    while start < len(buffers):
+        try:
+            if hasattr(sock, "sendmsg"):
+                sent = sock.sendmsg(buffers[start:start + IOV_MAX], [], MSG_DONTWAIT)
+            else:
+                sent = sock.send(buffers[start], MSG_DONTWAIT)
+        except (BlockingIOError, InterruptedError):
+            break
+
+        while sent:
+            size = len(buffers[start])
+            if sent >= size:
+                sent -= size
+                start += 1
+            else:
+                buffers[start] = memoryview(buffers[start])[sent:]
+                sent = 0
+
+    return buffers[start:]
+
+class SocketWriter(Thread):
+    """ Thread sending the data the classic connections couldn't send directly.
+
+    A single writer is shared by all the connections: it waits for their
+    sockets to be writable, and drain their outbound queue.
+    """
+
+    def __init__(self):
+        Thread.__init__(self)
+        self.daemon = True
+
+        self._selector = selectors.DefaultSelector()
+
+        # Used by the other threads to add or remove a connection
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._lock = Lock()
+        self._to_add = set()
+        self._to_remove = set()
+
+        # connection -> file descriptor registered
+        self._registered = {}
+
+    def add(self, conn):
+        """ Send the data of the connection when its socket is writable """
+
+        self._request(self._to_add, conn)
+
+    def remove(self, conn):
+        """ Stop watching a connection (closed) """
+
+        self._request(self._to_remove, conn)
+
+    def _request(self, requests, conn):
+        with self._lock:
+            requests.add(conn)
+
+        try:
+            self._wakeup_writer.send(b"\0")
+        except OSError:
+            pass
+
+    def run(self):
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ)
+
+        while True:
+            for key, _ in self._selector.select():
+                if key.fileobj is self._wakeup_reader:
+                    self._wakeup()
+                    continue
+
+                conn = key.data
+                try:
+                    pending = conn.on_writable()
+                except OSError:
+                    pending = False
+
+                if not pending:
+                    self._unregister(conn)
+
+    def _wakeup(self):
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+        with self._lock:
+            to_add, self._to_add = self._to_add, set()
+            to_remove, self._to_remove = self._to_remove, set()
+
+        for conn in to_remove:
+            self._unregister(conn)
+
+        for conn in to_add - to_remove:
+            if conn in self._registered:
+                continue
+
+            try:
+                fd = conn.fileno()
+                self._selector.register(fd, selectors.EVENT_WRITE, conn)
+            except (KeyError, ValueError, OSError):
+                continue
+
+            self._registered[conn] = fd
+
+    def _unregister(self, conn):
+        fd = self._registered.pop(conn, None)
+        if fd is None:
+            return
+
+        try:
+            self._selector.unregister(fd)
+        except (KeyError, ValueError):
+            pass
+
+_WRITER = None
+_WRITER_LOCK = Lock()
+
+def get_writer():
+    """ The writer shared by all the classic connections, started on demand """
+
+    global _WRITER #pylint: disable=global-statement
+
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = SocketWriter()
+            _WRITER.start()
+
+        return _WRITER
 
 class SocketConn(smconn.StepmaniaConn, Thread):
+    """ Connection of the classic server.
+
+    Each connection has a thread blocking on the socket to read its packets.
+    The data are sent without blocking by the thread flushing the queue;
+    what the socket can't take yet is sent by the shared SocketWriter, so a
+    client which doesn't read never blocks the broadcasting threads.
+    """
+
     ENCODING = "binary"
 
     def __init__(self, serv, ip, port, conn):
@@ -13,56 +170,106 @@ class SocketConn(smconn.StepmaniaConn, Thread):
         smconn.StepmaniaConn.__init__(self, serv, ip, port)
         self._conn = conn
 
+        # Held by the thread currently sending, and the buffers partially
+        # sent waiting for the socket to be writable
+        self._write_lock = Lock()
+        self._unsent = []
+
+    def fileno(self):
+        return self._conn.fileno()
+
     def received_data(self):
-        full_data = b""
-        size = None
-        data_left = b""
+        framer = smframer.SMFramer()
 
         while True:
-            if len(data_left) > 0:
-                data = data_left
-                data_left = b""
-            else:
-                try:
-                    data = self._conn.recv(8192)
-                except socket.error:
-                    yield None
-                    continue
+            try:
+                data = self._conn.recv(8192)
+            except socket.error:
+                yield None
+                continue
 
             if data == b'':
                 yield None
                 continue
 
-            if not size:
-                if len(data) < 5:
-                    self.log.info("packet %s drop: to short", data)
-                    continue
+            try:
+                yield from framer.feed(data)
+            except smframer.FrameTooLarge as err:
+                self.log.info("connection %s closed: %s", self.ip, err)
+                yield None
 
-                full_data = data[:4]
-                data = data[4:]
-                size = int.from_bytes(full_data[:4], byteorder='big')
+    def send_data(self, data):
+        """ Queue the data, they are never sent directly """
 
-            if len(data) < size - len(full_data):
-                full_data += data
-                continue
+        self.queue_data(data)
 
-            payload_size = len(full_data) - 4 + size
-            full_data += data[:payload_size]
+    def flush(self):
+        """ Send the queued data without blocking.
 
-            yield full_data
+        Only one thread writes at a time: if the socket is already being
+        written, the data stay in the queue and are sent by the writing
+        thread before it releases the lock. Once the socket is full, the
+        rest is sent by the writer thread.
+        """
 
-            data_left = data[payload_size:]
-            full_data = b""
-            size = None
+        while self.outbound:
+            if not self._write_lock.acquire(blocking=False):
+                return
 
-    def send_data(self, data):
-        with self.mutex:
             try:
-                self._conn.sendall(data)
-            except OSError:
-                self.close()
+                # The writer is waiting for the socket to be writable
+                if self._unsent:
+                    return
+
+                if self._send_queued():
+                    get_writer().add(self)
+                    return
+            finally:
+                self._write_lock.release()
+
+    def on_writable(self):
+        """ Called by the writer when the socket is writable, return True
+        while data are waiting """
+
+        with self._write_lock:
+            if self._send_queued():
+                return True
+
+        # Data queued while sending
+        self.flush()
+        return False
+
+    def _send_queued(self):
+        """ Send what the socket can take, return True if data are left.
+
+        The write lock must be held.
+        """
+
+        datas = self._unsent + self.outbound.pop_all()
+        if not datas:
+            return False
+
+        try:
+            self._unsent = sendmsg_nonblocking(self._conn, datas)
+        except OSError:
+            self._unsent = []
+            self.outbound.clear()
+            self.shutdown()
+            return False
+
+        return bool(self._unsent)
+
+    def shutdown(self):
+        try:
+            self._conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
 
     def close(self):
+        # Before closing the socket, its file descriptor can then be reused
+        if _WRITER is not None:
+            _WRITER.remove(self)
+
         self._conn.close()
         smconn.StepmaniaConn.close(self)
 
@@ -70,14 +277,13 @@ class SocketServer(smconn.SMThread):
     def __init__(self, server, ip, port):
         smconn.SMThread.__init__(self, server, ip, port)
 
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._socket.bind((self.ip, self.port))
-        self._socket.listen(5)
+        self._socket = self.bind_socket()
         self._continue = True
         self._connections = []
 
     def run(self):
+        self._socket.listen(self.backlog)
+
         while self._continue:
             try:
                 conn, addr = self._socket.accept()
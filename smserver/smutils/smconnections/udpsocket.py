@@ -1,41 +1,64 @@
 """ UDP socket handler"""
 
 import socket
-from threading import Thread
+from threading import Lock
 
 from smserver.smutils import smconn
 from smserver.smutils.smpacket import smcommand
 
-class SocketConn(smconn.StepmaniaConn, Thread):
+class SocketConn(smconn.StepmaniaConn):
+    """ A datagram received by the UDP server.
+
+    The reply is sent through the socket of the server, so the client receive
+    it from the port he sent his datagram to.
+    """
+
+    __slots__ = ("_data", "_sock")
+
     ENCODING = "binary"
     ALLOWED_PACKET = [smcommand.SMClientCommand.NSCFormatted]
 
-    def __init__(self, serv, ip, port, data):
-        Thread.__init__(self)
+    # One packet by datagram
+    COALESCE_WRITES = False
+
+    def __init__(self, serv, ip, port, data, sock):
         smconn.StepmaniaConn.__init__(self, serv, ip, port)
         self._data = data
+        self._sock = sock
 
     def received_data(self):
         yield self._data
 
     def send_data(self, data):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        sock.sendto(data, (self.ip, self.port))
+        try:
+            self._sock.sendto(data, (self.ip, self.port))
+        except OSError as err:
+            self.log.debug("Unable to send UDP data to %s: %s", self.ip, err)
 
     def close(self):
         pass
 
 
 class UDPServer(smconn.SMThread):
+    """ UDP server, used for the discovery of the server.
+
+    The datagrams are handled in the server thread, or in the handler
+    executor if there is one. At most MAX_PENDING datagrams wait in the
+    executor, the others are dropped.
+    """
+
+    MAX_PENDING = 64
+
     def __init__(self, server, ip, port):
         smconn.SMThread.__init__(self, server, ip, port)
 
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._socket.bind((self.ip, self.port))
+        self._socket = self.bind_socket(socket.SOCK_DGRAM)
         self._socket.settimeout(0.5)
         self._continue = True
 
+        self._lock = Lock()
+        self._pending = 0
+
     def run(self):
         while self._continue:
             try:
@@ -43,13 +66,45 @@ class UDPServer(smconn.SMThread):
             except socket.timeout:
                 continue
 
-            ip, port = addr
+            ip, port = addr[:2]
 
-            SocketConn(self.server, ip, port, data).start()
+            self.handle(SocketConn(self.server, ip, port, data, self._socket))
 
         self._socket.close()
         smconn.SMThread.run(self)
 
+    def handle(self, conn):
+        """ Handle the datagram, directly or in the handler executor """
+
+        if self.executor is None:
+            self._run(conn)
+            return
+
+        with self._lock:
+            if self._pending >= self.MAX_PENDING:
+                self.log.debug("UDP datagram from %s dropped: too many pending", conn.ip)
+                return
+
+            self._pending += 1
+
+        try:
+            self.executor.submit(conn.token, self._run_pending, conn)
+        except RuntimeError:
+            self._run_pending(conn)
+
+    def _run_pending(self, conn):
+        try:
+            self._run(conn)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _run(self, conn):
+        try:
+            conn.run()
+        except Exception: #pylint: disable=broad-except
+            self.log.exception("Error while handling UDP datagram from %s", conn.ip)
+
     def stop(self):
         smconn.SMThread.stop(self)
         self._continue = False
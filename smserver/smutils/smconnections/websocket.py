@@ -7,14 +7,19 @@ import websockets
 from smserver.smutils import smconn
 
 class WebSocketClient(smconn.StepmaniaConn):
+    __slots__ = ("websocket", "task", "loop", "_sender")
+
     ENCODING = "json"
 
-    def __init__(self, serv, ip, port, websocket, _path, loop):
-        smconn.StepmaniaConn.__init__(self, serv, ip, port)
+    def __init__(self, serv, ip, port, websocket, _path, loop, executor=None):
+        smconn.StepmaniaConn.__init__(self, serv, ip, port, executor)
         self.websocket = websocket
         self.task = None
         self.loop = loop
 
+        # Task sending the outbound queue
+        self._sender = None
+
     @asyncio.coroutine
     def run(self):
         while True:
@@ -22,15 +27,43 @@ class WebSocketClient(smconn.StepmaniaConn):
                 data = yield from self.websocket.recv()
             except websockets.ConnectionClosed:
                 break
-            self._on_data(data)
+            self._dispatch_data(data)
 
         self.close()
 
     def send_data(self, data):
+        # The packets can be sent from the handler executor or the watcher threads
+        self.loop.call_soon_threadsafe(self._send, data)
+
+    def _send(self, data):
         self.loop.create_task(self.websocket.send(data))
 
+    def flush(self):
+        self.loop.call_soon_threadsafe(self._start_sender)
+
+    def _start_sender(self):
+        if self._sender is None or self._sender.done():
+            self._sender = self.loop.create_task(self._send_queue())
+
+    @asyncio.coroutine
+    def _send_queue(self):
+        while True:
+            data = self.outbound.pop()
+            if data is None:
+                return
+
+            try:
+                yield from self.websocket.send(data)
+            except websockets.ConnectionClosed:
+                return
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(
+            lambda: self.loop.create_task(self.websocket.close())
+        )
+
     def close(self):
-        self._serv.on_disconnect(self)
+        self._dispatch(self._serv.on_disconnect, self)
         self.websocket.close()
 
 class WebSocketServer(smconn.SMThread):
@@ -48,9 +81,9 @@ class WebSocketServer(smconn.SMThread):
     @asyncio.coroutine
     def _accept_client(self, websocket, path=""):
         ip, port = websocket.remote_address
-        client = WebSocketClient(self.server, ip, port, websocket, path, self.loop)
+        client = WebSocketClient(self.server, ip, port, websocket, path, self.loop, self.executor)
 
-        self.server.add_connection(client)
+        client._dispatch(self.server.add_connection, client) #pylint: disable=protected-access
         try:
             yield from client.run()
         except Exception:
@@ -70,6 +103,7 @@ class WebSocketServer(smconn.SMThread):
                 self._accept_client,
                 host=self.ip,
                 port=self.port,
+                reuse_port=self.reuse_port,
                 loop=self.loop,
             )
         )
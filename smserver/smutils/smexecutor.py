@@ -0,0 +1,131 @@
+""" Executor module.
+
+Run the packets handling outside of the network threads, while keeping the
+packets of a room (or of a connection) in order.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock
+
+from smserver import logger
+
+
+class OrderedExecutor(object):
+    """ Thread pool which run the tasks of a same key in order.
+
+    Each key (a room or a connection token) has his own queue of tasks. A
+    queue is run by only one worker at a time, so two tasks of the same key
+    are never run concurrently nor out of order. The tasks of different keys
+    are run in parallel. With one worker, all the tasks are run by a
+    dedicated thread.
+
+    :Example:
+
+    >>> executor = OrderedExecutor(4)
+    >>> res = []
+    >>> for i in range(10):
+    ...     executor.submit("token", res.append, i)
+    >>> executor.shutdown()
+    >>> res
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+    >>> executor.stats["tasks"], executor.stats["pending"]
+    (10, 0)
+    """
+
+    log = logger.get_logger()
+
+    # Number of tasks run for a key before letting the other keys use the worker
+    BATCH_SIZE = 16
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = Lock()
+        self._idle = Condition(self._lock)
+        self._queues = {}
+        self._shutdown = False
+
+        # Metrics
+        self.tasks = 0
+        self.max_pending = 0
+        self._pending = 0
+
+    def submit(self, key, func, *args, **kwargs):
+        """ Run func(*args, **kwargs) after the other tasks of the given key """
+
+        task = (func, args, kwargs)
+
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot submit a task after shutdown")
+
+            self.tasks += 1
+            self._pending += 1
+
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append(task)
+                if len(queue) > self.max_pending:
+                    self.max_pending = len(queue)
+                return
+
+            self._queues[key] = deque((task,))
+
+        self._executor.submit(self._run, key)
+
+    def _run(self, key):
+        """ Run the tasks of a key, until his queue is empty """
+
+        for _ in range(self.BATCH_SIZE):
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    if not self._queues:
+                        self._idle.notify_all()
+                    return
+
+                func, args, kwargs = queue.popleft()
+                self._pending -= 1
+
+            try:
+                func(*args, **kwargs)
+            except Exception: #pylint: disable=broad-except
+                self.log.exception("Error while running %s for %s", func, key)
+
+        self._executor.submit(self._run, key)
+
+    def pending(self, key):
+        """ Number of tasks waiting to be run for the given key """
+
+        with self._lock:
+            return len(self._queues.get(key, ()))
+
+    @property
+    def stats(self):
+        """
+            Metrics of the executor: number of queues (keys with tasks waiting),
+            tasks waiting, max depth reached by a queue and tasks submitted.
+        """
+
+        with self._lock:
+            return {
+                "queues": len(self._queues),
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "tasks": self.tasks,
+            }
+
+    def shutdown(self, wait=True):
+        """ Stop accepting tasks. The tasks already submitted are run """
+
+        with self._lock:
+            self._shutdown = True
+
+            # A queue can be resubmitted after a batch, wait until they are all empty
+            while wait and self._queues:
+                self._idle.wait()
+
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,100 @@
+""" Framer module.
+
+Split a stream of bytes in stepmania packets. Each packet start with a 4 bytes
+header which is the size of the packet payload (big endian).
+"""
+
+import struct
+
+MAX_FRAME_SIZE = 1 << 20
+
+_HEADER = struct.Struct(">I")
+
+
+class FrameTooLarge(ValueError):
+    """ Raised when a frame is bigger than the maximum frame size allowed """
+
+
+class SMFramer(object):
+    """ Incremental framer of stepmania packets.
+
+    The received data is appended to a bytearray buffer and the complete frames
+    (header included) are returned as memoryviews of this buffer, without any
+    copy. The data consumed is only removed from the buffer once per call to
+    ``feed``.
+
+    :Example:
+
+    >>> framer = SMFramer()
+    >>> [bytes(frame) for frame in framer.feed(b'\\x00\\x00')]
+    []
+    >>> [bytes(frame) for frame in framer.feed(b'\\x00\\x01\\x54\\x00\\x00\\x00\\x01\\x55\\x00')]
+    [b'\\x00\\x00\\x00\\x01T', b'\\x00\\x00\\x00\\x01U']
+    >>> len(framer)
+    1
+    """
+
+    HEADER_SIZE = _HEADER.size
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+
+        self._buffer = bytearray()
+        self._start = 0
+
+    def __len__(self):
+        """ Number of bytes waiting for the end of their frame """
+
+        return len(self._buffer) - self._start
+
+    def feed(self, data):
+        """ Add the received data, and yield each frame completed.
+
+        Raise FrameTooLarge if a frame exceed the maximum frame size.
+        """
+
+        self._append(data)
+
+        buffer = self._buffer
+        view = memoryview(buffer)
+        end = len(buffer)
+
+        try:
+            while end - self._start >= self.HEADER_SIZE:
+                size = _HEADER.unpack_from(buffer, self._start)[0]
+                if size > self.max_frame_size:
+                    raise FrameTooLarge(
+                        "frame of %s bytes (max %s)" % (size, self.max_frame_size)
+                    )
+
+                frame_end = self._start + self.HEADER_SIZE + size
+                if frame_end > end:
+                    break
+
+                frame = view[self._start:frame_end]
+                self._start = frame_end
+                yield frame
+        finally:
+            del view
+            self._compact()
+
+    def _append(self, data):
+        try:
+            self._buffer += data
+        except BufferError:
+            # A previous frame is still referenced, it must stay valid
+            self._buffer = self._buffer + data
+
+    def _compact(self):
+        """ Remove the data already consumed from the buffer """
+
+        if not self._start:
+            return
+
+        try:
+            del self._buffer[:self._start]
+        except BufferError:
+            # A frame is still referenced, it must stay valid
+            self._buffer = self._buffer[self._start:]
+
+        self._start = 0
@@ -0,0 +1,265 @@
+""" Game state module.
+
+State of the song played by a connection, and of each of his players.
+"""
+
+import array
+import datetime
+
+
+def _clamp(value, maximum):
+    """ Bound a value received from a client to the size of its column """
+
+    if not value or value < 0:
+        return 0
+
+    return value if value < maximum else maximum
+
+
+class StepBuffer(object):
+    """ Append-only buffer of the steps (NSCGSU packets) of a player.
+
+    Each value is stored in an ``array.array`` column, and the aggregates
+    needed by the scoreboard and the game over (count of each stepid, max
+    combo, last score) are updated on each step. The values out of the
+    range of a column are bounded.
+
+    Indexing the buffer return the step as a dict, like before.
+
+    :Example:
+
+    >>> steps = StepBuffer()
+    >>> steps.append(stepid=8, grade=1, score=1500, combo=3, health=40, offset=20000, time=2500)
+    >>> steps.append(stepid=3, grade=2, score=1500, combo=0, health=30, offset=20000, time=3000)
+    >>> len(steps), steps.max_combo, steps.last_score, steps.count(8)
+    (2, 3, 1500, 1)
+    >>> steps[-1]["stepid"], steps[-1]["time"].total_seconds()
+    (3, 3.0)
+    >>> list(steps.rows())
+    [(1, 8, 1500, 3, 40, 2), (2, 3, 1500, 0, 30, 3)]
+    """
+
+    __slots__ = (
+        "stepid", "grade", "score", "combo", "health", "offset", "time",
+        "step_counts", "max_combo",
+    )
+
+    # name, array typecode and max value of each column. The time is in ms
+    COLUMNS = (
+        ("stepid", "B", 15),
+        ("grade", "B", 15),
+        ("score", "I", 2**32 - 1),
+        ("combo", "H", 2**16 - 1),
+        ("health", "H", 2**16 - 1),
+        ("offset", "H", 2**16 - 1),
+        ("time", "I", 2**32 - 1),
+    )
+
+    def __init__(self):
+        for name, typecode, _ in self.COLUMNS:
+            setattr(self, name, array.array(typecode))
+
+        # stepid -> number of steps
+        self.step_counts = array.array("I", [0]) * 16
+        self.max_combo = 0
+
+    def append(self, stepid, grade, score, combo, health, offset, time): #pylint: disable=too-many-arguments
+        """ Add a step, the time is the number of ms since the start of the song """
+
+        stepid = _clamp(stepid, 15)
+        combo = _clamp(combo, 2**16 - 1)
+
+        self.stepid.append(stepid)
+        self.grade.append(_clamp(grade, 15))
+        self.score.append(_clamp(score, 2**32 - 1))
+        self.combo.append(combo)
+        self.health.append(_clamp(health, 2**16 - 1))
+        self.offset.append(_clamp(offset, 2**16 - 1))
+        self.time.append(_clamp(time, 2**32 - 1))
+
+        self.step_counts[stepid] += 1
+        if combo > self.max_combo:
+            self.max_combo = combo
+
+    def __len__(self):
+        return len(self.stepid)
+
+    def __getitem__(self, index):
+        return {
+            "stepid": self.stepid[index],
+            "grade": self.grade[index],
+            "score": self.score[index],
+            "combo": self.combo[index],
+            "health": self.health[index],
+            "offset": self.offset[index],
+            "time": datetime.timedelta(milliseconds=self.time[index]),
+        }
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def count(self, stepid):
+        """ Number of steps with the given stepid """
+
+        return self.step_counts[stepid] if 0 <= stepid < len(self.step_counts) else 0
+
+    @property
+    def last_score(self):
+        """ Score of the last step (None without step) """
+
+        return self.score[-1] if self.score else None
+
+    @property
+    def last_grade(self):
+        """ Grade of the last step (None without step) """
+
+        return self.grade[-1] if self.grade else None
+
+    @property
+    def last_combo(self):
+        """ Combo of the last step (None without step) """
+
+        return self.combo[-1] if self.combo else None
+
+    def rows(self):
+        """ Iterate over the rows (grade, stepid, score, combo, health, time in
+        seconds) used by the stats codec """
+
+        for index in range(len(self)):
+            yield (
+                self.grade[index],
+                self.stepid[index],
+                self.score[index],
+                self.combo[index],
+                self.health[index],
+                self.time[index] // 1000,
+            )
+
+
+class PlayerGameState(object):
+    """ Game state of one player of a connection (player 0 or 1).
+
+    The values can also be accessed like a dict. The keys which are not
+    an attribute are stored apart, for the plugins which need to store their
+    own values.
+
+    :Example:
+
+    >>> state = PlayerGameState(feet=8, difficulty=3)
+    >>> state.feet, state["difficulty"]
+    (8, 3)
+    >>> "attack_metter" in state
+    False
+    >>> state["attack_metter"] = 10
+    >>> state.get("attack_metter")
+    10
+    """
+
+    __slots__ = ("data", "feet", "difficulty", "options", "best_score", "_extra")
+
+    ATTRIBUTES = frozenset(("data", "feet", "difficulty", "options", "best_score"))
+
+    def __init__(self, feet=None, difficulty=None, options=None, best_score=None):
+        self.data = StepBuffer()
+        self.feet = feet
+        self.difficulty = difficulty
+        self.options = options
+        self.best_score = best_score
+
+        # Only allocated if a plugin store a value
+        self._extra = None
+
+    def __getitem__(self, key):
+        if key in self.ATTRIBUTES:
+            return getattr(self, key)
+
+        if self._extra is None:
+            raise KeyError(key)
+
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.ATTRIBUTES:
+            setattr(self, key, value)
+            return
+
+        if self._extra is None:
+            self._extra = {}
+
+        self._extra[key] = value
+
+    def __contains__(self, key):
+        if key in self.ATTRIBUTES:
+            return True
+
+        return self._extra is not None and key in self._extra
+
+    def get(self, key, default=None):
+        """ Return the value of the key, or default if it's not set """
+
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+class GameState(object):
+    """ State of the song played by a connection.
+
+    ``state[0]`` and ``state[1]`` are the states of the two players. The song
+    is started when ``start_at`` is set.
+
+    :Example:
+
+    >>> import datetime
+    >>> state = GameState()
+    >>> "start_at" in state, state[1].feet
+    (False, None)
+    >>> state = GameState(start_at=datetime.datetime(2017, 1, 1), players=(PlayerGameState(feet=4),))
+    >>> "start_at" in state, state[0]["feet"], 1 in state
+    (True, 4, False)
+    """
+
+    __slots__ = ("players", "start_at", "song_id", "options", "course_title")
+
+    ATTRIBUTES = frozenset(("start_at", "song_id", "options", "course_title"))
+
+    def __init__(self, start_at=None, song_id=None, options=None, course_title=None, players=None):
+        if players is None:
+            players = (PlayerGameState(), PlayerGameState())
+
+        self.players = players
+        self.start_at = start_at
+        self.song_id = song_id
+        self.options = options
+        self.course_title = course_title
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self.players[key]
+
+        if key not in self.ATTRIBUTES or getattr(self, key) is None:
+            raise KeyError(key)
+
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.ATTRIBUTES:
+            raise KeyError(key)
+
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        if isinstance(key, int):
+            return 0 <= key < len(self.players)
+
+        return key in self.ATTRIBUTES and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        """ Return the value of the key, or default if it's not set """
+
+        try:
+            return self[key]
+        except (KeyError, IndexError):
+            return default
@@ -3,9 +3,20 @@
 This module provide all the command available for stepmania packet
 """
 
-from enum import Enum
+from enum import Enum, EnumMeta
 
-class ParentCommand(Enum):
+# Lookup tables by command family, reset each time a new family is declared.
+_LOOKUP_TABLES = {}
+
+class _CommandMetaclass(EnumMeta):
+    """ Reset the lookup tables when a new family of commands is declared """
+
+    def __new__(mcs, *args, **kwargs):
+        cls = super().__new__(mcs, *args, **kwargs)
+        _LOOKUP_TABLES.clear()
+        return cls
+
+class ParentCommand(Enum, metaclass=_CommandMetaclass):
     """ Enum class with can be inherited.
 
     It allow to group Enumerable in the came category
@@ -13,19 +24,57 @@ class ParentCommand(Enum):
 
     @classmethod
     def get(cls, value, default=None):
-        """ Search for a value in this Enum and his children """
-        try:
-            return cls(value)
-        except ValueError:
-            pass
+        """ Search for a value in this Enum and his children
+
+        :Example:
 
-        for klass in cls.__subclasses__(): #pylint: disable=maybe-no-member
+        >>> SMCommand.get(5)
+        <SMClientCommand.NSCGSU: 5>
+        >>> SMCommand.get(133)
+        <SMServerCommand.NSCGSU: 133>
+        >>> print(SMCommand.get(-1))
+        None
+        """
+
+        byte_table, values = cls._lookup_table()
+
+        if isinstance(value, int) and 0 <= value < 256:
+            command = byte_table[value]
+        else:
             try:
-                return klass(value)
-            except ValueError:
-                pass
+                command = values.get(value)
+            except TypeError:
+                command = None
+
+        if command is None:
+            return default
+
+        return command
+
+    @classmethod
+    def _lookup_table(cls):
+        """ Build (once) the table of the commands available in this Enum and his children
+
+        Return a 256 entries tuple (one by byte value) and a dict for all the values.
+        """
+
+        table = _LOOKUP_TABLES.get(cls)
+        if table is not None:
+            return table
+
+        byte_table = [None] * 256
+        values = {}
+        for klass in [cls] + cls.__subclasses__(): #pylint: disable=maybe-no-member
+            for command in klass:
+                values.setdefault(command.value, command)
+
+                if isinstance(command.value, int) and 0 <= command.value < 256:
+                    if byte_table[command.value] is None:
+                        byte_table[command.value] = command
 
-        return default
+        table = (tuple(byte_table), values)
+        _LOOKUP_TABLES[cls] = table
+        return table
 
 class SMCommand(ParentCommand):
     """ Enum which contains all the Stepmania commands """
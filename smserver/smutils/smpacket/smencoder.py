@@ -4,10 +4,24 @@ Provide method to encode dict in correct stepmania payload
 """
 
 import abc
+import importlib
 import json
+import re
+import struct
 
 from enum import Enum
 
+_NULL_BYTE = re.compile(b'\x00')
+
+def _find_null(buffer, offset):
+    """ Return the position of the next null byte in the buffer (-1 if not found)
+
+    Work on bytes, bytearray and memoryview.
+    """
+
+    match = _NULL_BYTE.search(buffer, offset)
+    return match.start() if match else -1
+
 class SMPayloadTypeAbstract(metaclass=abc.ABCMeta):
     """
         Parent class for declaring new type of data.
@@ -38,6 +52,21 @@ class SMPayloadTypeAbstract(metaclass=abc.ABCMeta):
 
         return payload, None
 
+    @classmethod
+    def decode_from(cls, buffer, offset, opt=None):
+        """
+            Decode the data starting at the given offset of the buffer.
+
+            Take a buffer (bytes, bytearray or memoryview), an offset and the
+            option and return the offset following the data and the data.
+
+            Override it to avoid copying the remaining payload, by default it
+            use the decode method.
+        """
+
+        payload, data = cls.decode(bytes(buffer[offset:]), opt)
+        return len(buffer) - len(payload), data
+
 class SMPayloadTypeINT(SMPayloadTypeAbstract):
     """
         INT data encode in x bytes.
@@ -93,13 +122,27 @@ class SMPayloadTypeINT(SMPayloadTypeAbstract):
 
         """
 
+        offset, data = SMPayloadTypeINT.decode_from(payload, 0, size)
+        return payload[offset:], data
+
+    @staticmethod
+    def decode_from(buffer, offset, size=1):
+        """
+            Decode the integer at the given offset of the buffer
+
+            :Example:
+
+            >>> SMPayloadTypeINT.decode_from(memoryview(b"\\x00\\x01\\x02"), 1, size=2)
+            (3, 258)
+        """
+
         if not size:
             size = 1
 
-        if len(payload) < size:
-            return payload, None
+        if len(buffer) - offset < size:
+            return offset, None
 
-        return payload[size:], int.from_bytes(payload[:size], byteorder='big')
+        return offset + size, int.from_bytes(buffer[offset:offset + size], byteorder='big')
 
 class SMPayloadTypeINTLIST(SMPayloadTypeAbstract):
     """
@@ -162,14 +205,29 @@ class SMPayloadTypeINTLIST(SMPayloadTypeAbstract):
             (b'\\x01', None)
         """
 
+        offset, data = SMPayloadTypeINTLIST.decode_from(payload, 0, opt)
+        return payload[offset:], data
+
+    @staticmethod
+    def decode_from(buffer, offset, opt=None):
+        """
+            Decode the int list at the given offset of the buffer
+
+            :Example:
+
+            >>> SMPayloadTypeINTLIST.decode_from(memoryview(b"\\x00\\x02\\x05"), 1, opt=(1, 2))
+            (3, [2, 5])
+        """
+
         if not opt or len(opt) != 2:
             opt = (1, 1)
 
-        if len(payload) < opt[0]*opt[1]:
-            return payload, None
+        end = offset + opt[0]*opt[1]
+        if len(buffer) < end:
+            return offset, None
 
-        return payload[opt[0]*opt[1]:], [int.from_bytes(payload[i:i+opt[0]], byteorder='big')
-                                         for i in range(0, opt[0]*opt[1], opt[0])]
+        return end, [int.from_bytes(buffer[i:i+opt[0]], byteorder='big')
+                     for i in range(offset, end, opt[0])]
 
 
 class SMPayloadTypeNT(SMPayloadTypeAbstract):
@@ -214,11 +272,25 @@ class SMPayloadTypeNT(SMPayloadTypeAbstract):
         """
 
 
-        tmp = payload.split(b'\x00', 1)
-        if len(tmp) < 2:
-            return payload, None
+        offset, data = SMPayloadTypeNT.decode_from(payload, 0)
+        return payload[offset:], data
 
-        return tmp[1], tmp[0].decode('utf-8')
+    @staticmethod
+    def decode_from(buffer, offset, _opt=None):
+        """
+            Decode the null terminated string at the given offset of the buffer
+
+            :Example:
+
+            >>> SMPayloadTypeNT.decode_from(memoryview(b"\\x00nt_string\\x00remaining"), 1)
+            (11, 'nt_string')
+        """
+
+        end = _find_null(buffer, offset)
+        if end < 0:
+            return offset, None
+
+        return end + 1, str(buffer[offset:end], 'utf-8')
 
 class SMPayloadTypeNTLIST(SMPayloadTypeAbstract):
     """
@@ -287,20 +359,36 @@ class SMPayloadTypeNTLIST(SMPayloadTypeAbstract):
 
         """
 
-        if size:
-            tmp = payload.split(b'\x00', size)
-        else:
-            tmp = payload.split(b'\x00')
+        offset, data = SMPayloadTypeNTLIST.decode_from(payload, 0, size)
+        return payload[offset:], data
+
+    @staticmethod
+    def decode_from(buffer, offset, size=None):
+        """
+            Decode the list of null terminated strings at the given offset of the buffer
 
-        remaining_payload = tmp.pop()
+            :Example:
 
-        if size and len(tmp) < size:
-            tmp.extend([b'' for _ in range(size - len(tmp))])
+            >>> SMPayloadTypeNTLIST.decode_from(memoryview(b"string1\\x00string2\\x00remaining"), 0)
+            (16, ['string1', 'string2'])
+        """
 
-        if not tmp:
-            return payload, None
+        res = []
+        while not size or len(res) < size:
+            end = _find_null(buffer, offset)
+            if end < 0:
+                break
 
-        return remaining_payload, [t.decode('utf-8') for t in tmp]
+            res.append(str(buffer[offset:end], 'utf-8'))
+            offset = end + 1
+
+        if size and len(res) < size:
+            res.extend(['' for _ in range(size - len(res))])
+
+        if not res:
+            return offset, None
+
+        return offset, res
 
 class SMPayloadTypeLIST(SMPayloadTypeAbstract):
     """
@@ -324,15 +412,20 @@ class SMPayloadTypeLIST(SMPayloadTypeAbstract):
 
     @staticmethod
     def decode(payload, opt=None):
+        offset, data = SMPayloadTypeLIST.decode_from(memoryview(payload), 0, opt)
+        return payload[offset:], data
+
+    @staticmethod
+    def decode_from(buffer, offset, opt=None):
         if not opt:
             opt = [1, []]
 
         res = []
         for _ in range(0, opt[0]):
-            payload, tmp = BinaryEncoder.decode(payload, opt[1])
+            offset, tmp = BinaryEncoder.decode_from(buffer, offset, opt[1])
             res.append(tmp)
 
-        return payload, res
+        return offset, res
 
 class SMPayloadTypeMAP(SMPayloadTypeAbstract):
     """
@@ -357,11 +450,19 @@ class SMPayloadTypeMAP(SMPayloadTypeAbstract):
         if not opt:
             opt = [0, {}]
 
+        offset, data = SMPayloadTypeMAP.decode_from(memoryview(payload), 0, opt)
+        return payload[offset:], data
+
+    @staticmethod
+    def decode_from(buffer, offset, opt=None):
+        if not opt:
+            opt = [0, {}]
+
         size, _, sizeopt = opt[1].get(opt[0], (None, None, None))
         if not size:
-            return payload, None
+            return offset, None
 
-        return size.value.decode(payload, sizeopt)
+        return size.value.decode_from(buffer, offset, sizeopt)
 
 class SMPayloadTypePacket(SMPayloadTypeAbstract):
     """
@@ -377,14 +478,21 @@ class SMPayloadTypePacket(SMPayloadTypeAbstract):
 
     @staticmethod
     def decode(payload, opt=None):
+        offset, data = SMPayloadTypePacket.decode_from(memoryview(payload), 0, opt)
+        return payload[offset:], data
+
+    @staticmethod
+    def decode_from(buffer, offset, opt=None):
+        """ The packet take all the remaining buffer """
+
         if not opt:
-            return payload, None
+            return offset, None
 
-        tmp = opt.parse_data(payload)
+        tmp = opt.parse_data(buffer[offset:])
         if not tmp:
-            return payload, None
+            return offset, None
 
-        return payload[len(tmp.payload):], tmp
+        return len(buffer), tmp
 
 
 class SMPayloadType(Enum):
@@ -402,6 +510,51 @@ class SMPayloadType(Enum):
     LIST = SMPayloadTypeLIST
     MAP = SMPayloadTypeMAP
 
+class NibbleCodec(object):
+    """
+        Encode two 4 bits integers (MSN and LSN) in one byte.
+    """
+
+    @staticmethod
+    def pack(msn, lsn):
+        """
+            Pack the most and the least significant nibbles in a byte
+
+            :Example:
+
+            >>> NibbleCodec.pack(1, 4)
+            20
+
+            >>> # Values are clamped between 0 and 15
+            >>> NibbleCodec.pack(20, None)
+            240
+        """
+
+        if not msn or msn < 0:
+            msn = 0
+        elif msn > 0x0f:
+            msn = 0x0f
+
+        if not lsn or lsn < 0:
+            lsn = 0
+        elif lsn > 0x0f:
+            lsn = 0x0f
+
+        return msn << 4 | lsn
+
+    @staticmethod
+    def unpack(byte):
+        """
+            Unpack a byte in (most significant nibble, least significant nibble)
+
+            :Example:
+
+            >>> NibbleCodec.unpack(20)
+            (1, 4)
+        """
+
+        return byte >> 4, byte & 0x0f
+
 class Encoder(metaclass=abc.ABCMeta):
     """ Base class for encoder module """
 
@@ -434,18 +587,17 @@ class BinaryEncoder(Encoder):
     def encode(cls, values, payload_option, _command=None):
         """ Encode data in binary format """
 
-        payload = b""
-        byte = ""
+        payload = bytearray()
+        msn = 0
 
         for size, name, opt in payload_option:
             if size == SMPayloadType.MSN:
-                byte += cls._to_bin_str(values.get(name, 0))
+                msn = values.get(name, 0)
                 continue
 
             if size == SMPayloadType.LSN:
-                byte += cls._to_bin_str(values.get(name, 0))
-                payload += bytes([int(byte, 2)])
-                byte = ""
+                payload.append(NibbleCodec.pack(msn, values.get(name, 0)))
+                msn = 0
                 continue
 
             res = size.value.encode(
@@ -456,28 +608,40 @@ class BinaryEncoder(Encoder):
             if not res:
                 continue
 
-            payload += res
+            payload.extend(res)
 
-        return payload
+        return bytes(payload)
 
     @classmethod
     def decode(cls, payload, payload_option):
         """ Decode data in binary format """
 
+        offset, opts = cls.decode_from(memoryview(payload), 0, payload_option)
+        return payload[offset:], opts
+
+    @classmethod
+    def decode_from(cls, buffer, offset, payload_option):
+        """ Decode data in binary format, starting at the given offset of the buffer
+
+        Return the offset following the data and the decoded values.
+        """
+
         opts = {}
         for size, name, opt in payload_option:
             if size == SMPayloadType.MSN:
-                opts[name] = int(cls._to_bin_str(payload[0], 8)[:4], 2)
+                opts[name] = NibbleCodec.unpack(buffer[offset])[0]
                 continue
 
             if size == SMPayloadType.LSN:
-                opts[name] = int(cls._to_bin_str(payload[0], 8)[4:], 2)
-                payload = payload[1:]
+                opts[name] = NibbleCodec.unpack(buffer[offset])[1]
+                offset += 1
                 continue
 
-            payload, opts[name] = size.value.decode(payload, cls._replace_from_options(opts, opt))
+            offset, opts[name] = size.value.decode_from(
+                buffer, offset, cls._replace_from_options(opts, opt)
+            )
 
-        return payload, opts
+        return offset, opts
 
     @classmethod
     def _replace_from_options(cls, options, value):
@@ -492,24 +656,512 @@ class BinaryEncoder(Encoder):
 
         return value
 
+
+_STRUCT_FORMATS = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+def _resolver(opt):
+    """ Return a function which resolve the given option against the values.
+
+    A string option is a reference to another field of the payload.
+    """
+
+    if isinstance(opt, str):
+        return lambda values: values.get(opt)
+
+    return lambda _values: opt
+
+class BinaryCodec(object):
+    """ Binary encoder compiled for a given payload option.
+
+    The payload option is only walked once, when the codec is created.
+    Consecutive fixed width integers (and MSN/LSN pairs) are merged in a single
+    ``struct`` format, the others fields get a specialised function.
+
+    :Example:
+
+    >>> codec = BinaryCodec([
+    ...     (SMPayloadType.MSN, "player_id", None),
+    ...     (SMPayloadType.LSN, "step_id", None),
+    ...     (SMPayloadType.INT, "combo", 2),
+    ...     (SMPayloadType.NT, "name", None),
+    ... ])
+    >>> codec.encode({"player_id": 1, "step_id": 4, "combo": 300, "name": "test"})
+    b'\\x14\\x01,test\\x00'
+
+    >>> codec.decode(b'\\x14\\x01,test\\x00remaining_payload')
+    (b'remaining_payload', {'player_id': 1, 'step_id': 4, 'combo': 300, 'name': 'test'})
+    """
+
+    def __init__(self, payload_option):
+        self.payload_option = payload_option
+
+        self._encoders = []
+        self._decoders = []
+
+        # (format, nb fields, to_row, from_row) if the payload is only made of
+        # fixed width integers. Used to encode a list of records in one struct
+        self._record = None
+
+        self._compile(payload_option)
+        if len(self._encoders) != 1:
+            self._record = None
+
+    def encode(self, values):
+        """ Encode the values in binary format """
+
+        buffer = bytearray()
+        self.encode_into(values, buffer)
+        return bytes(buffer)
+
+    def decode(self, payload):
+        """ Decode the payload, return the remaining payload and the values """
+
+        offset, opts = self.decode_from(memoryview(payload), 0)
+        return payload[offset:], opts
+
+    def decode_from(self, buffer, offset):
+        """ Decode the buffer starting at the given offset.
+
+        Return the offset following the data and the values. Nothing is
+        copied except the decoded values.
+        """
+
+        opts = {}
+        offset = self._decode_into(buffer, offset, opts)
+        return offset, opts
+
+    def encode_into(self, values, buffer):
+        """ Encode the values at the end of the given bytearray """
+
+        for encoder in self._encoders:
+            encoder(values, buffer)
+
+    def _decode_into(self, buffer, offset, opts):
+        for decoder in self._decoders:
+            offset = decoder(buffer, offset, opts)
+
+        return offset
+
+    def _compile(self, payload_option):
+        run = []
+        fields = list(payload_option)
+        idx = 0
+
+        while idx < len(fields):
+            size, name, opt = fields[idx]
+            idx += 1
+
+            if size == SMPayloadType.MSN:
+                low_name = None
+                if idx < len(fields) and fields[idx][0] == SMPayloadType.LSN:
+                    low_name = fields[idx][1]
+                    idx += 1
+
+                run.append((True, "B", name, low_name))
+                continue
+
+            if size == SMPayloadType.LSN:
+                run.append((True, "B", None, name))
+                continue
+
+            if size == SMPayloadType.INT and (opt is None or isinstance(opt, int)):
+                fmt = _STRUCT_FORMATS.get(opt or 1)
+                if fmt:
+                    run.append((False, fmt, name, 2**((opt or 1) * 8) - 1))
+                    continue
+
+            self._compile_run(run)
+            run = []
+            self._compile_field(size, name, opt)
+
+        self._compile_run(run)
+
+    def _compile_run(self, run):
+        """ Compile a list of fixed width integers in one struct """
+
+        if not run:
+            return
+
+        fmt = "".join(fmt for _, fmt, _, _ in run)
+        packer = struct.Struct(">" + fmt)
+        items = [(nibble, name, extra) for nibble, _, name, extra in run]
+        pack_nibbles = NibbleCodec.pack
+
+        def to_row(values, row):
+            for nibble, name, extra in items:
+                if nibble:
+                    row.append(pack_nibbles(values.get(name), values.get(extra)))
+                    continue
+
+                value = values.get(name)
+                if not value:
+                    value = 0
+                elif value > extra:
+                    value = extra
+
+                row.append(value)
+
+        def from_row(row, idx, opts):
+            for nibble, name, extra in items:
+                value = row[idx]
+                idx += 1
+
+                if not nibble:
+                    opts[name] = value
+                    continue
+
+                if name is not None:
+                    opts[name] = value >> 4
+                if extra is not None:
+                    opts[extra] = value & 0x0f
+
+        def encode(values, buffer):
+            row = []
+            to_row(values, row)
+            buffer.extend(packer.pack(*row))
+
+        fallback = BinaryCodec([])
+        for nibble, int_fmt, name, extra in run:
+            if nibble:
+                fallback._decoders.append(self._nibble_decoder(name, extra)) #pylint: disable=protected-access
+                continue
+
+            fallback._compile_field(SMPayloadType.INT, name, struct.calcsize(">" + int_fmt)) #pylint: disable=protected-access
+
+        def decode(buffer, offset, opts):
+            if len(buffer) - offset < packer.size:
+                return fallback._decode_into(buffer, offset, opts) #pylint: disable=protected-access
+
+            from_row(packer.unpack_from(buffer, offset), 0, opts)
+            return offset + packer.size
+
+        if not self._encoders:
+            self._record = (fmt, len(items), to_row, from_row)
+
+        self._encoders.append(encode)
+        self._decoders.append(decode)
+
     @staticmethod
-    def _to_bin_str(number, size=4):
-        number = "{0:b}".format(number)
-        if len(number) == size:
-            return number
+    def _nibble_decoder(msn_name, lsn_name):
+        def decode(buffer, offset, opts):
+            if offset >= len(buffer):
+                msn, lsn = None, None
+            else:
+                msn, lsn = NibbleCodec.unpack(buffer[offset])
 
-        if len(number) > size:
-            return "1"*size
+            if msn_name is not None:
+                opts[msn_name] = msn
+            if lsn_name is not None:
+                opts[lsn_name] = lsn
 
-        return "0"*(size-len(number)) + number
+            return offset + 1
 
+        return decode
 
-class JSONEncoder(Encoder):
-    """ JSON encoder to encode data in the stepmania protocol """
+    def _compile_field(self, size, name, opt):
+        compiler = {
+            SMPayloadType.NT: self._compile_nt,
+            SMPayloadType.INTLIST: self._compile_intlist,
+            SMPayloadType.LIST: self._compile_list,
+            SMPayloadType.MAP: self._compile_map,
+            SMPayloadType.PACKET: self._compile_packet,
+        }.get(size, self._compile_generic)
+
+        encode, decode = compiler(size, name, opt)
+        self._encoders.append(encode)
+        self._decoders.append(decode)
+
+    @staticmethod
+    def _compile_generic(size, name, opt):
+        get_opt = _resolver(opt)
+        size = size.value
+
+        def encode(values, buffer):
+            buffer.extend(size.encode(values.get(name), get_opt(values)))
+
+        def decode(buffer, offset, opts):
+            offset, opts[name] = size.decode_from(buffer, offset, get_opt(opts))
+            return offset
+
+        return encode, decode
+
+    @staticmethod
+    def _compile_nt(_size, name, _opt):
+        def encode(values, buffer):
+            data = values.get(name)
+            if data:
+                buffer.extend(data.replace('\x00', '').encode('utf-8'))
+
+            buffer.append(0)
+
+        def decode(buffer, offset, opts):
+            end = _find_null(buffer, offset)
+            if end < 0:
+                opts[name] = None
+                return offset
+
+            opts[name] = str(buffer[offset:end], 'utf-8')
+            return end + 1
+
+        return encode, decode
+
+    @staticmethod
+    def _compile_intlist(_size, name, opt):
+        if not opt or len(opt) != 2:
+            opt = (1, 1)
+
+        get_int_size = _resolver(opt[0])
+        get_nb = _resolver(opt[1])
+
+        def encode(values, buffer):
+            data = values.get(name) or []
+            int_size = get_int_size(values) or 1
+            nb = get_nb(values) or 0
+
+            if len(data) < nb:
+                data = list(data) + [0] * (nb - len(data))
+
+            fmt = _STRUCT_FORMATS.get(int_size)
+            if not fmt:
+                buffer.extend(b''.join(SMPayloadTypeINT.encode(d, int_size) for d in data))
+                return
+
+            limit = 2**(int_size * 8) - 1
+            buffer.extend(struct.pack(
+                ">%s%s" % (len(data), fmt),
+                *(min(d or 0, limit) for d in data)
+            ))
+
+        def decode(buffer, offset, opts):
+            int_size = get_int_size(opts) or 1
+            nb = get_nb(opts) or 0
+            end = offset + int_size * nb
+
+            if len(buffer) < end:
+                opts[name] = None
+                return offset
+
+            fmt = _STRUCT_FORMATS.get(int_size)
+            if fmt:
+                opts[name] = list(struct.unpack_from(">%s%s" % (nb, fmt), buffer, offset))
+            else:
+                opts[name] = [int.from_bytes(buffer[i:i + int_size], byteorder='big')
+                              for i in range(offset, end, int_size)]
+
+            return end
+
+        return encode, decode
+
+    @staticmethod
+    def _compile_list(_size, name, opt):
+        if not opt:
+            opt = [1, []]
+
+        get_nb = _resolver(opt[0])
+        codec = BinaryCodec(opt[1])
+
+        if codec._record: #pylint: disable=protected-access
+            return BinaryCodec._compile_record_list(name, get_nb, codec)
+
+        def encode(values, buffer):
+            data = values.get(name) or []
+            for value in data:
+                codec.encode_into(value, buffer)
+
+            for _ in range((get_nb(values) or 0) - len(data)):
+                codec.encode_into({}, buffer)
+
+        def decode(buffer, offset, opts):
+            res = []
+            for _ in range(get_nb(opts) or 0):
+                value = {}
+                offset = codec._decode_into(buffer, offset, value) #pylint: disable=protected-access
+                res.append(value)
+
+            opts[name] = res
+            return offset
+
+        return encode, decode
+
+    @staticmethod
+    def _compile_record_list(name, get_nb, codec):
+        """ List of fixed width records: the whole list is packed in one struct """
+
+        fmt, width, to_row, from_row = codec._record #pylint: disable=protected-access
+        record_size = struct.calcsize(">" + fmt)
+
+        def encode(values, buffer):
+            data = values.get(name) or []
+            nb = max(len(data), get_nb(values) or 0)
+
+            row = []
+            for value in data:
+                to_row(value, row)
+
+            for _ in range(nb - len(data)):
+                to_row({}, row)
+
+            buffer.extend(struct.pack(">" + fmt * nb, *row))
+
+        def decode(buffer, offset, opts):
+            nb = get_nb(opts) or 0
+            if len(buffer) - offset < nb * record_size:
+                res = []
+                for _ in range(nb):
+                    value = {}
+                    offset = codec._decode_into(buffer, offset, value) #pylint: disable=protected-access
+                    res.append(value)
+
+                opts[name] = res
+                return offset
+
+            row = struct.unpack_from(">" + fmt * nb, buffer, offset)
+            res = []
+            for idx in range(0, nb * width, width):
+                value = {}
+                from_row(row, idx, value)
+                res.append(value)
+
+            opts[name] = res
+            return offset + nb * record_size
+
+        return encode, decode
+
+    @staticmethod
+    def _compile_map(_size, name, opt):
+        if not opt:
+            opt = [0, {}]
 
+        get_key = _resolver(opt[0])
+        codecs = dict(
+            (key, BinaryCodec([(size, name, sizeopt)]))
+            for key, (size, _, sizeopt) in opt[1].items()
+        )
+
+        def encode(values, buffer):
+            codec = codecs.get(get_key(values))
+            if codec:
+                codec.encode_into(values, buffer)
+
+        def decode(buffer, offset, opts):
+            codec = codecs.get(get_key(opts))
+            if not codec:
+                opts[name] = None
+                return offset
+
+            return codec._decode_into(buffer, offset, opts) #pylint: disable=protected-access
+
+        return encode, decode
+
+    @staticmethod
+    def _compile_packet(_size, name, opt):
+        def encode(values, buffer):
+            data = values.get(name)
+            if data:
+                data.write_data(buffer)
+
+        def decode(buffer, offset, opts):
+            offset, opts[name] = SMPayloadTypePacket.decode_from(buffer, offset, opt)
+            return offset
+
+        return encode, decode
+
+
+class JSONBackend(object):
+    """ Library used to load and dump the JSON packets.
+
+    The stdlib ``json`` module is used by default. ``use`` select another
+    library at startup, ``"auto"`` take the fastest one installed.
+
+    :Example:
+
+    >>> JSONBackend.use("json")
+    'json'
+    >>> JSONBackend.dumps({"_command": 128})
+    '{"_command": 128}'
+    >>> JSONBackend.loads('{"_command": 128}')
+    {'_command': 128}
+    """
+
+    BACKENDS = ("orjson", "ujson", "json")
+
+    name = "json"
+    loads = staticmethod(json.loads)
+    dumps = staticmethod(json.dumps)
 
     @classmethod
-    def encode(cls, values, payload_option, command=None):
+    def use(cls, name="auto"):
+        """ Select the JSON library to use, return the name of the library selected.
+
+        Raise ValueError for an unknown library, and ImportError if the
+        library is not installed (except in auto mode, which fallback to json)
+        """
+
+        if name == "auto":
+            names = cls.BACKENDS
+        elif name in cls.BACKENDS:
+            names = (name,)
+        else:
+            raise ValueError("Unknown JSON backend %s" % name)
+
+        for backend in names:
+            try:
+                module = importlib.import_module(backend)
+            except ImportError:
+                if name != "auto":
+                    raise
+                continue
+
+            cls.name = backend
+            cls.loads = staticmethod(module.loads)
+            cls.dumps = staticmethod(cls._dumps_function(backend, module))
+            return backend
+
+    @staticmethod
+    def _dumps_function(backend, module):
+        if backend == "orjson":
+            # orjson return bytes
+            return lambda data: module.dumps(data).decode("utf-8")
+
+        if backend == "ujson":
+            return lambda data: module.dumps(data, escape_forward_slashes=False)
+
+        return module.dumps
+
+
+class JSONCodec(object):
+    """ JSON encoder compiled for a given payload option.
+
+    The name, default value and type of each field are only computed once,
+    when the codec is created.
+
+    :Example:
+
+    >>> codec = JSONCodec([
+    ...     (SMPayloadType.INT, "player_id", 1),
+    ...     (SMPayloadType.NT, "name", None),
+    ... ])
+    >>> codec.encode({"name": "test"}, command=5)
+    '{"_command": 5, "player_id": 0, "name": "test"}'
+
+    >>> codec.decode('{"_command": 5, "name": "test"}')
+    {'player_id': 0, 'name': 'test'}
+    """
+
+    def __init__(self, payload_option):
+        self.payload_option = payload_option
+
+        self._fields = tuple(
+            (
+                name,
+                size == SMPayloadType.PACKET,
+                opt,
+                0 if isinstance(size.value, int) else size.value.DEFAULT
+            )
+            for size, name, opt in payload_option
+        )
+
+    def encode(self, values, command=None):
         """ Encode values in a correct json payload """
 
         data = {}
@@ -517,38 +1169,47 @@ class JSONEncoder(Encoder):
         if command is not None:
             data["_command"] = command
 
-        for size, name, _opt in payload_option:
-            if size == SMPayloadType.PACKET and name in values:
+        for name, is_packet, _opt, default in self._fields:
+            if is_packet and name in values:
                 data[name] = values[name].json
                 continue
 
-            if isinstance(size.value, int):
-                default = 0
-            else:
-                default = size.value.DEFAULT
-
             data[name] = values.get(name, default)
 
-        return json.dumps(data)
+        return JSONBackend.dumps(data)
 
-    @classmethod
-    def decode(cls, payload, payload_option):
-        """ Decode a payload in a valid dict given the payload option """
+    def decode(self, payload):
+        """ Decode a json payload in a valid dict """
 
-        opts = json.loads(payload)
+        return self.decode_values(JSONBackend.loads(payload))
+
+    def decode_values(self, opts):
+        """ Build the dict of values from an already parsed json payload """
 
         data = {}
 
-        for size, name, opt in payload_option:
-            if size == SMPayloadType.PACKET and opts.get(name):
+        for name, is_packet, opt, default in self._fields:
+            if is_packet and opts.get(name):
                 data[name] = opt.parse_json(opts[name])
                 continue
 
-            if isinstance(size.value, int):
-                default = 0
-            else:
-                default = size.value.DEFAULT
-
             data[name] = opts.get(name, default)
 
         return data
+
+
+class JSONEncoder(Encoder):
+    """ JSON encoder to encode data in the stepmania protocol """
+
+
+    @classmethod
+    def encode(cls, values, payload_option, command=None):
+        """ Encode values in a correct json payload """
+
+        return JSONCodec(payload_option).encode(values, command=command)
+
+    @classmethod
+    def decode(cls, payload, payload_option):
+        """ Decode a payload in a valid dict given the payload option """
+
+        return JSONCodec(payload_option).decode(payload)
@@ -34,8 +34,6 @@
     <SMPacketServerNSCPing >
 """
 
-import json
-
 from smserver.smutils.smpacket import smcommand
 from smserver.smutils.smpacket import smencoder
 
@@ -54,6 +52,8 @@ class SMPacket(metaclass=_SMPacketMetaclass):
 
     _command_type = smcommand.SMCommand
     _payload = []
+    _binary_codec = smencoder.BinaryCodec(_payload)
+    _json_codec = smencoder.JSONCodec(_payload)
     _subclasses = {}
 
     command = None
@@ -65,7 +65,14 @@ class SMPacket(metaclass=_SMPacketMetaclass):
 
         self.opts = kwargs
 
+        # Serialized data (by encoding) and derived packets, reset on update
+        self._cache = {}
+        self._variants = {}
+
     def __init_subclass_custom__(cls, **_kwargs): #pylint: disable=no-self-argument
+        cls._binary_codec = smencoder.BinaryCodec(cls._payload)
+        cls._json_codec = smencoder.JSONCodec(cls._payload)
+
         command = cls.command
 
         if not command:
@@ -94,6 +101,8 @@ class SMPacket(metaclass=_SMPacketMetaclass):
 
     def __setitem__(self, key, value):
         self.opts[key] = value
+        self._cache = {}
+        self._variants = {}
 
     def get(self, value, default=None):
         return self.opts.get(value, default)
@@ -175,7 +184,9 @@ class SMPacket(metaclass=_SMPacketMetaclass):
             b'\\x87msg\\x00'
         """
 
-        return self.binarycommand + self.payload
+        buffer = bytearray()
+        self.write_data(buffer)
+        return bytes(buffer)
 
     @property
     def binary(self):
@@ -190,7 +201,29 @@ class SMPacket(metaclass=_SMPacketMetaclass):
             b'\\x00\\x00\\x00\\x05\\x87msg\\x00'
         """
 
-        return self.binarysize + self.data
+        # Reserve the size header, and patch it once the payload is encoded
+        buffer = bytearray(4)
+        self.write_data(buffer)
+        buffer[:4] = (len(buffer) - 4).to_bytes(4, byteorder='big')
+
+        return bytes(buffer)
+
+    def write_data(self, buffer):
+        """
+            Write the command + payload at the end of the given bytearray
+
+            :Example:
+
+            >>> from smserver.smutils.smpacket import *
+            >>> packet = SMPacket.new(smcommand.SMServerCommand.NSCCM, message="msg")
+            >>> buffer = bytearray(b"header")
+            >>> packet.write_data(buffer)
+            >>> print(buffer)
+            bytearray(b'header\\x87msg\\x00')
+        """
+
+        buffer.append(self.command.value)
+        self._binary_codec.encode_into(self.opts, buffer)
 
     @property
     def payload(self):
@@ -205,7 +238,7 @@ class SMPacket(metaclass=_SMPacketMetaclass):
             b'msg\\x00'
         """
 
-        return smencoder.BinaryEncoder.encode(self.opts, self._payload)
+        return self._binary_codec.encode(self.opts)
 
     @property
     def json(self):
@@ -220,7 +253,7 @@ class SMPacket(metaclass=_SMPacketMetaclass):
             {"_command": 128}
         """
 
-        return smencoder.JSONEncoder.encode(self.opts, self._payload, command=self.command.value)
+        return self._json_codec.encode(self.opts, command=self.command.value)
 
     @classmethod
     def from_payload(cls, payload):
@@ -236,7 +269,7 @@ class SMPacket(metaclass=_SMPacketMetaclass):
         """
 
         return cls(
-            **smencoder.BinaryEncoder.decode(payload, cls._payload)[1]
+            **cls._binary_codec.decode(payload)[1]
         )
 
     @classmethod
@@ -253,18 +286,92 @@ class SMPacket(metaclass=_SMPacketMetaclass):
         """
 
         return cls(
-            **smencoder.JSONEncoder.decode(payload, cls._payload)
+            **cls._json_codec.decode(payload)
+        )
+
+    @classmethod
+    def from_json_values(cls, values):
+        """
+            Build the packet from an already parsed JSON packet
+
+            :Example:
+
+            >>> from smserver.smutils.smpacket import *
+            >>> print(SMPacketServerNSCCM.from_json_values({"message": "msg"}))
+            <SMPacketServerNSCCM message="msg">
+        """
+
+        return cls(
+            **cls._json_codec.decode_values(values)
         )
 
     def to_(self, encoding):
         """
             Encode the packet to the specified format (json or binary)
+
+            The result is cached, so sending the same packet to several
+            connections only encode it once per format. The cache is reset
+            when an option is updated with ``packet[key] = value``.
+
+            :Example:
+
+            >>> from smserver.smutils.smpacket import *
+            >>> packet = SMPacket.new(smcommand.SMServerCommand.NSCCM, message="msg")
+            >>> packet.to_("binary") is packet.to_("binary")
+            True
+            >>> packet["message"] = "new"
+            >>> print(packet.to_("binary"))
+            b'\\x00\\x00\\x00\\x05\\x87new\\x00'
         """
 
-        return {
-            "json": self.json,
-            "binary": self.binary
-        }[encoding]
+        if encoding not in self._cache:
+            self._cache[encoding] = {
+                "json": lambda: self.json,
+                "binary": lambda: self.binary,
+            }[encoding]()
+
+        return self._cache[encoding]
+
+    def copy(self, **kwargs):
+        """
+            Return a copy of the packet, with the given options replaced
+
+            :Example:
+
+            >>> from smserver.smutils.smpacket import *
+            >>> packet = SMPacket.new(smcommand.SMServerCommand.NSCCM, message="msg")
+            >>> print(packet.copy(message="new"))
+            <SMPacketServerNSCCM message="new">
+        """
+
+        opts = dict(self.opts)
+        opts.update(kwargs)
+
+        return self.__class__(**opts)
+
+    def variant(self, key, builder):
+        """
+            Return a packet derived from this one.
+
+            The derived packet is built with ``builder(packet)`` the first time
+            and cached under the given key (with its serialized data) until
+            this packet is updated.
+
+            :Example:
+
+            >>> from smserver.smutils.smpacket import *
+            >>> packet = SMPacket.new(smcommand.SMServerCommand.NSCCM, message="msg")
+            >>> loud = packet.variant("loud", lambda p: p.copy(message=p["message"].upper()))
+            >>> print(loud)
+            <SMPacketServerNSCCM message="MSG">
+            >>> packet.variant("loud", lambda p: p.copy(message="other")) is loud
+            True
+        """
+
+        if key not in self._variants:
+            self._variants[key] = builder(self)
+
+        return self._variants[key]
 
     @classmethod
     def from_(cls, encoding, data):
@@ -279,17 +386,20 @@ class SMPacket(metaclass=_SMPacketMetaclass):
 
     @classmethod
     def parse_json(cls, data):
-        """ Parse a JSON packet """
+        """ Parse a JSON packet, the data is only parsed once """
         try:
-            opts = json.loads(data)
+            opts = smencoder.JSONBackend.loads(data)
         except ValueError:
             return None
 
+        if not isinstance(opts, dict):
+            return None
+
         command = cls._command_type.get(opts.get("_command", -1))
         if not command:
             return None
 
-        return cls.get_class(command).from_json(data)
+        return cls.get_class(command).from_json_values(opts)
 
     @classmethod
     def parse_data(cls, data):
@@ -311,7 +421,7 @@ class SMPacket(metaclass=_SMPacketMetaclass):
         if len(binary) < 4:
             return None
 
-        return cls.parse_data(binary[4:])
+        return cls.parse_data(memoryview(binary)[4:])
 
 
 class SMOPacketClient(SMPacket):
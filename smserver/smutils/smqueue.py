@@ -0,0 +1,189 @@
+""" Outbound queue module.
+
+Each connection queue the data to send, and the transport drain the queue
+when the client is able to receive it. The queue is bounded: a client which
+does not read his data fast enough is a slow consumer.
+"""
+
+from collections import deque
+from threading import Lock
+
+
+class SlowConsumer(Exception):
+    """ Raised when a connection can't keep up with the data sent to it """
+
+
+def _group(droppable):
+    """ Key of the group of the droppable data, None if not in a group """
+
+    if isinstance(droppable, bool):
+        return None
+
+    return droppable
+
+
+class OutboundQueue(object):
+    """ Bounded queue of the data to send to a connection.
+
+    When the data queued goes above ``high_water`` bytes, the policy decide
+    what to do:
+
+    * ``drop_updates``: the oldest droppable data (game status updates,
+      scoreboards) are dropped. If it's not enough, the connection is a slow
+      consumer.
+    * ``disconnect``: the connection is directly a slow consumer.
+
+    ``droppable`` is either True or the key of a group: the data of a group
+    (the sections of a scoreboard) are dropped together, and never once the
+    transport has started to send the group.
+
+    :Example:
+
+    >>> queue = OutboundQueue(high_water=12)
+    >>> queue.put(b"update1", droppable=True)
+    >>> queue.put(b"chat")
+    >>> queue.put(b"update2", droppable=True)
+    >>> queue.pop_all()
+    [b'chat', b'update2']
+    >>> queue.dropped_packets, queue.dropped_bytes
+    (1, 7)
+    >>> queue.put(b"score0", droppable="scoreboard1")
+    >>> queue.put(b"score1", droppable="scoreboard1")
+    >>> queue.put(b"score0", droppable="scoreboard2")
+    >>> queue.pop_all()
+    [b'score0']
+    >>> queue.put(b"very long message")
+    Traceback (most recent call last):
+     ...
+    smserver.smutils.smqueue.SlowConsumer: 17 bytes queued (max 12)
+    """
+
+    POLICIES = ("drop_updates", "disconnect")
+
+    def __init__(self, high_water=256 * 1024, policy="drop_updates"):
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown slow consumer policy %s" % policy)
+
+        self.high_water = high_water
+        self.policy = policy
+
+        self._lock = Lock()
+        self._items = deque()
+
+        # Group partially sent, and last group dropped (its next data are
+        # dropped too)
+        self._sending_group = None
+        self._dropped_group = None
+
+        # Metrics
+        self.size = 0
+        self.max_size = 0
+        self.dropped_packets = 0
+        self.dropped_bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, data, droppable=False):
+        """ Queue the data to send.
+
+        Raise SlowConsumer if the queue is full, the data is not queued.
+        """
+
+        entry = (data, droppable)
+
+        with self._lock:
+            group = _group(droppable)
+            if group is not None and group == self._dropped_group:
+                self._drop(data)
+                return
+
+            self._items.append(entry)
+            self.size += len(data)
+
+            if self.size > self.high_water and self.policy == "drop_updates":
+                self._drop_updates()
+
+            if self.size > self.high_water:
+                queued = self.size
+
+                # The new data may have already been dropped with the updates
+                if self._items and self._items[-1] is entry:
+                    self._items.pop()
+                    self.size -= len(data)
+
+                raise SlowConsumer("%s bytes queued (max %s)" % (queued, self.high_water))
+
+            if self.size > self.max_size:
+                self.max_size = self.size
+
+    def _drop_updates(self):
+        """ Drop the oldest droppable data until we are under the high water mark """
+
+        dropped = set()
+        items = deque()
+        for item in self._items:
+            data, droppable = item
+            group = _group(droppable)
+
+            if group is None:
+                drop = droppable and self.size > self.high_water
+            else:
+                drop = group != self._sending_group and (
+                    group in dropped or self.size > self.high_water
+                )
+
+            if drop:
+                self.size -= len(data)
+                self._drop(data)
+                if group is not None:
+                    dropped.add(group)
+                    self._dropped_group = group
+                continue
+
+            items.append(item)
+
+        self._items = items
+
+    def _drop(self, data):
+        self.dropped_packets += 1
+        self.dropped_bytes += len(data)
+
+    def pop(self):
+        """ Return the next data to send, None if the queue is empty """
+
+        with self._lock:
+            if not self._items:
+                return None
+
+            data, droppable = self._items.popleft()
+            self.size -= len(data)
+            self._sending_group = _group(droppable)
+            return data
+
+    def pop_all(self):
+        """ Return the list of all the data to send """
+
+        with self._lock:
+            items = [data for data, _ in self._items]
+            self._items.clear()
+            self.size = 0
+            self._sending_group = None
+            return items
+
+    def clear(self):
+        """ Remove all the data queued """
+
+        self.pop_all()
+
+    @property
+    def stats(self):
+        """ Metrics of the queue """
+
+        return {
+            "size": self.size,
+            "packets": len(self._items),
+            "max_size": self.max_size,
+            "dropped_packets": self.dropped_packets,
+            "dropped_bytes": self.dropped_bytes,
+        }
@@ -6,35 +6,75 @@ This module handle the orchestration between all the servers and connections.
 
 import sys
 from threading import Lock
-from collections import defaultdict
 
 from smserver import logger
-from smserver.smutils.smconnections import smtcpsocket, udpsocket
+from smserver.smutils import smexecutor
+from smserver.smutils.smconnections import smtcpsocket, udpsocket, selectorsocket
 if sys.version_info[1] > 2:
-    from smserver.smutils.smconnections import asynctcpserver, websocket
+    from smserver.smutils.smconnections import asynctcpserver, asyncprotocol, websocket
 
 class StepmaniaServer(object):
-    """ Main class of the server """
+    """ Main class of the server.
+
+    The connections and the members of each room are stored in tuples,
+    replaced (never modified) on each change. The broadcasts iterate over
+    these snapshots without holding any lock: a slow connection does not
+    block the other threads. The changes of the connections are guarded by
+    ``mutex``, the changes of the members of a room by one of the
+    ``ROOM_LOCKS`` locks shared between the rooms.
+
+    Each room also have an index of his connections for each state of
+    ``ROOM_INDEXES``, updated when the state of a connection change.
+    """
 
     _logger = logger.get_logger()
 
     SERVER_TYPE = {
         "classic": smtcpsocket.SocketServer,
+        "selector": selectorsocket.SelectorServer,
         "udp": udpsocket.UDPServer,
         "async": asynctcpserver.AsyncSocketServer,
+        "async_protocol": asyncprotocol.AsyncProtocolServer,
         "websocket": websocket.WebSocketServer if sys.version_info[1] > 2 else None
     }
 
-    def __init__(self, servers):
+    # Number of locks used for the changes of the members of the rooms
+    ROOM_LOCKS = 16
+
+    # Indexes of the connections of each room: name -> state of the connection
+    ROOM_INDEXES = {
+        "players": lambda conn: conn.spectate is not True,
+        "spectators": lambda conn: conn.spectate is True,
+        "waiting": lambda conn: conn.spectate is not True and conn.wait_start is True,
+        "playing": lambda conn: conn.spectate is not True and conn.ingame is True,
+        "started": lambda conn: conn.songstats.start_at is not None,
+    }
+
+    def __init__(self, servers, handler_workers=0, backlog=None):
         self.mutex = Lock()
         self._connections = {}
+        self._connections_snapshot = ()
 
-        #FIXME: Handle this in a redis server if available
-        self._room_connections = defaultdict(set)
+        # Packets of the asyncio servers are handled in this thread pool,
+        # instead of the event loop. 0 to handle them in the event loop.
+        self.handler_executor = None
+        if handler_workers > 0:
+            self.handler_executor = smexecutor.OrderedExecutor(handler_workers)
+
+        # room_id -> tuple of the connections in the room
+        self._room_connections = {}
+        self._room_locks = tuple(Lock() for _ in range(self.ROOM_LOCKS))
+
+        # index name -> room_id -> tuple of the connections in the index
+        self._room_indexes = {name: {} for name in self.ROOM_INDEXES}
 
         self._servers = []
         for ip, port, server_type in servers:
-            self._servers.append(self.SERVER_TYPE[server_type](self, ip, port))
+            server = self.SERVER_TYPE[server_type](self, ip, port)
+            server.executor = self.handler_executor
+            if backlog:
+                server.backlog = backlog
+            self._servers.append(server)
 
     def is_alive(self):
         """ Check if all the thread are still alive """
@@ -54,17 +94,56 @@ class StepmaniaServer(object):
         for server in self._servers:
             server.join()
 
+    def _room_lock(self, room_id):
+        """ Lock guarding the changes of the members of the room """
+
+        return self._room_locks[hash(room_id) % self.ROOM_LOCKS]
+
     def has_room(self, room_id):
         """ Return if the given room_id have connection """
 
-        with self.mutex:
-            return bool(self._room_connections.get(room_id))
+        return bool(self._room_connections.get(room_id))
 
     @property
     def connections(self):
-        """ List al the connections of this server """
-        with self.mutex:
-            yield from self._connections.values()
+        """ Snapshot of all the connections of this server """
+
+        return self._connections_snapshot
+
+    def outbound_stats(self):
+        """ Metrics of the outbound queues of all the connections """
+
+        stats = {
+            "size": 0,
+            "packets": 0,
+            "max_size": 0,
+            "dropped_packets": 0,
+            "dropped_bytes": 0,
+        }
+
+        for conn in self.connections:
+            for key, value in conn.outbound.stats.items():
+                if key == "max_size":
+                    stats[key] = max(stats[key], value)
+                else:
+                    stats[key] += value
+
+        return stats
+
+    def handler_stats(self):
+        """
+            Metrics of the handler executor: the queues of the rooms and of
+            the connections in the lobby, and the packets dropped because a
+            connection had too many packets waiting.
+        """
+
+        if not self.handler_executor:
+            return None
+
+        stats = self.handler_executor.stats
+        stats["dropped_packets"] = sum(conn.dropped_packets for conn in self.connections)
+
+        return stats
 
     def add_connection(self, conn):
         """ Add a new connection to the server """
@@ -72,115 +151,196 @@ class StepmaniaServer(object):
 
         with self.mutex:
             self._connections[conn.token] = conn
+            self._connections_snapshot = tuple(self._connections.values())
 
     def add_to_room(self, token, room_id):
         """ Add a connection to a new room """
 
-        with self.mutex:
-            if token not in self._connections:
-                self._logger.error("Tring to add delete connection %s in a room %s", token, room_id)
-                return None
+        conn = self.find_connection(token)
+        if not conn:
+            self._logger.error("Tring to add delete connection %s in a room %s", token, room_id)
+            return None
 
-            conn = self._connections[token]
+        with self._room_lock(room_id):
             conn.room = room_id
 
-            self._room_connections[room_id].add(token)
+            members = self._room_connections.get(room_id, ())
+            if conn not in members:
+                self._room_connections[room_id] = members + (conn,)
+
+            self._index_connection(conn, room_id, True)
+
+        # The connection has been closed in the meantime
+        if not self.find_connection(token):
+            self._remove_from_room(conn, room_id)
 
     def del_from_room(self, token, room_id=None):
         """ remove a token from a room """
 
-        with self.mutex:
-            if token not in self._connections:
-                self._logger.error("Tring to add delete connection %s in a room %s", token, room_id)
-                return None
+        conn = self.find_connection(token)
+        if not conn:
+            self._logger.error("Tring to add delete connection %s in a room %s", token, room_id)
+            return None
 
-            conn = self._connections[token]
-            if not room_id:
-                room_id = conn.room
+        if not room_id:
+            room_id = conn.room
 
-            if token not in self._room_connections[room_id]:
-                return
-
-            self._room_connections[room_id].remove(token)
+        if self._remove_from_room(conn, room_id):
             conn.room = None
 
+    def _remove_from_room(self, conn, room_id):
+        """ Remove the connection from the members of the room.
+
+        Return False if the connection was not in the room.
+        """
+
+        with self._room_lock(room_id):
+            members = self._room_connections.get(room_id, ())
+            if conn not in members:
+                return False
+
+            self._discard(self._room_connections, room_id, conn)
+            self._index_connection(conn, room_id, False)
+
+        return True
+
+    @staticmethod
+    def _discard(snapshots, room_id, conn):
+        """ Replace the snapshot of the room by one without the connection """
+
+        members = tuple(member for member in snapshots.get(room_id, ()) if member is not conn)
+        if members:
+            snapshots[room_id] = members
+        else:
+            snapshots.pop(room_id, None)
+
+    def _index_connection(self, conn, room_id, in_room):
+        """ Update the indexes of the room for the connection.
+
+        The lock of the room must be held.
+        """
+
+        for name, in_index in self.ROOM_INDEXES.items():
+            index = self._room_indexes[name]
+            members = index.get(room_id, ())
+
+            if in_room and in_index(conn):
+                if conn not in members:
+                    index[room_id] = members + (conn,)
+            elif conn in members:
+                self._discard(index, room_id, conn)
+
+    def update_room_indexes(self, conn):
+        """ Update the indexes of the room of the connection, after a change
+        of his state """
+
+        room_id = conn.room
+        if room_id is None:
+            return
+
+        with self._room_lock(room_id):
+            if conn in self._room_connections.get(room_id, ()):
+                self._index_connection(conn, room_id, True)
+
+    def indexed_connections(self, index, room_id):
+        """ Snapshot of the connections of the room in the given index
+        (see ROOM_INDEXES) """
+
+        return self._room_indexes[index].get(room_id, ())
+
+    def indexed_rooms(self, index):
+        """ Rooms with at least one connection in the given index """
+
+        return tuple(self._room_indexes[index])
+
     def find_connection(self, token):
         """ Find the connection where a specific user is """
 
-        with self.mutex:
-            return self._connections.get(token)
+        return self._connections.get(token)
 
     def room_connections(self, room_id):
-        """ Iterator of all the connections in a given room """
+        """ Snapshot of all the connections in a given room """
 
-        with self.mutex:
-            for token in self._room_connections.get(room_id, ()):
-                if token not in self._connections:
-                    continue
-
-                yield self._connections[token]
+        return self._room_connections.get(room_id, ())
 
     def player_connections(self, room_id):
-        """ Iterator of all the connection's player (not spectator) """
+        """ Snapshot of all the connection's player (not spectator) """
 
-        for conn in self.room_connections(room_id):
-            if conn.spectate is True:
-                continue
-
-            yield conn
+        return self.indexed_connections("players", room_id)
 
     def ingame_connections(self, room_id):
-        """ Iterator of all the connections in a given room which have send a NSCGSR packet """
+        """ Snapshot of all the connections in a given room which have send a NSCGSR packet """
 
-        for conn in self.room_connections(room_id):
-            if not conn.songstats.get("start_at"):
-                continue
+        return self.indexed_connections("started", room_id)
 
-            yield conn
+    def publish(self, target, value, packet):
+        """
+            Send the packet to the connections held by the other worker
+            processes. Does nothing when the server run in only one process.
 
-    def sendconnection(self, token, packet):
+            :param str target: all, room, ingame, players or token
+            :param value: Room_id or token of the target
+            :param packet: The packet to send
+            :type packet: smserver.smutils.smpacket.SMPacket
+        """
+
+    def sendconnection(self, token, packet, local=False):
         """ Send a packet to the given connection token """
 
         conn = self.find_connection(token)
         if conn:
             conn.send(packet)
+        elif not local:
+            self.publish("token", token, packet)
 
-    def sendall(self, packet):
+    def sendall(self, packet, local=False):
         """
             Send a packet to all the connections in the server
 
             :param packet: The packet to send
             :type packet: smserver.smutils.smpacket.SMPacket
+            :param bool local: Only send to the connections of this process
         """
 
         for conn in self.connections:
             conn.send(packet)
 
-    def sendroom(self, room_id, packet):
+        if not local:
+            self.publish("all", None, packet)
+
+    def sendroom(self, room_id, packet, local=False):
         """
             Send a packet to all the connections in the room
 
             :param int room_id: Room_id where to send the packet
             :param packet: The packet to send
             :type packet: smserver.smutils.smpacket.SMPacket
+            :param bool local: Only send to the connections of this process
         """
 
         for conn in self.room_connections(room_id):
             conn.send(packet)
 
-    def sendingame(self, room_id, packet):
+        if not local:
+            self.publish("room", room_id, packet)
+
+    def sendingame(self, room_id, packet, local=False):
         """
             Send a packet to all the connections currently playing in the room
 
             :param int room_id: Room_id where to send the packet
             :param packet: The packet to send
             :type packet: smserver.smutils.smpacket.SMPacket
+            :param bool local: Only send to the connections of this process
         """
 
         for conn in self.ingame_connections(room_id):
             conn.send(packet)
 
-    def sendplayers(self, room_id, packet):
+        if not local:
+            self.publish("ingame", room_id, packet)
+
+    def sendplayers(self, room_id, packet, local=False):
         """
             Send a packet to all the player's connections in the room
 
@@ -189,18 +349,26 @@ class StepmaniaServer(object):
             :param int room_id: Room_id where to send the packet
             :param packet: The packet to send
             :type packet: smserver.smutils.smpacket.SMPacket
+            :param bool local: Only send to the connections of this process
         """
 
         for conn in self.player_connections(room_id):
             conn.send(packet)
 
+        if not local:
+            self.publish("players", room_id, packet)
+
     def on_disconnect(self, conn):
         """ Remove a connection from the list of connections """
 
         with self.mutex:
-            self._connections.pop(conn.token, None)
-            if conn.token in self._connections.get(conn.room, ()):
-                self._connections[conn.room].remove(conn.token)
+            if self._connections.pop(conn.token, None) is None:
+                return
+
+            self._connections_snapshot = tuple(self._connections.values())
+
+        if conn.room is not None:
+            self._remove_from_room(conn, conn.room)
 
     def on_packet(self, serv, packet):
         """ Action to perform on each new packet """
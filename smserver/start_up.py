@@ -31,6 +31,7 @@ def start_up(*args):
         host=config.database.get("host"),
         port=config.database.get("port"),
         driver=config.database.get("driver"),
+        unit_of_work=config.database.get("unit_of_work", False),
     )
 
     if config.database["update_schema"]:
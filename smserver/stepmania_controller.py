@@ -53,6 +53,16 @@ class StepmaniaController(object):
         :rtype: bool
     """
 
+    need_session = True
+    """
+        Specify if the controller use the database session. Without
+        session, ``self.session`` is None and the database properties
+        (connection, room, users...) can't be used. A controller which
+        require a login always need a session.
+
+        :rtype: bool
+    """
+
     def __init__(self, server, conn, packet, session):
         self.server = server
         self.conn = conn
@@ -64,6 +74,18 @@ class StepmaniaController(object):
         self._connection = None
         self._room_users = None
 
+    @property
+    def cached_connection(self):
+        """
+            The cached state of the connection (room ID, online users and
+            their levels). Use it instead of the connection object when
+            possible, it doesn't query the database.
+
+            :rtype: smserver.connection_cache.CachedConnection
+        """
+
+        return self.server.connection_cache.get(self.conn.token, self.session)
+
     @property
     def connection(self):
         """ The connection object in the database """
@@ -71,9 +93,23 @@ class StepmaniaController(object):
         if self._connection:
             return self._connection
 
-        self._connection = models.Connection.by_token(self.conn.token, self.session)
+        self._connection = self.server.connection_cache.connection(self.conn.token, self.session)
         return self._connection
 
+    @property
+    def logged_in(self):
+        """ True if at least one user is logged in this connection """
+
+        cached = self.cached_connection
+        return cached is not None and cached.logged_in
+
+    @property
+    def room_id(self):
+        """ The ID of the room where the user is (None if not in a room) """
+
+        cached = self.cached_connection
+        return cached.room_id if cached else None
+
     @property
     def room(self):
         """
@@ -82,7 +118,11 @@ class StepmaniaController(object):
             Return None if the user is not in a room
         """
 
-        return self.connection.room
+        room_id = self.room_id
+        if room_id is None:
+            return None
+
+        return self.session.query(models.Room).get(room_id)
 
     @property
     def song(self):
@@ -146,7 +186,7 @@ class StepmaniaController(object):
             :rtype: int
         """
 
-        return max(user.level(room_id) for user in self.active_users)
+        return self.server.connection_cache.level(self.conn.token, self.session, room_id)
 
     def can(self, action, room_id=None):
         """
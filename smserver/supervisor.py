@@ -0,0 +1,112 @@
+""" Supervisor module.
+
+Run the server in several worker processes. Each worker bind the same ports
+(SO_REUSEPORT), so the kernel spread the connections between them, and run
+his own threads and event loops. The packets sent to a room are relayed to
+the other workers through the messaging: redis if it's configured, else a
+unix socket broker run by the supervisor. The state of the players of each
+room is published the same way (see smserver.room_state).
+
+The supervisor initialize the database (disconnect the users, create the
+rooms) once, before starting the workers.
+"""
+
+import multiprocessing
+import os
+import signal
+import sys
+
+from smserver import conf
+from smserver import database
+from smserver import logger
+from smserver import messaging
+from smserver import redis_database
+from smserver import server
+
+
+def run_worker(broker_path=None):
+    """ Start a server in the current worker process """
+
+    # The connections opened by the supervisor can't be shared between processes
+    database.get_current_db().engine.dispose()
+
+    if redis_database.is_available():
+        messaging.set_handler(messaging.RedisHandler())
+    else:
+        messaging.set_handler(messaging.UnixSocketHandler(broker_path))
+
+    serv = server.StepmaniaServer()
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+    signal.signal(signal.SIGHUP, lambda *_: serv.reload())
+
+    try:
+        serv.start()
+    except (KeyboardInterrupt, SystemExit):
+        serv.stop()
+
+
+class Supervisor(object):
+    """ Start and stop the worker processes.
+
+        Use::
+
+            from smserver import start_up, supervisor
+
+            start_up.start_up(*sys.argv[1:])
+
+            supervisor.Supervisor(4, "/tmp/smserver.sock").start()
+    """
+
+    log = logger.get_logger()
+
+    def __init__(self, workers, broker_path):
+        self.workers = workers
+        self.broker_path = broker_path
+
+        self.broker = None
+        self.processes = []
+
+    def start(self):
+        """ Start the workers, and wait for them """
+
+        # Only done once, the workers don't touch the users of the others
+        server.init_database(database.get_current_db(), conf.config)
+
+        if not redis_database.is_available():
+            # Listen before starting the workers, so they can connect to it
+            self.broker = messaging.UnixSocketBroker(self.broker_path)
+
+        for _ in range(self.workers):
+            process = multiprocessing.Process(target=run_worker, args=(self.broker_path,))
+            process.start()
+            self.processes.append(process)
+            self.log.info("Worker %s started", process.pid)
+
+        if self.broker:
+            self.broker.start()
+
+        for process in self.processes:
+            process.join()
+
+    def reload(self):
+        """ Reload the configuration of all the workers """
+
+        for process in self.processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGHUP)
+
+    def stop(self):
+        """ Stop all the workers """
+
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+
+        for process in self.processes:
+            process.join()
+            self.log.info("Worker %s stopped", process.pid)
+
+        if self.broker:
+            self.broker.stop()
+            self.broker.join()
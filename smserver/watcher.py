@@ -6,10 +6,11 @@ This module is responsible of executing regular task
 from threading import Thread
 import time
 import datetime
-import itertools
 import socket
 
 from smserver import models
+from smserver import room_state
+from smserver.smutils import smconn
 from smserver.smutils.smpacket import smpacket
 from smserver.chathelper import with_color
 from smserver.controllers.legacy.game_start_request import StartGameRequestController
@@ -49,8 +50,11 @@ class StepmaniaWatcher(Thread):
         self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         self._continue = True
 
+        # Rooms with players whose state has been published to the other workers
+        self._published_rooms = set()
+
     def force_run(self):
-        with self.server.db.session_scope() as session:
+        with self.server.db.session_scope() as session, smconn.send_batch():
             for func, _ in periodicmethod.functions:
                 func(self, session)
 
@@ -61,7 +65,8 @@ class StepmaniaWatcher(Thread):
         func_map = {func: 0 for func, _ in periodicmethod.functions}
 
         while self._continue:
-            with self.server.db.session_scope() as session:
+            # The packets of an iteration are sent together at the end
+            with self.server.db.session_scope() as session, smconn.send_batch():
                 for func, period in periodicmethod.functions:
                     func_map[func] += 1
                     if func_map[func] < period:
@@ -92,13 +97,23 @@ class StepmaniaWatcher(Thread):
 
         self.server.sd_notify.watchdog()
 
+    @periodicmethod(60)
+    def log_handler_stats(self, _session):
+        """ Log the depth of the handler queues """
+
+        stats = self.server.handler_stats()
+        if not stats:
+            return
+
+        self.server.log.info(
+            "Handler queues: %(queues)s queues, %(pending)s packets waiting "
+            "(max %(max_pending)s in a queue), %(tasks)s handled, %(dropped_packets)s dropped",
+            stats
+        )
+
     @periodicmethod(5)
     def send_udp(self, session):
-        packet = smpacket.SMPacketServerNSCFormatted(
-            server_name=self.server.config.server["name"],
-            server_port=self.server.config.server["port"],
-            nb_players=models.User.nb_onlines(session)
-        )
+        packet = self.server.discovery_packet(session, refresh=True)
 
         try:
             self._sock.sendto(packet.binary, (self.UDP_IP, self.UDP_PORT))
@@ -107,14 +122,38 @@ class StepmaniaWatcher(Thread):
 
     @periodicmethod(1)
     def send_ping(self, _session):
-        self.server.sendall(smpacket.SMPacketServerNSCPing())
+        # Each worker process ping his own connections
+        self.server.sendall(smpacket.SMPacketServerNSCPing(), local=True)
+
+    @periodicmethod(1)
+    def publish_room_states(self, session):
+        """ Publish the state of the rooms to the other worker processes """
+
+        if self.server.workers <= 1:
+            return
+
+        rooms = set(self.server.indexed_rooms("players"))
+
+        # The rooms left by the last player get an empty state
+        for room_id in rooms | self._published_rooms:
+            self.server.publish_room_state(room_id, session)
+
+        self._published_rooms = rooms
 
     @periodicmethod(2)
     def check_end_game(self, session):
         for room in session.query(models.Room).filter_by(status=2):
+            # The workers without any player of the room can't tell
+            if self.server.workers > 1 and not self.server.has_room(room.id):
+                continue
+
             if self.room_still_in_game(room):
                 continue
 
+            # Only one of the workers with players of the room ends the game
+            if self.server.workers > 1 and not self.claim_end_game(room, session):
+                continue
+
             self.server.log.info("Room %s finish is last song: %s" % (room.name, room.active_song_id))
             room.status = 1
             room.ingame = False
@@ -128,10 +167,23 @@ class StepmaniaWatcher(Thread):
                 room
             )
 
+    @staticmethod
+    def claim_end_game(room, session):
+        """ Atomically mark the game of the room as ended, return False if
+        another worker process has already done it """
+
+        ended = session.query(models.Room).filter_by(id=room.id, status=2).update(
+            {"status": 1}, synchronize_session=False
+        )
+
+        return ended == 1
+
     def room_still_in_game(self, room):
-        for conn in self.server.player_connections(room.id):
-            if conn.ingame is True:
-                return True
+        if self.server.indexed_connections("playing", room.id):
+            return True
+
+        if self.server.room_states.playing(room.id):
+            return True
 
         if room.ingame:
             return False
@@ -148,32 +200,17 @@ class StepmaniaWatcher(Thread):
             self.send_scoreboard(room, session)
 
     def send_scoreboard(self, room, session):
-        scores = []
-        for conn in self.server.ingame_connections(room.id):
-            connection = models.Connection.by_token(conn.token, session)
-            for user in connection.active_users:
-                with conn.mutex:
-                    if user.pos not in conn.songstats:
-                        continue
+        scores = room_state.live_scores(self.server, room.id, session)
 
-                    stat = conn.songstats[user.pos].get("data")
-
-                    if not stat:
-                        continue
-
-                    scores.append({
-                        "user": user,
-                        "combo": stat[-1].get("combo"),
-                        "grade": stat[-1].get("grade"),
-                        "score": stat[-1].get("score")
-                    })
+        # The players connected to the other worker processes
+        scores.extend(self.server.room_states.scores(room.id))
 
         for songstat in room.last_game.song_stats:
             if not songstat.user.online:
                 continue
 
             scores.append({
-                "user": songstat.user,
+                "user_id": songstat.user_id,
                 "combo": songstat.max_combo,
                 "grade": songstat.grade,
                 "score": songstat.score,
@@ -186,29 +223,22 @@ class StepmaniaWatcher(Thread):
         )
 
         packet["section"] = 0
-        packet["options"] = [models.User.user_index(score["user"].id, room.id, session) for score in scores]
-        self.server.sendingame(room.id, packet)
+        packet["options"] = [models.User.user_index(score["user_id"], room.id, session) for score in scores]
+        self.server.sendingame(room.id, packet, local=True)
 
         packet["section"] = 1
         packet["options"] = [score["combo"] for score in scores]
-        self.server.sendingame(room.id, packet)
+        self.server.sendingame(room.id, packet, local=True)
 
         packet["section"] = 2
         packet["options"] = [score["grade"] for score in scores]
-        self.server.sendingame(room.id, packet)
+        self.server.sendingame(room.id, packet, local=True)
 
     @periodicmethod(1)
     def send_game_start(self, session):
-        conn_in_room = itertools.filterfalse(
-            lambda x: x.room is None or x.spectate is True,
-            self.server.connections)
-
-        conns = sorted(conn_in_room, key=lambda x: x.room)
-        for room_id, room_conns in itertools.groupby(conns, key=lambda x: x.room):
-            if not room_id:
-                continue
-
-            self.check_song_start(session, room_id, room_conns)
+        # Only the rooms with a player waiting for the start can start a song
+        for room_id in self.server.indexed_rooms("waiting"):
+            self.check_song_start(session, room_id, self.server.player_connections(room_id))
 
     def check_song_start(self, session, room_id, room_conns):
         room = session.query(models.Room).get(room_id)
@@ -228,7 +258,15 @@ class StepmaniaWatcher(Thread):
                 if conn.songs.get(song.id) is False:
                     continue
 
-                wait_since = conn.songstats.get("start_at", wait_since)
+                wait_since = conn.songstats.start_at or wait_since
+
+        # The players connected to the other worker processes
+        if not self.server.room_states.everybody_waiting(room_id):
+            everybody_waiting = False
+
+        remote_wait_since = self.server.room_states.wait_since(room_id)
+        if remote_wait_since and (not wait_since or remote_wait_since > wait_since):
+            wait_since = remote_wait_since
 
         if everybody_waiting or (
                 wait_since and
@@ -0,0 +1,88 @@
+""" Test connection cache module """
+
+import mock
+
+from smserver import connection_cache
+from smserver import models
+
+from test import utils
+from test.factories.connection_factory import ConnectionFactory
+from test.factories.room_factory import RoomFactory
+from test.factories.user_factory import UserFactory, user_with_room_privilege
+
+
+class ConnectionCacheTest(utils.DBTest):
+    """ Test the connection cache """
+
+    def setUp(self):
+        super().setUp()
+
+        self.cache = connection_cache.ConnectionCache()
+        self.connection = ConnectionFactory()
+        self.token = self.connection.token
+
+    def test_get(self):
+        """ Only the connections with a user logged in are stored """
+
+        self.assertIsNone(self.cache.get("unknown", self.session))
+
+        self.assertFalse(self.cache.get(self.token, self.session).logged_in)
+        self.assertNotIn(self.token, self.cache)
+
+        user = UserFactory(connection=self.connection, online=True, pos=0)
+        cached = self.cache.get(self.token, self.session)
+        self.assertEqual(cached.users, ((user.id, 0),))
+        self.assertIn(self.token, self.cache)
+
+        with mock.patch.object(models.Connection, "by_token") as by_token:
+            self.assertIs(self.cache.get(self.token, self.session), cached)
+            self.assertEqual(self.cache.connection(self.token, self.session), self.connection)
+
+        by_token.assert_not_called()
+
+        self.assertIsNone(self.cache.get(self.token, self.session, store=False).room_id)
+
+    def test_get_without_store(self):
+        """ The connections of the other processes are not stored """
+
+        UserFactory(connection=self.connection, online=True)
+
+        self.assertTrue(self.cache.get(self.token, self.session, store=False).logged_in)
+        self.assertNotIn(self.token, self.cache)
+
+    def test_update(self):
+        """ The changes of the connection are written in the cache """
+
+        room = RoomFactory()
+        UserFactory(connection=self.connection, online=True)
+        self.cache.get(self.token, self.session)
+
+        self.connection.room = room
+        self.cache.update(self.connection)
+        self.assertEqual(self.cache.get(self.token, self.session).room_id, room.id)
+
+        self.cache.invalidate(self.token)
+        self.assertNotIn(self.token, self.cache)
+
+        # Not cached, nothing to update
+        self.cache.update(self.connection)
+        self.assertNotIn(self.token, self.cache)
+
+    def test_level(self):
+        """ The levels are cached by room """
+
+        self.assertEqual(self.cache.level(self.token, self.session), 0)
+
+        user = user_with_room_privilege(level=5, online=True, connection=self.connection)
+        room_id = user.room.id
+
+        self.assertEqual(self.cache.level(self.token, self.session, room_id), 5)
+
+        with mock.patch.object(models.Connection, "level") as level:
+            self.assertEqual(self.cache.level(self.token, self.session, room_id), 5)
+
+        level.assert_not_called()
+
+        user.set_level(room_id, 10)
+        self.cache.update(self.connection)
+        self.assertEqual(self.cache.level(self.token, self.session, room_id), 10)
@@ -0,0 +1,102 @@
+""" Test database module """
+
+import os
+import shutil
+import tempfile
+
+import sqlalchemy
+
+from smserver import database
+from smserver import models
+
+from test import common
+from test import utils
+
+
+class UnitOfWorkTest(utils.DBTest):
+    """ Test the unit of work mode of the sessions """
+
+    def setUp(self):
+        super().setUp()
+
+        self.db_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.db_dir, "unit_of_work.db")
+
+        self.commits = []
+        sqlalchemy.event.listen(common.db.engine, "commit", self._on_commit)
+
+    def tearDown(self):
+        sqlalchemy.event.remove(common.db.engine, "commit", self._on_commit)
+        shutil.rmtree(self.db_dir)
+        super().tearDown()
+
+    def _on_commit(self, _conn):
+        self.commits.append(True)
+
+    def test_commit_once(self):
+        """ Test the commits are only flushes inside a unit of work """
+
+        with common.db.session_scope(unit_of_work=True) as session:
+            session.add(models.Room(name="Room 1", status=1))
+            session.commit()
+
+            # A scope opened inside the unit of work is part of it
+            with common.db.session_scope() as inner_session:
+                inner_session.add(models.Room(name="Room 2", status=1))
+
+            self.assertEqual(self.commits, [])
+            self.assertTrue(session.in_unit_of_work)
+
+        self.assertEqual(len(self.commits), 1)
+        self.assertEqual(self.session.query(models.Room).count(), 2)
+
+    def test_savepoint(self):
+        """ Test a failing block only rollback its own changes """
+
+        with common.db.session_scope(unit_of_work=True) as session:
+            session.add(models.Room(name="Room 1", status=1))
+
+            with self.assertRaises(ValueError):
+                with session.savepoint():
+                    session.add(models.Room(name="Room 2", status=1))
+                    session.commit()
+                    raise ValueError()
+
+            with session.savepoint():
+                session.add(models.Room(name="Room 3", status=1))
+
+        self.assertEqual(len(self.commits), 1)
+        self.assertEqual(
+            sorted(room.name for room in self.session.query(models.Room)),
+            ["Room 1", "Room 3"]
+        )
+
+    def test_default_sqlite_transactions(self):
+        """ Test the default engine keeps the transaction handling of pysqlite """
+
+        connection = database.DataBase(database=self.db_path).engine.raw_connection()
+        self.assertEqual(connection.isolation_level, "")
+        connection.close()
+
+    def test_savepoint_in_transaction(self):
+        """ Test the savepoints don't commit the changes of the unit of work """
+
+        db = database.DataBase(database=self.db_path, unit_of_work=True)
+        db.create_tables()
+
+        connection = db.engine.raw_connection()
+        self.assertIsNone(connection.isolation_level)
+        connection.close()
+
+        with self.assertRaises(ValueError):
+            with db.session_scope(unit_of_work=True) as session:
+                session.add(models.Room(name="Room 1", status=1))
+                session.flush()
+
+                with session.savepoint():
+                    session.add(models.Room(name="Room 2", status=1))
+
+                raise ValueError()
+
+        with db.session_scope() as session:
+            self.assertEqual(session.query(models.Room).count(), 0)
@@ -1,9 +1,18 @@
 """ Module to test the server global flow """
 
+import datetime
+
+import mock
+import sqlalchemy
+
 from smserver import models
+from smserver import room_state
 from smserver import stepmania_controller
+from smserver.smutils import smconn
 from smserver.smutils.smpacket import smpacket
 
+from test import common
+from test.test_functional import helper
 from test.test_functional.helper import UserFunctionalTest
 
 class ServerTest(UserFunctionalTest):
@@ -260,6 +269,22 @@ class ServerTest(UserFunctionalTest):
         self.assertEqual(songstats[0]["difficulty"], 3)
         self.assertEqual(songstats[1]["difficulty"], 4)
 
+    def test_watcher_launch_waiting_room(self):
+        """ The watcher start the song of a room with a player waiting for it """
+
+        self.test_client_bin_game_start_request()
+
+        room_id = self.client_bin.room
+        self.assertEqual(self.server.indexed_rooms("waiting"), (room_id,))
+        self.assertEqual(self.server.ingame_connections(room_id), (self.client_bin,))
+
+        self.server.watcher.force_run()
+
+        self.assertIsNotNone(self.get_smpacket_in(smpacket.SMPacketServerNSCGSR, self.client_bin.packet_send))
+        self.assertFalse(self.client_bin.wait_start)
+        self.assertEqual(self.server.indexed_rooms("waiting"), ())
+        self.assertEqual(self.server.indexed_connections("playing", room_id), (self.client_bin,))
+
     def test_client_json_game_start_request(self):
         """
             Client-json send a game start request, start the game
@@ -282,6 +307,49 @@ class ServerTest(UserFunctionalTest):
         self.assertTrue(self.client_json.ingame)
 
 
+    @mock.patch("smserver.messaging.send_event")
+    def test_game_start_remote_player(self, send_event):
+        """ The song doesn't start until the players of the other workers are waiting """
+
+        self.server.workers = 2
+        self.test_client_bin_game_start_request()
+
+        room_id = self.client_bin.room
+        self.server.room_states.update("other_worker", room_id, room_state.WorkerRoomState(
+            players=1, waiting=0
+        ))
+
+        packet = smpacket.SMPacketClientNSCGSR(
+            first_player_feet=5,
+            first_player_difficulty=2,
+            start_position=0,
+            song_title="Title",
+            song_artist="Artist",
+        )
+        self.client_json.on_data(packet.json)
+
+        # The state of this worker has been published
+        data = send_event.call_args[1]["data"]
+        self.assertEqual(data["action"], "state")
+        self.assertEqual(data["state"]["waiting"], 2)
+
+        self.assertTrue(self.client_bin.wait_start)
+        self.assertTrue(self.client_json.wait_start)
+        self.assertFalse(self.client_bin.ingame)
+
+        self.server.room_states.update("other_worker", room_id, room_state.WorkerRoomState(
+            players=1, waiting=1
+        ))
+        self.server.watcher.force_run()
+
+        self.assertFalse(self.client_bin.wait_start)
+        self.assertTrue(self.client_bin.ingame)
+        self.assertTrue(self.client_json.ingame)
+        self.assertIn(
+            {"origin": self.server.worker_id, "action": "start", "room_id": room_id},
+            [call[1]["data"] for call in send_event.call_args_list]
+        )
+
     def test_client_bin_game_status_update(self):
         """ Client-bin send a game status update package """
 
@@ -310,6 +378,44 @@ class ServerTest(UserFunctionalTest):
         self.client_bin.on_data(packet.binary)
         self.assertEqual(len(songstats[0]["data"]), 2)
 
+    def test_client_bin_game_status_update_without_session(self):
+        """ The game status update and the ping response don't open a session """
+
+        self.test_client_json_game_start_request()
+        packet = smpacket.SMPacketClientNSCGSU(player_id=0, step_id=4, score=50000)
+
+        with mock.patch.object(self.server.db, "session_scope") as session_scope:
+            self.client_bin.on_data(packet.binary)
+            self.client_bin.on_data(smpacket.SMPacketClientNSCPingR().binary)
+
+        session_scope.assert_not_called()
+        self.assertEqual(len(self.client_bin.songstats[0]["data"]), 1)
+
+    def test_client_bin_game_status_update_beat_best_score(self):
+        """ Beating the best score open a session to find the user """
+
+        self.test_client_json_game_start_request()
+        self.client_bin.songstats[0].best_score = 100
+
+        packet = smpacket.SMPacketClientNSCGSU(player_id=0, step_id=4, score=50000)
+        self.client_bin.on_data(packet.binary)
+
+        self.assertBinSend(smpacket.SMPacketServerNSCSU)
+        self.assertIsNone(self.client_bin.songstats[0].best_score)
+
+    def test_client_bin_game_status_update_beat_best_score_disconnected(self):
+        """ The connection has been removed while beating the best score """
+
+        self.test_client_json_game_start_request()
+        self.client_bin.songstats[0].best_score = 100
+        self.client_bin.packet_send = []
+
+        packet = smpacket.SMPacketClientNSCGSU(player_id=0, step_id=4, score=50000)
+        with mock.patch.object(self.server.connection_cache, "connection", return_value=None):
+            self.client_bin.on_data(packet.binary)
+
+        self.assertIsNone(self.get_smpacket_in(smpacket.SMPacketServerNSCSU, self.client_bin.packet_send))
+
     def test_client_bin_game_over(self):
         """ Test sending a game over packet for client bin """
 
@@ -319,8 +425,8 @@ class ServerTest(UserFunctionalTest):
         self.client_bin.on_data(packet.binary)
 
         self.assertFalse(self.client_bin.ingame)
-        self.assertEqual(self.client_bin.songstats[0]["data"], [])
-        self.assertEqual(self.client_bin.songstats[1]["data"], [])
+        self.assertEqual(len(self.client_bin.songstats[0]["data"]), 0)
+        self.assertEqual(len(self.client_bin.songstats[1]["data"]), 0)
         self.assertIsNone(self.client_bin.song)
 
         songstats = list(self.session.query(models.SongStat).filter_by(user=self.user_bin1))
@@ -329,6 +435,29 @@ class ServerTest(UserFunctionalTest):
         self.assertEqual(songstats[0].score, 50000)
         self.assertEqual(songstats[0].grade, 3)
         self.assertEqual(songstats[0].max_combo, 1)
+        self.assertEqual(songstats[0].bad, 2)
+
+    def test_client_bin_game_over_unit_of_work(self):
+        """ In unit of work mode, the game over is committed once """
+
+        self.server.unit_of_work = True
+        self.test_client_bin_game_status_update()
+
+        commits = []
+        listener = lambda _conn: commits.append(True)
+        sqlalchemy.event.listen(common.db.engine, "commit", listener)
+        try:
+            self.client_bin.on_data(smpacket.SMPacketClientNSCGON().binary)
+        finally:
+            sqlalchemy.event.remove(common.db.engine, "commit", listener)
+
+        self.assertEqual(len(commits), 1)
+
+        songstats = list(self.session.query(models.SongStat).filter_by(user=self.user_bin1))
+        self.assertEqual(len(songstats), 1)
+        self.assertEqual(songstats[0].score, 50000)
+        self.assertEqual(songstats[0].perfect, 0)
+        self.assertEqual([stat["stepid"] for stat in songstats[0].stats], [4, 4])
 
     def test_client_bin_disconnect(self):
         """ Test client bin disconnection """
@@ -342,3 +471,62 @@ class ServerTest(UserFunctionalTest):
         self.assertEqual(self.user_bin2.online, False)
         self.assertIsNone(self.user_bin2.room)
         self.assertEqual(self.user_json1.online, True)
+
+    @mock.patch.object(smconn.SMThread, "reuse_port", False)
+    def test_init_database_workers(self):
+        """ Test a worker process doesn't disconnect the users of the others """
+
+        self.assertEqual(self.user_bin1.online, True)
+
+        with mock.patch.dict(self.server.config.server, {"workers": 2}):
+            helper.ServerTest()
+
+        self.session.expire_all()
+        self.assertEqual(self.user_bin1.online, True)
+
+        helper.ServerTest()
+
+        self.session.expire_all()
+        self.assertEqual(self.user_bin1.online, False)
+
+    def test_discovery(self):
+        """ Test the discovery packet is cached """
+
+        with mock.patch("smserver.models.User.nb_onlines", return_value=4) as nb_onlines:
+            self.client_bin.on_data(smpacket.SMPacketClientNSCFormatted().binary)
+            self.client_json.on_data(smpacket.SMPacketClientNSCFormatted().json)
+
+            packet_bin = self.get_smpacket_in(
+                smpacket.SMPacketServerNSCFormatted, self.client_bin.packet_send)
+            packet_json = self.get_smpacket_in(
+                smpacket.SMPacketServerNSCFormatted, self.client_json.packet_send)
+
+            self.assertIs(packet_bin, packet_json)
+            self.assertEqual(packet_bin["nb_players"], 4)
+            self.assertEqual(packet_bin["server_port"], self.server.config.server["port"])
+            nb_onlines.assert_called_once_with(mock.ANY)
+
+            nb_onlines.return_value = 3
+            packet = self.server.discovery_packet(self.session, refresh=True)
+            self.assertEqual(packet["nb_players"], 3)
+            self.assertEqual(nb_onlines.call_count, 2)
+
+    def test_discovery_without_session(self):
+        """ The discovery requests only open a session to rebuild the packet """
+
+        packet = smpacket.SMPacketClientNSCFormatted()
+        self.server.discovery_packet(refresh=True)
+
+        with mock.patch.object(self.server.db, "session_scope") as session_scope:
+            self.client_bin.on_data(packet.binary)
+            self.client_json.on_data(packet.json)
+
+        session_scope.assert_not_called()
+        self.assertBinSend(smpacket.SMPacketServerNSCFormatted)
+
+        # The cached packet is stale
+        self.server._discovery = (self.server._discovery[0], datetime.datetime(2017, 1, 1)) #pylint: disable=protected-access
+        with mock.patch("smserver.models.User.nb_onlines", return_value=4):
+            self.client_bin.on_data(packet.binary)
+
+        self.assertEqual(self.server.discovery_packet()["nb_players"], 4)
@@ -1,10 +1,23 @@
 """ Module to test the login of client """
 
+import mock
+
 from smserver import models
+from smserver import pluginmanager
 from smserver.smutils.smpacket import smpacket
 
 from test.test_functional.helper import ConnectedFunctionalTest
 
+class PluginLogin(pluginmanager.StepmaniaPlugin):
+    """ Plugin which only overrides a SMO hook """
+
+    def __init__(self, server):
+        super().__init__(server)
+        self.logins = []
+
+    def on_login(self, session, serv, packet):
+        self.logins.append(packet["username"])
+
 class SigninTest(ConnectedFunctionalTest):
     """ Test the client login """
 
@@ -208,3 +221,23 @@ class SigninTest(ConnectedFunctionalTest):
         self.assertEqual(len(self.json_connection.active_users), 2)
 
         self.assertFalse(user1.online)
+
+    def test_plugin_login_hook(self):
+        """ The on_login hook of a plugin is called for a NSSMONL login packet """
+
+        plugins = pluginmanager.PluginManager(PluginLogin, paths=[])
+        plugins.extend([PluginLogin])
+        with mock.patch.object(self.server, "_get_plugins", return_value=plugins):
+            self.server.plugins = self.server._init_plugins() #pylint: disable=protected-access
+
+        self.client_bin.on_data(smpacket.SMPacketClientNSSMONL(
+            packet=smpacket.SMOPacketClientLogin(
+                username="clientbin-user1",
+                password="testtest",
+                player_number=0
+            )
+        ).binary)
+
+        # Like with the plugins resolved on each packet: forwarded by
+        # on_nssmonl, then for the SMO packet routed by the SMO controller
+        self.assertEqual(self.server.plugins[0].logins, ["clientbin-user1"] * 2)
@@ -0,0 +1,83 @@
+""" Test Packet worker module """
+
+import mock
+
+from smserver import server
+from smserver.listener.workers import packet
+from smserver.smutils.smpacket import smpacket
+
+from test import utils
+
+
+class PacketWorkerTest(utils.DBTest):
+    """ Test packet worker module """
+
+    def setUp(self):
+        super().setUp()
+
+        self.server = server.StepmaniaServer()
+        self.worker = packet.PacketWorker(self.server)
+
+        self.packet = smpacket.SMPacketServerNSCCM(message="msg")
+
+    def event_data(self, target, value, origin="other_worker"):
+        """ Data of an event published by a worker """
+
+        return {
+            "origin": origin,
+            "target": target,
+            "value": value,
+            "packet": self.packet.json,
+        }
+
+    @mock.patch("smserver.smutils.smthread.StepmaniaServer.sendroom")
+    def test_handle_room_packet(self, sendroom):
+        """ Test sending a packet published for a room """
+
+        self.worker.handle(self.event_data("room", 4))
+
+        sendroom.assert_called_once()
+        self.assertEqual(sendroom.call_args[0][0], 4)
+        self.assertIsInstance(sendroom.call_args[0][1], smpacket.SMPacketServerNSCCM)
+        self.assertEqual(sendroom.call_args[0][1]["message"], "msg")
+        self.assertEqual(sendroom.call_args[1], {"local": True})
+
+    @mock.patch("smserver.smutils.smthread.StepmaniaServer.sendall")
+    @mock.patch("smserver.smutils.smthread.StepmaniaServer.sendconnection")
+    def test_handle_packet_targets(self, sendconnection, sendall):
+        """ Test sending a packet published for all the connections or a token """
+
+        self.worker.handle(self.event_data("all", None))
+        sendall.assert_called_once()
+        self.assertEqual(sendall.call_args[1], {"local": True})
+
+        self.worker.handle(self.event_data("token", "abcd"))
+        sendconnection.assert_called_once()
+        self.assertEqual(sendconnection.call_args[0][0], "abcd")
+
+        self.worker.handle(self.event_data("unknown", None))
+        self.assertLog("ERROR")
+
+    @mock.patch("smserver.smutils.smthread.StepmaniaServer.sendall")
+    def test_ignore_own_packet(self, sendall):
+        """ Test the packets published by this worker are ignored """
+
+        self.worker.handle(self.event_data("all", None, origin=self.server.worker_id))
+        sendall.assert_not_called()
+
+    @mock.patch("smserver.messaging.send_event")
+    def test_publish(self, send_event):
+        """ Test the packets are published only with several workers """
+
+        self.server.publish("room", 4, self.packet)
+        send_event.assert_not_called()
+
+        self.server.workers = 2
+        self.server.publish("room", 4, self.packet)
+        send_event.assert_called_once()
+        self.assertEqual(send_event.call_args[1]["room_id"], 4)
+
+        data = send_event.call_args[1]["data"]
+        self.assertEqual(data["origin"], self.server.worker_id)
+        self.assertEqual(data["target"], "room")
+        self.assertEqual(data["packet"], self.packet.json)
@@ -0,0 +1,54 @@
+""" Test room state worker module """
+
+import mock
+
+from smserver import server
+from smserver.listener.workers import room
+from smserver.controllers.legacy.game_start_request import StartGameRequestController
+
+from test import utils
+
+
+class RoomStateWorkerTest(utils.DBTest):
+    """ Test room state worker module """
+
+    def setUp(self):
+        super().setUp()
+
+        self.server = server.StepmaniaServer()
+        self.worker = room.RoomStateWorker(self.server)
+
+    def event_data(self, action, origin="other_worker", **data):
+        """ Data of an event published by a worker """
+
+        data.update({"origin": origin, "action": action, "room_id": 4})
+        return data
+
+    def test_handle_state(self):
+        """ Test the state published by a worker is stored """
+
+        self.worker.handle(self.event_data("state", state={"players": 2, "waiting": 1}))
+
+        states = self.server.room_states.states(4)
+        self.assertEqual(len(states), 1)
+        self.assertEqual(states[0].players, 2)
+        self.assertFalse(self.server.room_states.everybody_waiting(4))
+
+    def test_ignore_own_state(self):
+        """ Test the states published by this worker are ignored """
+
+        self.worker.handle(self.event_data(
+            "state", origin=self.server.worker_id, state={"players": 2}
+        ))
+
+        self.assertEqual(self.server.room_states.states(4), ())
+
+    @mock.patch.object(StartGameRequestController, "start_players")
+    def test_handle_start(self, start_players):
+        """ Test the players of this worker are started """
+
+        self.worker.handle(self.event_data("start"))
+        start_players.assert_called_once_with(4, self.server)
+
+        self.worker.handle(self.event_data("unknown"))
+        self.assertLog("ERROR")
@@ -1,5 +1,8 @@
 """ Test message module """
 
+import os
+import socket
+import tempfile
 import unittest
 import threading
 import time
@@ -160,3 +163,97 @@ class MessagingTest(unittest.TestCase):
         self.assertEqual(messages[0].kind, msg1.kind)
         self.assertEqual(messages[1].data, msg2.data)
         self.assertEqual(messages[1].kind, msg2.kind)
+
+    def test_message_with_unix_socket_handler(self):
+        """ Test messaging between two processes with the unix socket broker """
+
+        path = os.path.join(tempfile.mkdtemp(), "broker.sock")
+        broker = messaging.UnixSocketBroker(path)
+        broker.start()
+
+        sender = messaging.Messaging(messaging.UnixSocketHandler(path))
+        receiver = messaging.Messaging(messaging.UnixSocketHandler(path))
+
+        messages = []
+
+        def receive_msg():
+            """ Worker thread which add message to messages """
+
+            for msg in receiver.listen():
+                messages.append(msg)
+
+        thread = threading.Thread(target=receive_msg)
+        thread.start()
+
+        msg1 = event.Event(event.EventKind.chat_message, data={"bla": "bla\nbla"})
+        msg2 = event.Event(event.EventKind.packet, room_id=4)
+
+        sender.send(msg1)
+        sender.send(msg2)
+        with self.assertRaises(ValueError):
+            sender.send("Bla")
+
+        for _ in range(50):
+            if len(messages) == 2:
+                break
+            time.sleep(0.02)
+
+        receiver.stop()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+
+        broker.stop()
+        broker.join(1)
+        self.assertFalse(os.path.exists(path))
+
+        self.assertEqual(messages, [msg1, msg2])
+        self.assertEqual(messages[0].data, msg1.data)
+        self.assertEqual(messages[1].kind, event.EventKind.packet)
+        self.assertEqual(messages[1].room_id, 4)
+
+    def test_unix_socket_broker_slow_worker(self):
+        """ Test a worker which doesn't read its messages doesn't block the others """
+
+        path = os.path.join(tempfile.mkdtemp(), "broker.sock")
+        broker = messaging.UnixSocketBroker(path, max_buffer=256 * 1024)
+        broker.start()
+
+        slow_worker = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        slow_worker.connect(path)
+        slow_worker.settimeout(5)
+
+        worker = messaging.Messaging(messaging.UnixSocketHandler(path))
+        messages = []
+
+        def receive_msg():
+            """ Worker thread which add message to messages """
+
+            for msg in worker.listen():
+                messages.append(msg)
+
+        thread = threading.Thread(target=receive_msg)
+        thread.start()
+
+        try:
+            for i in range(500):
+                worker.send(event.Event(event.EventKind.chat_message, data={"msg": str(i) * 1000}))
+
+            for _ in range(250):
+                if len(messages) == 500:
+                    break
+                time.sleep(0.02)
+        finally:
+            worker.stop()
+            thread.join(1)
+
+        self.assertEqual(len(messages), 500)
+        self.assertEqual(messages[-1].data, {"msg": "499" * 1000})
+
+        # The slow worker has been disconnected
+        while slow_worker.recv(65536):
+            pass
+
+        slow_worker.close()
+        broker.stop()
+        broker.join(1)
+        self.assertFalse(broker.is_alive())
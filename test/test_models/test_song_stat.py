@@ -6,6 +6,10 @@ from test.factories.song_stat_factory import SongStatFactory
 from test.factories.user_factory import UserFactory
 from test import utils
 
+from smserver import models
+from smserver.models import song_stat
+from smserver.smutils import smgamestate
+
 class SongStatTest(utils.DBTest):
     """ test SongStat model"""
 
@@ -71,3 +75,81 @@ class SongStatTest(utils.DBTest):
             song_stat.pretty_result(),
             r"HARD (9): José Prout A (78.33%) on 13/10/17"
         )
+
+    def test_encode_stats(self):
+        """ Test encoding and decoding the raw stats """
+
+        raw_data = [
+            {
+                "grade": i % 8,
+                "stepid": i % 11,
+                "score": i * 1000,
+                "combo": i,
+                "health": 50,
+                "offset": 0,
+                "time": datetime.timedelta(seconds=i // 10),
+            }
+            for i in range(2000)
+        ]
+
+        binary = models.SongStat.encode_stats(raw_data)
+        self.assertEqual(len(binary), 8 + 2000 * 13)
+
+        steps = smgamestate.StepBuffer()
+        for stat in raw_data:
+            steps.append(
+                stepid=stat["stepid"],
+                grade=stat["grade"],
+                score=stat["score"],
+                combo=stat["combo"],
+                health=stat["health"],
+                offset=stat["offset"],
+                time=int(stat["time"].total_seconds() * 1000),
+            )
+
+        self.assertEqual(models.SongStat.encode_stats_rows(steps.rows()), binary)
+        self.assertEqual(steps.max_combo, 1999)
+        self.assertEqual(steps.count(3), len([i for i in range(2000) if i % 11 == 3]))
+
+        stats = models.SongStat.decode_stats(binary)
+        self.assertEqual(len(stats), 2000)
+        self.assertEqual(
+            stats[1234],
+            {"grade": 2, "stepid": 2, "score": 1234000, "combo": 1234, "health": 50, "time": 123}
+        )
+
+    def test_binary_stats_codec(self):
+        """ Test the columnar codec is compatible with the BinaryStats packet """
+
+        stats = [
+            {"grade": i % 8, "stepid": i % 11, "score": i * 2**20,
+             "combo": i * 100, "health": 50, "time": i}
+            for i in range(500)
+        ]
+
+        binary = song_stat.BinaryStatsCodec.encode(stats)
+        self.assertEqual(
+            binary,
+            song_stat.BinaryStats(nb_notes=len(stats), stats=stats).payload
+        )
+        self.assertEqual(
+            song_stat.BinaryStatsCodec.decode(binary),
+            song_stat.BinaryStats.from_payload(binary)["stats"]
+        )
+
+        use_numpy = [False]
+        if song_stat.numpy is not None:
+            use_numpy.append(True)
+
+        for numpy in use_numpy:
+            columns = song_stat.BinaryStatsCodec.decode_columns(binary, use_numpy=numpy)
+            for field in song_stat.BinaryStatsCodec.FIELDS:
+                self.assertEqual(
+                    list(columns[field]),
+                    [stat[field] for stat in song_stat.BinaryStats.from_payload(binary)["stats"]]
+                )
+
+            columns = song_stat.BinaryStatsCodec.decode_columns(None, use_numpy=numpy)
+            self.assertEqual(len(columns["score"]), 0)
+
+        self.assertEqual(song_stat.BinaryStatsCodec.decode(None), [])
@@ -0,0 +1,76 @@
+""" Test plugin manager module """
+
+import unittest
+
+from smserver import pluginmanager
+from smserver.smutils.smpacket import smcommand
+
+
+class PluginGSU(pluginmanager.StepmaniaPlugin):
+    """ Plugin class for testing purpose """
+
+    def on_nscgsu(self, session, serv, packet):
+        pass
+
+class PluginGSUPing(PluginGSU):
+    """ Plugin class for testing purpose """
+
+    def on_nscping(self, session, serv, packet):
+        pass
+
+
+class PluginLogin(pluginmanager.StepmaniaPlugin):
+    """ Plugin class for testing purpose """
+
+    def on_login(self, session, serv, packet):
+        pass
+
+
+class PluginManagerTest(unittest.TestCase):
+    """ Test the plugin manager """
+
+    def test_dispatch_table(self):
+        """ Only the hooks overridden by the plugins are in the table """
+
+        plugins = pluginmanager.PluginManager(PluginGSU, paths=[])
+        plugins.extend([PluginGSU, PluginGSUPing])
+        plugins.init(None)
+
+        table = plugins.dispatch_table(
+            smcommand.SMClientCommand,
+            pluginmanager.StepmaniaPlugin
+        )
+
+        self.assertEqual(
+            set(table),
+            {smcommand.SMClientCommand.NSCGSU, smcommand.SMClientCommand.NSCPing}
+        )
+
+        self.assertEqual(
+            [app for app, _ in table[smcommand.SMClientCommand.NSCGSU]],
+            list(plugins)
+        )
+        app, hook = table[smcommand.SMClientCommand.NSCPing][0]
+        self.assertIs(app, plugins[1])
+        self.assertEqual(hook, plugins[1].on_nscping)
+
+    def test_dispatch_table_forwards(self):
+        """ The forwarding hooks are kept for the plugins overriding the SMO hooks """
+
+        plugins = pluginmanager.PluginManager(PluginGSU, paths=[])
+        plugins.extend([PluginGSU, PluginLogin])
+        plugins.init(None)
+
+        table = plugins.dispatch_table(
+            smcommand.SMClientCommand,
+            pluginmanager.StepmaniaPlugin,
+            forwards={smcommand.SMClientCommand.NSSMONL: smcommand.SMOClientCommand},
+        )
+
+        app, hook = table[smcommand.SMClientCommand.NSSMONL][0]
+        self.assertEqual(len(table[smcommand.SMClientCommand.NSSMONL]), 1)
+        self.assertIs(app, plugins[1])
+        self.assertEqual(hook, plugins[1].on_nssmonl)
+
+        table = plugins.dispatch_table(smcommand.SMClientCommand, pluginmanager.StepmaniaPlugin)
+        self.assertNotIn(smcommand.SMClientCommand.NSSMONL, table)
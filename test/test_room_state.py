@@ -0,0 +1,63 @@
+""" Test room state module """
+
+import datetime
+import unittest
+
+from smserver import room_state
+
+
+class RemoteRoomStatesTest(unittest.TestCase):
+    """ Test the states of the rooms published by the other workers """
+
+    def setUp(self):
+        self.states = room_state.RemoteRoomStates()
+
+    def test_update(self):
+        """ Test the last state of each worker is kept """
+
+        self.states.update("worker1", 4, room_state.WorkerRoomState(players=2, waiting=1))
+        self.states.update("worker2", 4, room_state.WorkerRoomState(players=1, waiting=1))
+        self.states.update("worker1", 4, room_state.WorkerRoomState(players=2, waiting=2))
+
+        self.assertEqual(len(self.states.states(4)), 2)
+        self.assertTrue(self.states.everybody_waiting(4))
+        self.assertEqual(self.states.states(5), ())
+
+        # A worker without player left the room
+        self.states.update("worker1", 4, room_state.WorkerRoomState())
+        self.states.update("worker2", 4, room_state.WorkerRoomState())
+        self.assertEqual(self.states.states(4), ())
+
+    def test_expired_state(self):
+        """ Test the states which are not refreshed are ignored """
+
+        state = room_state.WorkerRoomState(players=1, playing=1)
+        self.states.update("worker1", 4, state)
+        self.assertTrue(self.states.playing(4))
+
+        state.updated_at -= datetime.timedelta(seconds=10)
+        self.assertFalse(self.states.playing(4))
+        self.assertTrue(self.states.everybody_waiting(4))
+
+    def test_scores_and_wait_since(self):
+        """ Test merging the scores and the start requests of the workers """
+
+        now = datetime.datetime.now().replace(microsecond=0)
+        state1 = room_state.WorkerRoomState(
+            players=1, waiting=1, wait_since=now,
+            scores=[{"user_id": 1, "combo": 4, "grade": 2, "score": 100}],
+        )
+        state2 = room_state.WorkerRoomState(
+            players=1, playing=1,
+            scores=[{"user_id": 2, "combo": 5, "grade": 1, "score": 200}],
+        )
+
+        self.states.update("worker1", 4, room_state.WorkerRoomState.from_dict(state1.to_dict()))
+        self.states.update("worker2", 4, room_state.WorkerRoomState.from_dict(state2.to_dict()))
+
+        self.assertEqual(self.states.wait_since(4), now)
+        self.assertFalse(self.states.everybody_waiting(4))
+        self.assertEqual(
+            sorted(score["user_id"] for score in self.states.scores(4)),
+            [1, 2]
+        )
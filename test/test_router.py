@@ -6,6 +6,7 @@ from smserver.stepmania_controller import StepmaniaController
 from smserver.smutils.smpacket import smcommand
 from smserver.smutils.smpacket import smpacket
 from smserver.smutils import smconn
+from smserver import models
 from smserver import router
 from smserver import server
 
@@ -24,6 +25,12 @@ class Controller2(StepmaniaController):
 
     require_login = True
 
+class Controller3(StepmaniaController):
+    """ Controller class without session for testing purpose"""
+
+    require_login = False
+    need_session = False
+
 
 class RouterTest(utils.DBTest):
     """ Test Stepmania Server class """
@@ -90,3 +97,112 @@ class RouterTest(utils.DBTest):
         handle_controller2.assert_called_with()
         handle_controller1.reset_mock()
         handle_controller2.reset_mock()
+
+    @mock.patch("test.test_router.Controller3.handle")
+    def test_route_without_session(self, handle_controller3):
+        """ Test routing a packet to controllers which need no session """
+
+        test_router = router.Router()
+
+        serv = server.StepmaniaServer()
+        conn = smconn.StepmaniaConn(server, "8.8.8.8", 42)
+
+        command = smcommand.SMClientCommand.NSCAttack
+        packet = smpacket.SMPacket.new(command)
+
+        test_router.add_route(command, Controller3)
+        self.assertFalse(test_router.need_session(command))
+
+        with mock.patch.object(serv.db, "session_scope") as session_scope:
+            test_router.route(serv, conn, packet)
+
+        session_scope.assert_not_called()
+        handle_controller3.assert_called_with()
+
+        test_router.add_route(command, Controller1)
+        self.assertTrue(test_router.need_session(command))
+
+    def test_route_unit_of_work(self):
+        """ Test a failing controller only rollback its own changes """
+
+        test_router = router.Router()
+
+        serv = server.StepmaniaServer()
+        conn = smconn.StepmaniaConn(server, "8.8.8.8", 42)
+        ConnectionFactory(token=conn.token)
+
+        command = smcommand.SMClientCommand.NSCAttack
+        packet = smpacket.SMPacket.new(command)
+
+        class Failing(Controller1):
+            """ Controller which fail after a change """
+
+            def handle(self):
+                self.session.add(models.Room(name="failing", status=1))
+                self.session.commit()
+                raise ValueError()
+
+        class Working(Controller1):
+            """ Controller which create a room """
+
+            def handle(self):
+                self.session.add(models.Room(name="working", status=1))
+                self.session.commit()
+
+        test_router.add_route(command, Working)
+        test_router.add_route(command, Failing)
+
+        with serv.db.session_scope(unit_of_work=True) as session:
+            test_router.route(serv, conn, packet, session=session)
+
+        self.assertEqual(
+            [room.name for room in self.session.query(models.Room)],
+            ["working"]
+        )
+        self.assertLog("ERROR")
+
+    def test_route_unit_of_work_rows(self):
+        """ Test only the rows of the failing controller are rolled back """
+
+        test_router = router.Router()
+
+        serv = server.StepmaniaServer()
+        conn = smconn.StepmaniaConn(server, "8.8.8.8", 42)
+        ConnectionFactory(token=conn.token)
+
+        command = smcommand.SMClientCommand.NSCAttack
+        packet = smpacket.SMPacket.new(command)
+
+        class Failing(Controller1):
+            """ Controller which change the existing rows, then fail """
+
+            def handle(self):
+                self.session.add(models.Room(name="failing", status=1))
+                for room in self.session.query(models.Room):
+                    room.status = 2
+                self.session.commit()
+                raise ValueError()
+
+        class Working(Controller1):
+            """ Controller which create a room """
+
+            def handle(self):
+                name = "working %s" % self.session.query(models.Room).count()
+                self.session.add(models.Room(name=name, status=1))
+                self.session.commit()
+
+        test_router.add_route(command, Working)
+        test_router.add_route(command, Failing)
+        test_router.add_route(command, Working)
+
+        with serv.db.session_scope(unit_of_work=True) as session:
+            session.add(models.Room(name="before", status=1))
+            session.flush()
+
+            test_router.route(serv, conn, packet, session=session)
+
+        self.assertEqual(
+            sorted((room.name, room.status) for room in self.session.query(models.Room)),
+            [("before", 1), ("working 1", 1), ("working 2", 1)]
+        )
+        self.assertLog("ERROR")
@@ -0,0 +1,211 @@
+""" Test the asyncio protocol server connection """
+
+import unittest
+import socket
+import threading
+
+import asyncio
+import mock
+
+from smserver.smutils import smexecutor
+from smserver.smutils.smconnections import asyncprotocol
+
+class AsyncProtocolServerTest(unittest.TestCase):
+    """ Test the thread which handle asyncio protocol connections """
+
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.ip, self.port = sock.getsockname()
+        sock.close()
+
+        self.mock_server = mock.MagicMock()
+
+        self.server = asyncprotocol.AsyncProtocolServer(
+            self.mock_server, self.ip, self.port, self.loop
+        )
+
+        self.reader, self.writer = None, None
+
+    def tearDown(self):
+        self.loop.close()
+        self.mock_server.reset_mock()
+
+    def start_client(self):
+        """ Start the client """
+
+        self.reader, self.writer = self.loop.run_until_complete(
+            asyncio.open_connection(self.ip, self.port)
+        )
+        self.run_loop_once()
+
+    def send(self, data):
+        """ Send data from the client and let the server receive it """
+
+        self.writer.write(data)
+        self.loop.run_until_complete(self.writer.drain())
+        self.run_loop_once()
+        self.run_loop_once()
+
+    def run_loop_once(self):
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+    @property
+    def connection(self):
+        """ Connection added to the server """
+
+        self.mock_server.add_connection.assert_called_once()
+        return self.mock_server.add_connection.call_args[0][0]
+
+    def test_server_close_while_client_connected(self):
+        """ Try stopping the server during client connection """
+
+        self.server.start_server()
+        self.start_client()
+        connection = self.connection
+        self.server.stop_server()
+
+        self.mock_server.on_disconnect.assert_called_once_with(connection)
+        self.assertEqual(self.server.clients, set())
+
+    def test_client_disconnect(self):
+        """ Test the connection is removed when the client leave """
+
+        self.server.start_server()
+        self.start_client()
+        connection = self.connection
+
+        self.writer.close()
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+
+        self.mock_server.on_disconnect.assert_called_once_with(connection)
+        self.assertEqual(self.server.clients, set())
+        self.server.stop_server()
+
+    @mock.patch("smserver.smutils.smconnections.asyncprotocol.AsyncProtocolClient._on_data")
+    def test_valid_package(self, on_data):
+        """ Test sending data to the server """
+
+        self.server.start_server()
+        self.start_client()
+        connection = self.connection
+        self.assertEqual(connection.ip, "127.0.0.1")
+
+        on_data.side_effect = connection.send_data
+        self.send(b"\x00\x00\x00\x01\x54\x00\x00\x00\x01\x55")
+
+        data = self.loop.run_until_complete(self.reader.read(4096))
+        self.assertEqual(data, b"\x00\x00\x00\x01\x54\x00\x00\x00\x01\x55")
+
+        self.assertEqual(on_data.call_count, 2)
+        self.assertEqual(on_data.call_args_list[0][0][0], b"\x00\x00\x00\x01\x54")
+        self.assertEqual(on_data.call_args_list[1][0][0], b"\x00\x00\x00\x01\x55")
+
+        self.server.stop_server()
+
+    @mock.patch("smserver.smutils.smconnections.asyncprotocol.AsyncProtocolClient._on_data")
+    def test_split_package(self, on_data):
+        """ Test sending a packet in several parts """
+
+        self.server.start_server()
+        self.start_client()
+
+        self.send(b"\x00\x00")
+        self.send(b"\x00\x02\x54")
+        on_data.assert_not_called()
+
+        self.send(b"\x55")
+        on_data.assert_called_once_with(b"\x00\x00\x00\x02\x54\x55")
+
+        self.server.stop_server()
+
+    def test_send_from_another_thread(self):
+        """ Test sending data outside of the event loop thread """
+
+        self.server.start_server()
+        self.start_client()
+
+        thread = threading.Thread(
+            target=self.connection.send_data,
+            args=(b"\x00\x00\x00\x01\x54",)
+        )
+        thread.start()
+        thread.join()
+
+        data = self.loop.run_until_complete(self.reader.read(4096))
+        self.assertEqual(data, b"\x00\x00\x00\x01\x54")
+
+        self.server.stop_server()
+
+    def test_write_backpressure(self):
+        """ Test the client is not read while his write buffer is full """
+
+        self.server.start_server()
+        self.start_client()
+        connection = self.connection
+
+        with mock.patch.object(connection.transport, "pause_reading") as pause_reading, \
+                mock.patch.object(connection.transport, "resume_reading") as resume_reading:
+            connection.pause_writing()
+            pause_reading.assert_called_once_with()
+
+            connection.resume_writing()
+            resume_reading.assert_called_once_with()
+
+            connection.resume_writing()
+            resume_reading.assert_called_once_with()
+
+        self.server.stop_server()
+
+    @mock.patch("smserver.smutils.smconnections.asyncprotocol.AsyncProtocolClient._on_data")
+    def test_handler_executor(self, on_data):
+        """ Test the packets are handled in the executor, in order """
+
+        self.server.executor = smexecutor.OrderedExecutor(2)
+        self.addCleanup(self.server.executor.shutdown)
+
+        threads = []
+        on_data.side_effect = lambda data: threads.append(threading.get_ident())
+
+        self.server.start_server()
+        self.start_client()
+        self.send(b"\x00\x00\x00\x01\x54\x00\x00\x00\x01\x55")
+        connection = self.connection
+
+        self.writer.close()
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.server.executor.shutdown()
+
+        self.assertEqual(
+            [call[0][0] for call in on_data.call_args_list],
+            [b"\x00\x00\x00\x01\x54", b"\x00\x00\x00\x01\x55"]
+        )
+        self.assertNotIn(threading.get_ident(), threads)
+        self.mock_server.on_disconnect.assert_called_once_with(connection)
+
+        self.server.stop_server()
+
+    def test_outbound_queue_paused(self):
+        """ Test the data stay in the outbound queue while the writing is paused """
+
+        self.server.start_server()
+        self.start_client()
+        connection = self.connection
+
+        connection.pause_writing()
+        connection.queue_data(b"\x00\x00\x00\x01\x54")
+        connection.queue_data(b"\x00\x00\x00\x01\x55")
+        self.assertEqual(len(connection.outbound), 2)
+
+        connection.resume_writing()
+        self.assertEqual(len(connection.outbound), 0)
+
+        data = self.loop.run_until_complete(self.reader.read(4096))
+        self.assertEqual(data, b"\x00\x00\x00\x01\x54\x00\x00\x00\x01\x55")
+
+        self.server.stop_server()
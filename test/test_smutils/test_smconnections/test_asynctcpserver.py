@@ -113,6 +113,34 @@ class AsyncSocketServerTest(unittest.TestCase):
 
         self.stop_server()
 
+    @mock.patch("smserver.smutils.smconnections.asynctcpserver.AsyncSocketClient._on_data")
+    def test_split_package(self, on_data):
+        """ Test sending a packet in several parts """
+
+        self.start_server()
+        self.start_client()
+        self.mock_server.add_connection.assert_called_once()
+
+        self.writer.write(b"\x00\x00")
+        self.loop.run_until_complete(self.writer.drain())
+        self.run_loop_once()
+        self.run_loop_once()
+        on_data.assert_not_called()
+
+        self.writer.write(b"\x00\x02\x54")
+        self.loop.run_until_complete(self.writer.drain())
+        self.run_loop_once()
+        self.run_loop_once()
+        on_data.assert_not_called()
+
+        self.writer.write(b"\x55")
+        self.loop.run_until_complete(self.writer.drain())
+        self.run_loop_once()
+        self.run_loop_once()
+        on_data.assert_called_once_with(b"\x00\x00\x00\x02\x54\x55")
+
+        self.stop_server()
+
     @mock.patch("smserver.smutils.smconnections.asynctcpserver.AsyncSocketClient._on_data")
     def test_invalid_package(self, on_data):
         """ Test sending data to the server """
@@ -0,0 +1,112 @@
+""" Test the selector server connection """
+
+import socket
+import threading
+import time
+import unittest
+
+import mock
+
+from smserver.smutils.smconnections import selectorsocket
+from smserver.smutils.smpacket import smpacket
+
+class SelectorServerTest(unittest.TestCase):
+    """ Test the thread which handle all the connections with a selector """
+
+    def setUp(self):
+        self.mock_server = mock.MagicMock()
+        self.server = selectorsocket.SelectorServer(self.mock_server, "127.0.0.1", 0)
+        self.ip, self.port = self.server._socket.getsockname() #pylint: disable=protected-access
+        self.server.start()
+        self.wait_for(lambda: self.server.loop_thread_id)
+
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+
+        self.server.stop()
+        self.server.join(5)
+
+    def connect(self):
+        """ Open a new client connection, and return the server connection """
+
+        nb_connections = self.mock_server.add_connection.call_count
+
+        client = socket.create_connection((self.ip, self.port), timeout=5)
+        self.clients.append(client)
+
+        self.wait_for(lambda: self.mock_server.add_connection.call_count > nb_connections)
+        return client, self.mock_server.add_connection.call_args[0][0]
+
+    @staticmethod
+    def wait_for(condition, timeout=5):
+        """ Wait until the condition is true """
+
+        end = time.time() + timeout
+        while not condition():
+            if time.time() > end:
+                raise AssertionError("Timeout")
+            time.sleep(0.01)
+
+    @staticmethod
+    def recv(client, size):
+        """ Read size bytes from the client """
+
+        data = b""
+        while len(data) < size:
+            data += client.recv(size - len(data))
+        return data
+
+    def test_receive_packets(self):
+        """ Test receiving packets from several clients """
+
+        client1, conn1 = self.connect()
+        client2, conn2 = self.connect()
+        self.assertEqual(self.server.clients, set([conn1, conn2]))
+
+        client1.sendall(smpacket.SMPacketClientNSCPing().binary[:3])
+        client2.sendall(smpacket.SMPacketClientNSCPingR().binary)
+        client1.sendall(smpacket.SMPacketClientNSCPing().binary[3:])
+
+        self.wait_for(lambda: self.mock_server.on_packet.call_count == 2)
+
+        packets = {
+            call[0][0]: call[1]["packet"]
+            for call in self.mock_server.on_packet.call_args_list
+        }
+        self.assertIsInstance(packets[conn1], smpacket.SMPacketClientNSCPing)
+        self.assertIsInstance(packets[conn2], smpacket.SMPacketClientNSCPingR)
+
+    def test_send_from_another_thread(self):
+        """ Test sending packets outside of the selector thread """
+
+        client, conn = self.connect()
+        packets = [smpacket.SMPacketServerNSCCM(message="m" * 1000) for _ in range(200)]
+
+        thread = threading.Thread(target=lambda: [conn.send(packet) for packet in packets])
+        thread.start()
+        thread.join()
+
+        expected = b"".join(packet.binary for packet in packets)
+        self.assertEqual(self.recv(client, len(expected)), expected)
+
+    def test_client_disconnect(self):
+        """ Test a client closing his connection """
+
+        client, conn = self.connect()
+        client.close()
+
+        self.wait_for(lambda: self.mock_server.on_disconnect.called)
+        self.mock_server.on_disconnect.assert_called_once_with(conn)
+        self.wait_for(lambda: not self.server.clients)
+
+    def test_shutdown(self):
+        """ Test shutting down a connection close it """
+
+        client, conn = self.connect()
+        conn.shutdown()
+
+        self.wait_for(lambda: self.mock_server.on_disconnect.called)
+        self.assertEqual(client.recv(10), b"")
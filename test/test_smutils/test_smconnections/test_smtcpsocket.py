@@ -0,0 +1,146 @@
+""" Test the classic socket connection """
+
+import itertools
+import socket
+import threading
+import unittest
+
+import mock
+
+from smserver.smutils import smconn
+from smserver.smutils.smconnections import smtcpsocket
+from smserver.smutils.smpacket import smpacket
+
+class SocketConnTest(unittest.TestCase):
+    """ Test the connection of the classic server """
+
+    def setUp(self):
+        self.client_sock, server_sock = socket.socketpair()
+        self.client_sock.settimeout(5)
+        self.mock_server = mock.MagicMock()
+        self.conn = smtcpsocket.SocketConn(self.mock_server, "127.0.0.1", 42, server_sock)
+
+    def tearDown(self):
+        self.conn.close()
+        self.client_sock.close()
+
+    def test_send(self):
+        """ Test the packets are sent in order """
+
+        packets = [smpacket.SMPacketServerNSCCM(message="msg%s" % i) for i in range(20)]
+        for packet in packets:
+            self.conn.send(packet)
+
+        expected = b"".join(packet.binary for packet in packets)
+        data = b""
+        while len(data) < len(expected):
+            data += self.client_sock.recv(4096)
+
+        self.assertEqual(data, expected)
+
+    @mock.patch("smserver.smutils.smconnections.smtcpsocket.sendmsg_nonblocking")
+    def test_flush_single_writer(self, sendmsg_nonblocking):
+        """ Test the queue is drained inline, by one thread at a time """
+
+        threads = threading.active_count()
+        packet = smpacket.SMPacketServerNSCCM(message="msg")
+
+        def sendmsg(sock, datas):
+            # Another thread sending while the socket is written
+            if sendmsg_nonblocking.call_count == 1:
+                thread = threading.Thread(target=self.conn.send, args=(packet,))
+                thread.start()
+                thread.join()
+
+            return []
+
+        sendmsg_nonblocking.side_effect = sendmsg
+        self.conn.send(packet)
+
+        self.assertEqual(threading.active_count(), threads)
+        self.assertEqual(sendmsg_nonblocking.call_count, 2)
+        self.assertEqual(len(self.conn.outbound), 0)
+
+    def test_send_peer_not_reading(self):
+        """ Test sending to a client which doesn't read never blocks """
+
+        self.client_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.conn.outbound.high_water = 4 * 1024 * 1024
+
+        packet = smpacket.SMPacketServerNSCCM(message="m" * 1000)
+
+        result = []
+        def send_all():
+            for _ in range(2000):
+                self.conn.send(packet)
+            result.append(True)
+
+        thread = threading.Thread(target=send_all, daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertEqual(result, [True])
+
+        # The writer sends the rest once the client reads
+        expected = len(packet.binary) * 2000
+        size = 0
+        while size < expected:
+            size += len(self.client_sock.recv(65536))
+
+        self.assertEqual(size, expected)
+        self.assertEqual(len(self.conn.outbound), 0)
+
+    def test_received_data(self):
+        """ Test reading the packets from the socket """
+
+        self.client_sock.sendall(b"\x00\x00\x00\x01\x54\x00\x00")
+        self.client_sock.sendall(b"\x00\x01\x55")
+        self.client_sock.close()
+
+        self.assertEqual(
+            [
+                data if data is None else bytes(data)
+                for data in itertools.islice(self.conn.received_data(), 3)
+            ],
+            [b"\x00\x00\x00\x01\x54", b"\x00\x00\x00\x01\x55", None]
+        )
+
+    def test_shutdown(self):
+        """ Test shutting down the connection stop the reading """
+
+        self.conn.shutdown()
+        self.assertIsNone(next(self.conn.received_data()))
+
+    def test_sendmsg_nonblocking(self):
+        """ Test sending several buffers until the socket is full """
+
+        sock = mock.MagicMock()
+        sent = []
+
+        def sendmsg(buffers, _ancdata, _flags):
+            if len(sent) == 3:
+                raise BlockingIOError()
+
+            data = b"".join(bytes(buf) for buf in buffers)[:3]
+            sent.append(data)
+            return len(data)
+
+        sock.sendmsg.side_effect = sendmsg
+        unsent = smtcpsocket.sendmsg_nonblocking(sock, [b"abcd", b"", b"ef", b"ghijklm"])
+
+        self.assertEqual(b"".join(sent), b"abcdefghi")
+        self.assertEqual([bytes(buf) for buf in unsent], [b"jklm"])
+
+    @mock.patch("smserver.smutils.smconnections.smtcpsocket.sendmsg_nonblocking")
+    def test_send_batch(self, sendmsg_nonblocking):
+        """ Test the packets of a batch are given to a single sendmsg """
+
+        packets = [smpacket.SMPacketServerNSCCM(message="msg%s" % i) for i in range(3)]
+        sendmsg_nonblocking.return_value = []
+
+        with smconn.send_batch():
+            for packet in packets:
+                self.conn.send(packet)
+
+        sendmsg_nonblocking.assert_called_once_with(
+            self.conn._conn, [packet.binary for packet in packets] #pylint: disable=protected-access
+        )
@@ -0,0 +1,86 @@
+""" Test the UDP server """
+
+import socket
+import threading
+import unittest
+
+import mock
+
+from smserver.smutils.smconnections import udpsocket
+from smserver.smutils.smpacket import smpacket
+
+class UDPServerTest(unittest.TestCase):
+    """ Test the UDP server used for the discovery """
+
+    def setUp(self):
+        self.mock_server = mock.MagicMock()
+        self.mock_server.on_packet.side_effect = self.reply
+
+        self.server = udpsocket.UDPServer(self.mock_server, "127.0.0.1", 0)
+        self.address = self.server._socket.getsockname() #pylint: disable=protected-access
+
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client.settimeout(5)
+
+    def tearDown(self):
+        self.client.close()
+        if self.server.is_alive():
+            self.server.stop()
+            self.server.join(5)
+
+    @staticmethod
+    def reply(conn, packet): #pylint: disable=unused-argument
+        """ Answer to the discovery request """
+
+        conn.send(smpacket.SMPacketServerNSCFormatted(
+            server_name="test",
+            server_port=8765,
+            nb_players=0,
+        ))
+
+    def test_reply_from_server_socket(self):
+        """ Test the datagrams are handled without new thread, and answered by the server socket """
+
+        self.server.start()
+        nb_threads = threading.active_count()
+
+        for _ in range(10):
+            self.client.sendto(smpacket.SMPacketClientNSCFormatted().binary, self.address)
+
+        for _ in range(10):
+            data, addr = self.client.recvfrom(8192)
+            self.assertEqual(addr, self.address)
+            self.assertEqual(smpacket.SMPacket.parse_binary(data)["server_name"], "test")
+
+        self.assertEqual(threading.active_count(), nb_threads)
+        self.assertEqual(self.mock_server.on_packet.call_count, 10)
+
+    def test_ignore_other_packets(self):
+        """ Test only the discovery packets are handled """
+
+        self.server.start()
+        self.client.sendto(smpacket.SMPacketClientNSCPing().binary, self.address)
+        self.client.sendto(smpacket.SMPacketClientNSCFormatted().binary, self.address)
+
+        self.client.recvfrom(8192)
+        self.assertEqual(self.mock_server.on_packet.call_count, 1)
+
+    def test_max_pending(self):
+        """ Test the datagrams are dropped when too many wait in the executor """
+
+        self.server.executor = mock.MagicMock()
+
+        for _ in range(self.server.MAX_PENDING + 10):
+            self.server.handle(udpsocket.SocketConn(
+                self.mock_server, "127.0.0.1", 42, b"", self.client
+            ))
+
+        self.assertEqual(self.server.executor.submit.call_count, self.server.MAX_PENDING)
+
+        func, conn = self.server.executor.submit.call_args[0][1:]
+        func(conn)
+
+        self.server.handle(udpsocket.SocketConn(
+            self.mock_server, "127.0.0.1", 42, b"", self.client
+        ))
+        self.assertEqual(self.server.executor.submit.call_count, self.server.MAX_PENDING + 1)
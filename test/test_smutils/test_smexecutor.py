@@ -0,0 +1,90 @@
+""" Test smexecutor module """
+
+import threading
+import time
+import unittest
+
+import mock
+
+from smserver.smutils import smexecutor
+
+
+class OrderedExecutorTest(unittest.TestCase):
+    """ Test smexecutor.OrderedExecutor class """
+
+    def setUp(self):
+        self.executor = smexecutor.OrderedExecutor(4)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_order_by_key(self):
+        """ Test the tasks of a key are run in order """
+
+        results = {key: [] for key in range(10)}
+
+        def task(key, value):
+            time.sleep(0.0001 * (value % 3))
+            results[key].append(value)
+
+        for value in range(100):
+            for key in results:
+                self.executor.submit(key, task, key, value)
+
+        self.executor.shutdown()
+
+        for key in results:
+            self.assertEqual(results[key], list(range(100)))
+
+    def test_keys_in_parallel(self):
+        """ Test a blocked key does not block the other keys """
+
+        event = threading.Event()
+        done = threading.Event()
+
+        self.executor.submit("slow", event.wait, 5)
+        self.executor.submit("fast", done.set)
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(self.executor.pending("slow"), 0)
+        event.set()
+
+    def test_exception(self):
+        """ Test an error does not stop the other tasks of the key """
+
+        res = []
+        with mock.patch.object(self.executor.log, "exception") as log_exception:
+            self.executor.submit("token", lambda: 1 / 0)
+            self.executor.submit("token", res.append, 1)
+            self.executor.shutdown()
+
+        log_exception.assert_called_once()
+        self.assertEqual(res, [1])
+
+    def test_submit_after_shutdown(self):
+        """ Test no task is accepted once the executor is stopped """
+
+        self.executor.shutdown()
+        with self.assertRaises(RuntimeError):
+            self.executor.submit("token", print)
+
+    def test_stats(self):
+        """ Test the queue depth metrics """
+
+        started = threading.Event()
+        event = threading.Event()
+
+        self.executor.submit("room", lambda: started.set() or event.wait(5))
+        self.assertTrue(started.wait(5))
+        for _ in range(3):
+            self.executor.submit("room", time.time)
+
+        stats = self.executor.stats
+        self.assertEqual(stats["tasks"], 4)
+        self.assertEqual(stats["pending"], 3)
+        self.assertEqual(stats["max_pending"], 3)
+
+        event.set()
+        self.executor.shutdown()
+        self.assertEqual(self.executor.stats["pending"], 0)
+        self.assertEqual(self.executor.stats["queues"], 0)
@@ -0,0 +1,94 @@
+""" Test smframer module """
+
+import random
+import unittest
+
+from smserver.smutils import smframer
+
+
+def frame(payload):
+    """ Frame with the header of the given payload """
+
+    return len(payload).to_bytes(4, byteorder="big") + payload
+
+
+class SMFramerTest(unittest.TestCase):
+    """ Test smframer.SMFramer class """
+
+    def test_frames_in_one_chunk(self):
+        """ Test several frames received at once """
+
+        framer = smframer.SMFramer()
+        frames = list(framer.feed(frame(b"\x54") + frame(b"\x55\x56") + frame(b"")))
+
+        self.assertEqual(
+            [bytes(data) for data in frames],
+            [frame(b"\x54"), frame(b"\x55\x56"), frame(b"")]
+        )
+        self.assertIsInstance(frames[0], memoryview)
+        self.assertEqual(len(framer), 0)
+
+    def test_split_header(self):
+        """ Test a frame received byte by byte """
+
+        framer = smframer.SMFramer()
+        data = frame(b"hello")
+
+        for byte in data[:-1]:
+            self.assertEqual(list(framer.feed(bytes([byte]))), [])
+
+        self.assertEqual(len(framer), len(data) - 1)
+        self.assertEqual(
+            [bytes(data) for data in framer.feed(data[-1:])],
+            [data]
+        )
+        self.assertEqual(len(framer), 0)
+
+    def test_frame_still_referenced(self):
+        """ Test the frames stay valid after receiving new data """
+
+        framer = smframer.SMFramer()
+
+        stream = frame(b"first") + frame(b"second") + frame(b"third")
+
+        frames = list(framer.feed(stream[:12]))
+        frames.extend(framer.feed(stream[12:21]))
+        frames.extend(framer.feed(stream[21:]))
+
+        self.assertEqual(
+            [bytes(data) for data in frames],
+            [frame(b"first"), frame(b"second"), frame(b"third")]
+        )
+
+    def test_max_frame_size(self):
+        """ Test a frame bigger than the maximum size """
+
+        framer = smframer.SMFramer(max_frame_size=10)
+
+        self.assertEqual(len(list(framer.feed(frame(b"x" * 10)))), 1)
+
+        with self.assertRaises(smframer.FrameTooLarge):
+            list(framer.feed(frame(b"x" * 11)[:4]))
+
+    def test_fuzz_split(self):
+        """ Test frames received with random split """
+
+        rand = random.Random(42)
+
+        for _ in range(50):
+            payloads = [
+                bytes(rand.randrange(256) for _ in range(rand.randrange(50)))
+                for _ in range(rand.randrange(1, 20))
+            ]
+            stream = b"".join(frame(payload) for payload in payloads)
+
+            framer = smframer.SMFramer()
+            frames = []
+            offset = 0
+            while offset < len(stream):
+                size = rand.randrange(1, 40)
+                frames.extend(bytes(data) for data in framer.feed(stream[offset:offset + size]))
+                offset += size
+
+            self.assertEqual(frames, [frame(payload) for payload in payloads])
+            self.assertEqual(len(framer), 0)
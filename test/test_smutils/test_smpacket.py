@@ -2,6 +2,8 @@
 
 import unittest
 
+import mock
+
 from smserver.smutils.smpacket import smpacket
 from smserver.smutils.smpacket import smcommand
 from smserver.smutils.smpacket import smencoder
@@ -206,3 +208,183 @@ class SMPacketTest(unittest.TestCase):
             packet.binary,
             smpacket.SMPacket.from_("json", packet.to_("json")).binary
         )
+
+    def test_binary_codec(self):
+        """ Test the compiled codec give the same result than the BinaryEncoder """
+
+        values = [
+            (smcommand.SMClientCommand.NSCGSU, dict(
+                player_id=1, step_id=8, grade=3, score=123456, combo=70000, health=20, offset=-0)),
+            (smcommand.SMClientCommand.NSCGSR, dict(
+                first_player_feet=20, second_player_feet=3, song_title="title")),
+            (smcommand.SMServerCommand.NSCGON, dict(
+                nb_players=2, ids=[5, 2], score=[1550, 1786], options=["opt1", "opt2"])),
+            (smcommand.SMServerCommand.NSCGSU, dict(section=1, nb_players=3, options=[1, 3, 5])),
+            (smcommand.SMServerCommand.NSCCUUL, dict(
+                max_players=255, nb_players=3, players=[{"status": 5, "name": "machin"}])),
+        ]
+
+        for command, opts in values:
+            cls = smpacket.SMPacket.get_class(command)
+            binary = smencoder.BinaryEncoder.encode(
+                dict((k, list(v) if isinstance(v, list) else v) for k, v in opts.items()),
+                cls._payload #pylint: disable=protected-access
+            )
+
+            codec = cls._binary_codec #pylint: disable=protected-access
+            self.assertEqual(codec.encode(opts), binary)
+            self.assertEqual(
+                codec.decode(binary + b"remaining"),
+                smencoder.BinaryEncoder.decode(binary + b"remaining", cls._payload) #pylint: disable=protected-access
+            )
+
+    def test_decode_from_buffer(self):
+        """ Test decoding a packet from a memoryview or a bytearray """
+
+        packet = smpacket.SMPacket.new(
+            smcommand.SMServerCommand.NSCCUUL,
+            max_players=255,
+            nb_players=200,
+            players=[{"status": i % 3, "name": "user%s" % i} for i in range(200)]
+        )
+
+        binary = b"garbage" + packet.binary
+        cls = smpacket.SMPacketServerNSCCUUL
+
+        for buffer in (memoryview(binary), bytearray(binary)):
+            self.assertEqual(
+                smpacket.SMPacket.parse_binary(buffer[7:]).binary,
+                packet.binary
+            )
+
+            offset, opts = cls._binary_codec.decode_from(buffer, 12) #pylint: disable=protected-access
+            self.assertEqual(offset, len(binary))
+            self.assertEqual(opts["players"][199], {"status": 1, "name": "user199"})
+
+            self.assertEqual(
+                smencoder.BinaryEncoder.decode_from(buffer, 12, cls._payload), #pylint: disable=protected-access
+                (offset, opts)
+            )
+
+    def test_binary_encoded_once(self):
+        """ Test the binary packet encode his payload only once """
+
+        packet = smpacket.SMPacket.new(smcommand.SMServerCommand.NSCCM, message="msg")
+
+        with mock.patch.object(
+                packet, "_binary_codec",
+                wraps=packet._binary_codec) as codec: #pylint: disable=protected-access
+            self.assertEqual(packet.binary, b'\x00\x00\x00\x05\x87msg\x00')
+
+        self.assertEqual(codec.encode_into.call_count, 1)
+
+    def test_binary_codec_record_list(self):
+        """ Test encoding a list of fixed width records """
+
+        payload_option = [
+            (smencoder.SMPayloadType.INT, "nb", 2),
+            (smencoder.SMPayloadType.LIST, "records", ("nb", [
+                (smencoder.SMPayloadType.MSN, "grade", None),
+                (smencoder.SMPayloadType.LSN, "stepid", None),
+                (smencoder.SMPayloadType.INT, "score", 4),
+            ])),
+        ]
+
+        codec = smencoder.BinaryCodec(payload_option)
+        values = {
+            "nb": 4,
+            "records": [{"grade": 18, "stepid": 3, "score": 7}, {"score": 2**40}, {}],
+        }
+
+        binary = codec.encode(values)
+        self.assertEqual(binary, smencoder.BinaryEncoder.encode(values, payload_option))
+        self.assertEqual(
+            binary,
+            b'\x00\x04\xf3\x00\x00\x00\x07\x00\xff\xff\xff\xff' + b'\x00' * 10
+        )
+
+        self.assertEqual(
+            codec.decode(binary),
+            smencoder.BinaryEncoder.decode(binary, payload_option)
+        )
+
+        # Truncated payload
+        self.assertEqual(
+            codec.decode(binary[:-3]),
+            smencoder.BinaryEncoder.decode(binary[:-3], payload_option)
+        )
+
+    def test_command_lookup(self):
+        """ Test finding a command from his value """
+
+        self.assertIs(smcommand.SMCommand.get(5), smcommand.SMClientCommand.NSCGSU)
+        self.assertIs(smcommand.SMCommand.get(133), smcommand.SMServerCommand.NSCGSU)
+        self.assertIs(smcommand.SMOCommand.get(0), smcommand.SMOClientCommand.LOGIN)
+        self.assertIs(smcommand.SMOServerCommand.get(0), smcommand.SMOServerCommand.LOGIN)
+        self.assertIs(smcommand.SMClientCommand.get(5), smcommand.SMClientCommand.NSCGSU)
+
+        for value in (-1, 50, 256, 5000, "5", None, [5]):
+            self.assertIsNone(smcommand.SMCommand.get(value))
+
+        self.assertEqual(smcommand.SMCommand.get(50, "default"), "default")
+
+        class TestCommand(smcommand.ParentCommand):
+            """ New family of command """
+            pass
+
+        self.assertIsNone(TestCommand.get(3))
+
+        class TestClientCommand(TestCommand):
+            """ Command declared after the first lookup """
+
+            TEST = 3
+            OTHER = "other"
+
+        self.assertIs(TestCommand.get(3), TestClientCommand.TEST)
+        self.assertIs(TestCommand.get("other"), TestClientCommand.OTHER)
+
+    def test_parse_json(self):
+        """ Test parsing a JSON packet only load the data once """
+
+        packet = smpacket.SMPacket.new(
+            smcommand.SMServerCommand.NSCCM,
+            message="msg",
+        )
+
+        with mock.patch.object(smencoder.JSONBackend, "loads", wraps=smencoder.JSONBackend.loads) as loads:
+            json_parse = smpacket.SMPacket.from_("json", packet.json)
+
+        self.assertEqual(loads.call_count, 1)
+        self.assertEqual(json_parse.command, smcommand.SMServerCommand.NSCCM)
+        self.assertEqual(json_parse["message"], "msg")
+
+        for data in ('not json', '[1, 2]', '{"_command": 50}', '{}'):
+            self.assertIsNone(smpacket.SMPacket.from_("json", data))
+
+    def test_json_backend(self):
+        """ Test selecting the JSON library """
+
+        self.addCleanup(smencoder.JSONBackend.use, "json")
+
+        fake_ujson = mock.MagicMock()
+        fake_ujson.dumps.return_value = '{"_command":128}'
+
+        with mock.patch.dict("sys.modules", {"orjson": None, "ujson": fake_ujson}):
+            self.assertEqual(smencoder.JSONBackend.use("auto"), "ujson")
+            self.assertEqual(smencoder.JSONBackend.use("ujson"), "ujson")
+
+            packet = smpacket.SMPacket.new(smcommand.SMServerCommand.NSCPing)
+            self.assertEqual(packet.json, '{"_command":128}')
+            fake_ujson.dumps.assert_called_with({"_command": 128}, escape_forward_slashes=False)
+
+        with mock.patch.dict("sys.modules", {"orjson": None, "ujson": None}):
+            self.assertEqual(smencoder.JSONBackend.use("auto"), "json")
+            with self.assertRaises(ImportError):
+                smencoder.JSONBackend.use("orjson")
+
+        with self.assertRaises(ValueError):
+            smencoder.JSONBackend.use("pickle")
+
+        self.assertEqual(smencoder.JSONBackend.use("json"), "json")
+        packet = smpacket.SMPacket.new(smcommand.SMServerCommand.NSCPing)
+        self.assertEqual(packet.json, '{"_command": 128}')
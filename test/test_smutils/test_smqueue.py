@@ -0,0 +1,99 @@
+""" Test smqueue module """
+
+import unittest
+
+from smserver.smutils import smqueue
+
+
+class OutboundQueueTest(unittest.TestCase):
+    """ Test smqueue.OutboundQueue class """
+
+    def test_fifo(self):
+        """ Test the data are sent in order """
+
+        queue = smqueue.OutboundQueue(high_water=100)
+        queue.put(b"first")
+        queue.put(b"second", droppable=True)
+        queue.put(b"third")
+
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(queue.size, 16)
+        self.assertEqual(queue.pop(), b"first")
+        self.assertEqual(queue.pop_all(), [b"second", b"third"])
+        self.assertIsNone(queue.pop())
+        self.assertEqual(queue.size, 0)
+        self.assertEqual(queue.max_size, 16)
+
+    def test_drop_updates(self):
+        """ Test the oldest updates are dropped first """
+
+        queue = smqueue.OutboundQueue(high_water=20, policy="drop_updates")
+
+        for i in range(5):
+            queue.put(("update%s" % i).encode(), droppable=True)
+        queue.put(b"chat")
+
+        self.assertEqual(queue.pop_all(), [b"update3", b"update4", b"chat"])
+        self.assertEqual(queue.stats, {
+            "size": 0,
+            "packets": 0,
+            "max_size": 18,
+            "dropped_packets": 3,
+            "dropped_bytes": 21,
+        })
+
+        queue.put(b"x" * 15)
+        with self.assertRaises(smqueue.SlowConsumer):
+            queue.put(b"x" * 15)
+
+        self.assertEqual(queue.pop_all(), [b"x" * 15])
+
+    def test_slow_consumer_dropped_update(self):
+        """ Test the queued data are kept when the new update is already dropped """
+
+        queue = smqueue.OutboundQueue(high_water=20, policy="drop_updates")
+        queue.put(b"x" * 15)
+
+        queue.high_water = 10
+        with self.assertRaises(smqueue.SlowConsumer):
+            queue.put(b"update", droppable=True)
+
+        self.assertEqual(queue.size, 15)
+        self.assertEqual(queue.pop_all(), [b"x" * 15])
+        self.assertEqual(queue.dropped_packets, 1)
+
+    def test_drop_groups(self):
+        """ Test the data of a group are dropped together """
+
+        queue = smqueue.OutboundQueue(high_water=20, policy="drop_updates")
+        queue.put(b"a0", droppable="a")
+        queue.put(b"a1", droppable="a")
+        queue.put(b"b0", droppable="b")
+        self.assertEqual(queue.pop(), b"a0")
+
+        # a is partially sent, b is dropped, and the rest of b too
+        queue.put(b"x" * 16)
+        queue.put(b"b1", droppable="b")
+        queue.put(b"c0", droppable="c")
+
+        self.assertEqual(queue.pop_all(), [b"a1", b"x" * 16, b"c0"])
+        self.assertEqual(queue.dropped_packets, 2)
+
+    def test_disconnect(self):
+        """ Test the disconnect policy never drop data """
+
+        queue = smqueue.OutboundQueue(high_water=20, policy="disconnect")
+
+        queue.put(b"update1", droppable=True)
+        queue.put(b"update2", droppable=True)
+        with self.assertRaises(smqueue.SlowConsumer):
+            queue.put(b"update3", droppable=True)
+
+        self.assertEqual(queue.pop_all(), [b"update1", b"update2"])
+        self.assertEqual(queue.dropped_packets, 0)
+
+    def test_invalid_policy(self):
+        """ Test an unknown policy """
+
+        with self.assertRaises(ValueError):
+            smqueue.OutboundQueue(policy="ignore")
@@ -1,10 +1,14 @@
 """ Test SMThread module """
 
+import datetime
+import threading
 import unittest
 import mock
 
 from smserver.smutils import smconn
+from smserver.smutils import smgamestate
 from smserver.smutils import smthread
+from smserver.smutils.smpacket import smpacket
 
 
 class BaseStepmaniaServerTest(unittest.TestCase):
@@ -24,6 +28,29 @@ class BaseStepmaniaServerTest(unittest.TestCase):
         self.conn1 = smconn.StepmaniaConn(self.server, "8.8.8.8", 42)
         self.conn2 = smconn.StepmaniaConn(self.server, "8.8.8.9", 42)
 
+    def test_bind_socket(self):
+        """ test several servers can bind the same port with reuse_port """
+
+        sock = smconn.SMThread(self.server, "127.0.0.1", 0).bind_socket()
+        self.addCleanup(sock.close)
+        sock.listen()
+        port = sock.getsockname()[1]
+
+        with self.assertRaises(OSError):
+            smconn.SMThread(self.server, "127.0.0.1", port).bind_socket().close()
+
+        with mock.patch.object(smconn.SMThread, "reuse_port", True):
+            sock1 = smconn.SMThread(self.server, "127.0.0.1", 0).bind_socket()
+            self.addCleanup(sock1.close)
+            sock1.listen()
+            port = sock1.getsockname()[1]
+
+            sock2 = smconn.SMThread(self.server, "127.0.0.1", port).bind_socket()
+            self.addCleanup(sock2.close)
+            sock2.listen()
+
+            self.assertEqual(sock2.getsockname()[1], port)
+
     @mock.patch("threading.Thread.is_alive")
     def test_isalive(self, is_alive):
         """ test is_alive function """
@@ -103,6 +130,97 @@ class BaseStepmaniaServerTest(unittest.TestCase):
         self.server.del_from_room(self.conn1.token, 5)
         self.assertEqual(self.conn1.room, None)
 
+    def test_on_disconnect(self):
+        """ test a disconnected connection leave his room """
+
+        self.server.add_connection(self.conn1)
+        self.server.add_connection(self.conn2)
+        self.server.add_to_room(self.conn1.token, 5)
+        self.server.add_to_room(self.conn2.token, 5)
+
+        self.server.on_disconnect(self.conn1)
+        self.assertEqual(self.server.room_connections(5), (self.conn2,))
+        self.assertEqual(self.server.connections, (self.conn2,))
+
+        self.server.on_disconnect(self.conn2)
+        self.assertFalse(self.server.has_room(5))
+        self.assertEqual(self.server.connections, ())
+
+    def test_room_snapshot(self):
+        """ test the changes of a room does not modify the current snapshots """
+
+        self.server.add_connection(self.conn1)
+        self.server.add_connection(self.conn2)
+        self.server.add_to_room(self.conn1.token, 5)
+
+        members = self.server.room_connections(5)
+        connections = self.server.connections
+
+        self.server.add_to_room(self.conn2.token, 5)
+        self.server.del_from_room(self.conn1.token, 5)
+        self.server.on_disconnect(self.conn2)
+
+        self.assertEqual(members, (self.conn1,))
+        self.assertEqual(connections, (self.conn1, self.conn2))
+        self.assertEqual(self.server.room_connections(5), ())
+
+    def test_room_indexes(self):
+        """ test the indexes of a room follow the state of the connections """
+
+        self.server.add_connection(self.conn1)
+        self.server.add_connection(self.conn2)
+        self.conn2.spectate = True
+        self.server.add_to_room(self.conn1.token, 5)
+        self.server.add_to_room(self.conn2.token, 5)
+
+        self.assertEqual(self.server.player_connections(5), (self.conn1,))
+        self.assertEqual(self.server.indexed_connections("spectators", 5), (self.conn2,))
+        self.assertEqual(self.server.ingame_connections(5), ())
+        self.assertEqual(self.server.indexed_rooms("waiting"), ())
+
+        self.conn1.wait_start = True
+        self.conn1.songstats = smgamestate.GameState(start_at=datetime.datetime.now())
+        self.assertEqual(self.server.indexed_rooms("waiting"), (5,))
+        self.assertEqual(self.server.ingame_connections(5), (self.conn1,))
+
+        self.conn1.wait_start = False
+        self.conn1.ingame = True
+        self.conn2.spectate = False
+        self.assertEqual(self.server.indexed_rooms("waiting"), ())
+        self.assertEqual(self.server.indexed_connections("playing", 5), (self.conn1,))
+        self.assertEqual(self.server.player_connections(5), (self.conn1, self.conn2))
+        self.assertEqual(self.server.indexed_connections("spectators", 5), ())
+
+        self.server.del_from_room(self.conn1.token)
+        self.assertEqual(self.server.indexed_connections("playing", 5), ())
+        self.assertEqual(self.server.ingame_connections(5), ())
+        self.assertEqual(self.server.player_connections(5), (self.conn2,))
+
+        # Out of a room, the state does not change the indexes
+        self.conn1.ingame = True
+        self.assertEqual(self.server.indexed_connections("playing", 5), ())
+
+    def test_send_without_lock(self):
+        """ test a connection can change the registry while a packet is broadcast """
+
+        self.server.add_connection(self.conn1)
+        self.server.add_connection(self.conn2)
+        self.server.add_to_room(self.conn1.token, 5)
+        self.server.add_to_room(self.conn2.token, 5)
+
+        sent = []
+
+        def disconnect(conn, _packet):
+            """ Disconnect while the room is being iterated """
+            sent.append(conn)
+            self.server.on_disconnect(self.conn1)
+
+        with mock.patch.object(smconn.StepmaniaConn, "send", autospec=True, side_effect=disconnect):
+            self.server.sendroom(5, smpacket.SMPacketServerNSCPing())
+
+        self.assertEqual(sent, [self.conn1, self.conn2])
+        self.assertEqual(self.server.room_connections(5), (self.conn2,))
+
     @mock.patch("smserver.smutils.smconn.StepmaniaConn.send")
     def test_sendall(self, conn_send):
         """ test sending a packet to all conections """
@@ -112,3 +230,199 @@ class BaseStepmaniaServerTest(unittest.TestCase):
 
         self.server.sendall("aaaa")
         self.assertEqual(conn_send.call_count, 2)
+
+    @mock.patch("smserver.smutils.smconn.datetime")
+    @mock.patch("smserver.smutils.smconn.StepmaniaConn.send_data")
+    def test_sendall_chat_timestamp(self, send_data, mock_datetime):
+        """ test the packet is encoded once, and timestamp only for the right connection """
+
+        mock_datetime.datetime.now.return_value = datetime.datetime(2017, 1, 1, 12, 30)
+
+        conn3 = smconn.StepmaniaConn(self.server, "8.8.8.10", 42)
+        self.conn2.chat_timestamp = True
+        conn3.chat_timestamp = True
+
+        self.server.add_connection(self.conn1)
+        self.server.add_connection(self.conn2)
+        self.server.add_connection(conn3)
+
+        packet = smpacket.SMPacketServerNSCCM(message="msg")
+        self.server.sendall(packet)
+
+        self.assertEqual(packet["message"], "msg")
+        self.assertEqual(send_data.call_count, 3)
+
+        sent = [call[0][0] for call in send_data.call_args_list]
+        self.assertIs(sent[0], packet.to_("binary"))
+        self.assertIs(sent[1], sent[2])
+        self.assertEqual(
+            smpacket.SMPacket.parse_binary(sent[1])["message"],
+            "[%s] msg" % datetime.datetime(2017, 1, 1, 12, 30).strftime("%X")
+        )
+
+    @mock.patch("smserver.smutils.smconn.StepmaniaConn.shutdown")
+    @mock.patch("smserver.smutils.smconn.StepmaniaConn.flush")
+    def test_slow_consumer(self, flush, shutdown):
+        """ test a connection which does not read his data """
+
+        self.conn1.outbound.high_water = 100
+        self.server.add_connection(self.conn1)
+        self.server.add_connection(self.conn2)
+
+        for _ in range(50):
+            self.server.sendall(smpacket.SMPacketServerNSCGSU(section=0, nb_players=2, options=[1, 2]))
+
+        self.assertEqual(flush.call_count, 100)
+        self.assertLessEqual(self.conn1.outbound.size, 100)
+        self.assertGreater(self.conn1.outbound.dropped_packets, 0)
+        shutdown.assert_not_called()
+
+        stats = self.server.outbound_stats()
+        self.assertEqual(stats["dropped_packets"], self.conn1.outbound.dropped_packets)
+        self.assertEqual(stats["size"], self.conn1.outbound.size + self.conn2.outbound.size)
+
+        self.server.sendall(smpacket.SMPacketServerNSCCM(message="m" * 100))
+        shutdown.assert_called_once_with()
+        self.assertEqual(self.conn1.outbound.size, 0)
+
+    @mock.patch("smserver.smutils.smconn.StepmaniaConn.flush")
+    def test_slow_consumer_scoreboard(self, flush):
+        """ test the sections of a scoreboard are dropped together """
+
+        self.conn1.outbound.high_water = 100
+
+        for _ in range(5):
+            for section in range(3):
+                self.conn1.send(smpacket.SMPacketServerNSCGSU(
+                    section=section, nb_players=2, options=[1, 2]
+                ))
+
+        sections = [
+            smpacket.SMPacket.parse_binary(data)["section"]
+            for data in self.conn1.outbound.pop_all()
+        ]
+        self.assertEqual(flush.call_count, 15)
+        self.assertGreater(self.conn1.outbound.dropped_packets, 0)
+        self.assertEqual(sections, [0, 1, 2] * (len(sections) // 3))
+
+    @mock.patch("smserver.smutils.smconn.StepmaniaConn.send_data")
+    def test_send_batch(self, send_data):
+        """ test the packets sent in a batch are coalesced by connection """
+
+        self.server.add_connection(self.conn1)
+        self.server.add_connection(self.conn2)
+
+        packet1 = smpacket.SMPacketServerNSCCM(message="msg1")
+        packet2 = smpacket.SMPacketServerNSCCM(message="msg2")
+
+        with smconn.send_batch():
+            self.server.sendall(packet1)
+            with smconn.send_batch():
+                self.server.sendconnection(self.conn1.token, packet2)
+
+            send_data.assert_not_called()
+
+        self.assertEqual(send_data.call_count, 2)
+        self.assertEqual(
+            sorted(call[0][0] for call in send_data.call_args_list),
+            sorted([packet1.binary + packet2.binary, packet1.binary])
+        )
+
+        send_data.reset_mock()
+        self.server.sendall(packet1)
+        self.assertEqual(send_data.call_count, 2)
+
+    @mock.patch("smserver.smutils.smthread.StepmaniaServer.publish")
+    @mock.patch("smserver.smutils.smconn.StepmaniaConn.send")
+    def test_publish(self, conn_send, publish):
+        """ test the packets are published to the other processes """
+
+        self.server.add_connection(self.conn1)
+        self.server.add_to_room(self.conn1.token, 5)
+
+        packet = smpacket.SMPacketServerNSCCM(message="msg")
+
+        self.server.sendroom(5, packet)
+        conn_send.assert_called_once_with(packet)
+        publish.assert_called_once_with("room", 5, packet)
+
+        publish.reset_mock()
+        self.server.sendall(packet)
+        publish.assert_called_once_with("all", None, packet)
+
+        publish.reset_mock()
+        self.server.sendconnection(self.conn1.token, packet)
+        self.server.sendplayers(5, packet, local=True)
+        self.server.sendingame(5, packet, local=True)
+        publish.assert_not_called()
+
+        self.server.sendconnection("unknown", packet)
+        publish.assert_called_once_with("token", "unknown", packet)
+
+    def test_dispatch_shard(self):
+        """ test the packets are handled in the queue of the room """
+
+        executor = mock.MagicMock()
+        self.conn1.executor = executor
+        self.server.add_connection(self.conn1)
+
+        self.conn1._dispatch_data(b"data1") #pylint: disable=protected-access
+        self.assertEqual(executor.submit.call_args[0][0], self.conn1.token)
+        first_call = executor.submit.call_args[0][1:]
+
+        # The previous packet is not handled yet, stay in the same queue
+        self.server.add_to_room(self.conn1.token, 5)
+        self.conn1._dispatch_data(b"data2") #pylint: disable=protected-access
+        self.assertEqual(executor.submit.call_args[0][0], self.conn1.token)
+        second_call = executor.submit.call_args[0][1:]
+
+        with mock.patch.object(smconn.StepmaniaConn, "_on_data"):
+            first_call[0](*first_call[1:])
+            second_call[0](*second_call[1:])
+
+        self.conn1._dispatch_data(b"data3") #pylint: disable=protected-access
+        self.assertEqual(executor.submit.call_args[0][0], ("room", 5))
+
+    @mock.patch("smserver.smutils.smconn.StepmaniaConn.shutdown")
+    def test_dispatch_backpressure(self, shutdown):
+        """ test the packets above the limit are dropped """
+
+        executor = mock.MagicMock()
+        self.conn1.executor = executor
+
+        with mock.patch.object(smconn.StepmaniaConn, "HANDLER_HIGH_WATER", 2):
+            for data in (b"data1", b"data2", b"data3"):
+                self.conn1._dispatch_data(data) #pylint: disable=protected-access
+
+            self.assertEqual(executor.submit.call_count, 2)
+            self.assertEqual(self.conn1.dropped_packets, 1)
+
+            self.server.handler_executor = mock.MagicMock(stats={"pending": 2})
+            self.server.add_connection(self.conn1)
+            self.assertEqual(self.server.handler_stats(), {"pending": 2, "dropped_packets": 1})
+
+            with mock.patch.object(smconn.StepmaniaConn, "HANDLER_POLICY", "disconnect"):
+                self.conn1._dispatch_data(b"data4") #pylint: disable=protected-access
+
+        shutdown.assert_called_once_with()
+        self.assertEqual(executor.submit.call_count, 2)
+
+    def test_dispatch_dropped_threads(self):
+        """ test the packets dropped by several threads are all counted """
+
+        self.conn1.executor = mock.MagicMock()
+        self.conn1._in_flight = 2 #pylint: disable=protected-access
+
+        def receive():
+            for _ in range(500):
+                self.conn1._dispatch_data(b"data") #pylint: disable=protected-access
+
+        with mock.patch.object(smconn.StepmaniaConn, "HANDLER_HIGH_WATER", 2):
+            threads = [threading.Thread(target=receive) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.conn1.executor.submit.assert_not_called()
+        self.assertEqual(self.conn1.dropped_packets, 4000)